@@ -0,0 +1,125 @@
+"""
+Latency-driven (AIMD) concurrency limits for upstream calls
+"""
+
+import time
+from typing import Dict, Mapping, Optional
+
+from priority import DEFAULT_LANE, LaneConfig, LaneScheduler, single_lane
+
+
+class AdaptiveLimiter:
+    """Caps in-flight calls at a limit that follows the observed latency
+
+    Additive increase, multiplicative decrease: while the smoothed latency
+    stays within ``tolerance`` times the no-load latency and the limit is
+    actually in use, it grows by one per ``limit`` successful calls. A
+    failed call, or latency climbing past the tolerance, multiplies it by
+    ``backoff`` - at most once per round trip, so one slow burst does not
+    collapse it to the minimum.
+
+    The no-load latency is the lowest smoothed latency, so single fast
+    outliers do not set it. It follows the smoothed latency down at once
+    but rises by at most ``baseline_drift`` (a fraction) per second, so a
+    long busy stretch does not pass itself off as the new normal. A call
+    that ran alone is a no-load sample by definition and resets it, which
+    is how the limit recovers after the upstream itself got slower.
+
+    Cancelled calls (a caller that lost interest) are not counted either way.
+    Waiters are queued in the priority ``lanes`` given, which share the
+    limit by weight (see LaneScheduler); without lanes the queue is FIFO.
+    """
+
+    def __init__(self, name: str, initial_limit: float = 4, min_limit: float = 1,
+                 max_limit: float = 32, tolerance: float = 2.0, backoff: float = 0.75,
+                 smoothing: float = 0.2, baseline_drift: float = 0.01,
+                 lanes: Optional[Mapping[str, LaneConfig]] = None):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.baseline_drift = baseline_drift
+
+        self.slots = LaneScheduler(int(self.limit), lanes) if lanes else single_lane(int(self.limit))
+        self._baseline: Optional[float] = None
+        self._baseline_at = 0.0
+        self._smoothed: Optional[float] = None
+        self._last_decrease = 0.0
+
+        self.requests = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.slots.in_flight
+
+    @property
+    def queued(self) -> int:
+        return self.slots.queued
+
+    async def acquire(self, lane: str = DEFAULT_LANE):
+        """Wait for a slot in ``lane``; raises Overloaded when the lane sheds the call"""
+        await self.slots.acquire(lane)
+
+    def release(self, lane: str, latency: Optional[float], failed: bool = False):
+        """Free a slot and adapt the limit; ``latency`` None skips the sample"""
+        if latency is not None:
+            self._on_sample(latency, failed)
+            self.slots.limit = int(self.limit)
+        self.slots.release(lane)
+
+    def _on_sample(self, latency: float, failed: bool):
+        self.requests += 1
+        now = time.monotonic()
+        if failed:
+            self.errors += 1
+            self._decrease(now)
+            return
+
+        if self._smoothed is None:
+            self._baseline = self._smoothed = latency
+        else:
+            self._smoothed += self.smoothing * (latency - self._smoothed)
+            if self.slots.in_flight <= 1:
+                self._baseline = self._smoothed
+            else:
+                ceiling = self._baseline * (1 + self.baseline_drift * (now - self._baseline_at))
+                self._baseline = min(self._smoothed, ceiling)
+        self._baseline_at = now
+
+        if self._smoothed > self.tolerance * self._baseline:
+            self._decrease(now)
+        elif self.slots.in_flight + self.slots.queued >= self.limit / 2 and self.limit < self.max_limit:
+            # Only a limit that is actually reached has earned a raise
+            before = int(self.limit)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if int(self.limit) > before:
+                self.increases += 1
+
+    def _decrease(self, now: float):
+        if now - self._last_decrease < (self._smoothed or 0):
+            return
+        self._last_decrease = now
+        before = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        if self.limit < before:
+            self.decreases += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'limit': round(self.limit, 2),
+            'in_flight': self.slots.in_flight,
+            'queued': self.slots.queued,
+            'min_latency_ms': round(self._baseline * 1000, 1) if self._baseline is not None else None,
+            'latency_ms': round(self._smoothed * 1000, 1) if self._smoothed is not None else None,
+            'requests': self.requests,
+            'errors': self.errors,
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'lanes': self.slots.snapshot(),
+        }
@@ -0,0 +1,166 @@
+"""
+Artist lookups: cached name resolution and profiles, with concurrent lookups coalesced
+"""
+
+import asyncio
+import logging
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Searches an artist name: (id, name) of the best match, or None
+NameResolver = Callable[[str], Awaitable[Optional[Tuple[str, str]]]]
+# Fetches the profile of an artist id
+ProfileFetcher = Callable[[str], Awaitable[Dict[str, Any]]]
+
+# Arabic letter forms that Persian keyboards write differently, and marks
+# that NFKD does not take apart
+_LETTER_VARIANTS = str.maketrans({
+    '\u064a': '\u06cc',  # Arabic yeh -> Persian yeh
+    '\u0649': '\u06cc',  # alef maksura -> Persian yeh
+    '\u0643': '\u06a9',  # Arabic kaf -> keheh
+    '\u0629': '\u0647',  # teh marbuta -> heh
+    '\u06d5': '\u0647',  # ae (what is left of heh with yeh above) -> heh
+    '\u06c1': '\u0647',  # heh goal -> heh
+    '\u0671': '\u0627',  # alef wasla -> alef
+    '\u0640': None,  # tatweel (kashida)
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},  # Persian digits
+})
+
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def fold_text(text: str) -> str:
+    """Text with case, diacritics and Arabic/Persian letter variants folded
+
+    Latin accents and Arabic vowel marks are dropped, Arabic and Persian
+    variants of the same letter are unified, and runs of punctuation and
+    whitespace become single spaces.
+    """
+    if text.isascii():
+        return _SEPARATORS.sub(' ', text.casefold()).strip()
+    decomposed = unicodedata.normalize('NFKD', text)
+    # Combining marks: accents, harakat, and the hamza/madda NFKD split off
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    unified = stripped.translate(_LETTER_VARIANTS).casefold()
+    return _SEPARATORS.sub(' ', unified).strip()
+
+
+def normalize_name(name: str) -> str:
+    """Key under which spellings of the same artist name meet
+
+    The folded name without spaces: Persian names are written with a space,
+    a zero-width non-joiner or nothing between their parts.
+    """
+    # Names made only of punctuation ("!!!") keep it
+    return fold_text(name).replace(' ', '') or name.strip().casefold()
+
+
+class ArtistCache:
+    """Artist ids by normalized name and artist profiles by id, both with a TTL
+
+    Lookups of a name or id that is already being fetched wait for that
+    fetch instead of starting another one. Names that matched nothing are
+    remembered for ``miss_ttl`` so repeated typos don't reach upstream.
+    """
+
+    def __init__(self, resolve: NameResolver, fetch: ProfileFetcher, max_size: int,
+                 ttl: float, name_ttl: float, miss_ttl: float):
+        self.resolve_name = resolve
+        self.fetch_profile = fetch
+        self.miss_ttl = miss_ttl
+        self.ids = TTLCache(max_size * 4, name_ttl)
+        self.profiles = TTLCache(max_size, ttl)
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def _coalesced(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key, None))
+        # One caller giving up must not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    def remember(self, name: str, artist_id: str):
+        """Record that ``name`` refers to ``artist_id``"""
+        key = normalize_name(name)
+        if key:
+            self.ids.set(key, str(artist_id))
+
+    async def resolve(self, name: str) -> Optional[str]:
+        """Artist id for a name, from the cache or a search"""
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in self.ids:
+            return self.ids.get(key) or None
+        return await self._coalesced(('name', key), lambda: self._resolve(key, name))
+
+    async def _resolve(self, key: str, name: str) -> Optional[str]:
+        found = await self.resolve_name(name)
+        if found is None:
+            # An empty id marks a remembered miss
+            self.ids.set(key, '', ttl=self.miss_ttl)
+            return None
+        artist_id, found_name = found
+        self.ids.set(key, str(artist_id))
+        if found_name:
+            self.remember(found_name, artist_id)
+        return str(artist_id)
+
+    async def profile(self, artist_id: str) -> Dict[str, Any]:
+        """Profile of an artist id, from the cache or upstream"""
+        artist_id = str(artist_id)
+        cached = self.profiles.get(artist_id)
+        if cached is not None:
+            return cached
+        return await self._coalesced(('profile', artist_id), lambda: self._fetch(artist_id))
+
+    async def _fetch(self, artist_id: str) -> Dict[str, Any]:
+        profile = await self.fetch_profile(artist_id)
+        if profile:
+            self.profiles.set(artist_id, profile)
+        return profile
+
+    async def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        """Profile of the artist called ``name``, or None when there is none"""
+        artist_id = await self.resolve(name)
+        if artist_id is None:
+            return None
+        return await self.profile(artist_id)
+
+    async def warm(self, tracks: Iterable[Dict[str, Any]], count: int) -> int:
+        """Index the artists of chart tracks and fetch the first ``count`` profiles"""
+        artist_ids: List[str] = []
+        for track in tracks:
+            artists = [a.get('adamid') or a.get('id') for a in track.get('artists') or []]
+            artists = [str(artist_id) for artist_id in artists if artist_id]
+            # "A & B" subtitles can't be split into names reliably
+            if len(artists) == 1 and track.get('subtitle'):
+                self.remember(track['subtitle'], artists[0])
+            for artist_id in artists:
+                if artist_id not in artist_ids:
+                    artist_ids.append(artist_id)
+
+        results = await asyncio.gather(
+            *(self.profile(artist_id) for artist_id in artist_ids[:count]), return_exceptions=True
+        )
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed:
+            logger.warning(f"Could not warm {len(failed)} artist profiles: {failed[0]}")
+        return len(results) - len(failed)
+
+    def dump(self) -> Dict[str, List]:
+        return {'ids': self.ids.dump(), 'profiles': self.profiles.dump()}
+
+    def restore(self, state: Dict[str, List], elapsed: float):
+        for cache, entries in ((self.ids, state.get('ids', [])), (self.profiles, state.get('profiles', []))):
+            for key, value, ttl in entries:
+                if ttl > elapsed:
+                    cache.set(key, value, ttl=ttl - elapsed)
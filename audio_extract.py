@@ -0,0 +1,156 @@
+"""
+Audio-track extraction and decoding through ffmpeg worker processes
+"""
+
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import time
+import wave
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Sample rate used for everything we decode locally (matches Shazam signatures)
+SAMPLE_RATE = 16000
+
+# Names of the temp files non-streamable inputs are spilled to
+TEMP_PREFIX = 'shazamio_'
+TEMP_SUFFIX = '.media'
+
+
+class ExtractionError(Exception):
+    """Raised when ffmpeg cannot decode the input"""
+
+
+class AudioExtractor:
+    """Decodes the audio track of a media file into mono 16-bit PCM
+
+    Work runs in ffmpeg subprocesses, never on the event loop, and the number
+    of concurrent decoders is bounded by ``workers``.
+    """
+
+    def __init__(self, workers: int, ffmpeg: str = 'ffmpeg', timeout: float = 30):
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+        self.workers = workers
+        # Made on first use: on Python 3.8/3.9 it binds to the loop current
+        # when created, and the extractor is built before asyncio.run()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _command(self, source: str, window_seconds: Optional[float], start: float,
+                 sample_rate: int):
+        command = [self.ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error']
+        if start:
+            command += ['-ss', f"{start:.3f}"]
+        if window_seconds:
+            command += ['-t', f"{window_seconds:.3f}"]
+        command += [
+            '-i', source,
+            '-vn', '-sn', '-dn',
+            '-ac', '1',
+            '-ar', str(sample_rate),
+            '-f', 's16le',
+            'pipe:1',
+        ]
+        return command
+
+    async def _run(self, command, stdin: Optional[Union[bytes, memoryview]] = None) -> bytes:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        async with self._slots:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(stdin), timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise ExtractionError("ffmpeg timed out")
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+
+        if process.returncode != 0 and not stdout:
+            raise ExtractionError(stderr.decode(errors='replace').strip() or "ffmpeg failed")
+        return stdout
+
+    async def decode(self, data: Union[bytes, memoryview], window_seconds: Optional[float] = None,
+                     start: float = 0, sample_rate: int = SAMPLE_RATE) -> bytes:
+        """Decode a streamable audio buffer piped through stdin"""
+        command = self._command('pipe:0', window_seconds, start, sample_rate)
+        return await self._run(command, stdin=data)
+
+    async def extract(self, data: Union[bytes, memoryview], window_seconds: Optional[float] = None,
+                      start: float = 0, sample_rate: int = SAMPLE_RATE) -> bytes:
+        """Demux and decode the audio track of a (possibly non-streamable) container
+
+        MP4 files may keep their index at the end, so the input is spilled to a
+        temporary file that ffmpeg can seek in. Only ``window_seconds`` of audio
+        starting at ``start`` are decoded.
+        """
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(None, _spill_to_temp_file, data)
+        try:
+            command = self._command(path, window_seconds, start, sample_rate)
+            return await self._run(command)
+        finally:
+            await loop.run_in_executor(None, _remove_quietly, path)
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Wrap mono 16-bit PCM in a WAV container"""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return out.getvalue()
+
+
+def cleanup_temp_files(max_age: float = 600) -> int:
+    """Remove spill files left behind by a process that was killed mid-extraction
+
+    Only files older than ``max_age`` seconds are removed, so a process
+    running alongside (e.g. during a rolling restart) keeps its own.
+    """
+    directory = tempfile.gettempdir()
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(directory):
+        if not (name.startswith(TEMP_PREFIX) and name.endswith(TEMP_SUFFIX)):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} orphaned temp files")
+    return removed
+
+
+def _spill_to_temp_file(data: Union[bytes, memoryview]) -> str:
+    fd, path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=TEMP_SUFFIX)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove temp file {path}: {e}")
@@ -0,0 +1,62 @@
+"""
+Audio format detection from MIME types and magic bytes
+"""
+
+from typing import Iterable, Optional
+
+# Number of leading bytes fetched to sniff a file's container format
+SNIFF_BYTES = 4096
+
+# MIME types that may carry audio even though they are not audio/*
+GENERIC_MIME_TYPES = {
+    '',
+    'application/octet-stream',
+    'application/ogg',
+    'application/x-flac',
+    'binary/octet-stream',
+}
+
+
+class UnsupportedFormatError(Exception):
+    """Raised when a file turns out not to be recognizable audio"""
+
+
+def is_candidate_mime(mime_type: Optional[str], file_name: Optional[str],
+                      extensions: Iterable[str]) -> bool:
+    """Cheap pre-filter deciding whether a document is worth sniffing"""
+    mime_type = (mime_type or '').lower()
+    if mime_type.startswith('audio/') or mime_type in GENERIC_MIME_TYPES:
+        return True
+
+    # Trust a known audio extension only when the MIME type says nothing useful
+    name = (file_name or '').lower()
+    return not mime_type.startswith(('image/', 'text/', 'video/')) and any(
+        name.endswith(ext) for ext in extensions
+    )
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Identify an audio container from its first bytes, or None if it isn't audio"""
+    if len(head) < 12:
+        return None
+
+    if head.startswith(b'ID3'):
+        return 'mp3'
+    if head.startswith(b'fLaC'):
+        return 'flac'
+    if head.startswith(b'OggS'):
+        return 'opus' if b'OpusHead' in head[:128] else 'ogg'
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return 'wav'
+    if head.startswith(b'FORM') and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if head[4:8] == b'ftyp':
+        return 'm4a'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'webm'
+
+    # MPEG frame sync: layer bits 00 mean ADTS AAC, anything else is MPEG audio
+    if head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return 'aac' if head[1] & 0x06 == 0 else 'mp3'
+
+    return None
@@ -0,0 +1,122 @@
+"""
+Cheap pre-check that rejects silent, noisy or speech-only clips before recognition
+"""
+
+import numpy as np
+
+from fingerprint import pcm_to_samples
+
+# Verdicts returned by AudioGate.check
+PASS = 'pass'
+SILENCE = 'silence'
+NOISE = 'noise'
+SPEECH = 'speech'
+
+
+class GateResult:
+    """Outcome of the gate for one clip"""
+
+    __slots__ = ('verdict', 'trim_bytes', 'active_ratio', 'flatness', 'persistence')
+
+    def __init__(self, verdict: str, trim_bytes: int = 0, active_ratio: float = 0.0,
+                 flatness: float = 0.0, persistence: float = 0.0):
+        self.verdict = verdict
+        self.trim_bytes = trim_bytes
+        self.active_ratio = active_ratio
+        self.flatness = flatness
+        self.persistence = persistence
+
+    @property
+    def passed(self) -> bool:
+        return self.verdict == PASS
+
+    def __repr__(self) -> str:
+        return (f"GateResult({self.verdict}, trim={self.trim_bytes}, "
+                f"active={self.active_ratio:.2f}, flatness={self.flatness:.2f}, "
+                f"persistence={self.persistence:.2f})")
+
+
+class AudioGate:
+    """Frame-level energy, spectral flatness and tonal persistence checks
+
+    Works on mono 16-bit PCM in non-overlapping ~32 ms frames:
+
+    * frames quieter than ``silence_db`` dBFS are silent; leading silence is
+      trimmed and a clip with too few loud frames is rejected as silence;
+    * the median spectral flatness of loud frames (about 0.56 for white
+      noise, near 0 for tones) rejects hiss, wind and static;
+    * music keeps its dominant frequency for several frames while speech
+      glides and pauses between words, so a clip that is both choppy and has
+      no persistent tones is rejected as speech.
+    """
+
+    def __init__(self, sample_rate: int = 16000, seconds: float = 5.0, frame_size: int = 512,
+                 silence_db: float = -55.0, min_active_ratio: float = 0.25,
+                 max_flatness: float = 0.5, reject_speech: bool = True,
+                 min_persistence: float = 0.5, max_pause_ratio: float = 0.3,
+                 min_trim: float = 1.0):
+        self.sample_rate = sample_rate
+        self.seconds = seconds
+        self.frame_size = frame_size
+        self.silence_db = silence_db
+        self.min_active_ratio = min_active_ratio
+        self.max_flatness = max_flatness
+        self.reject_speech = reject_speech
+        self.min_persistence = min_persistence
+        self.max_pause_ratio = max_pause_ratio
+        self.min_trim = min_trim
+
+        self.window = np.hanning(frame_size).astype(np.float32)
+        freqs = np.fft.rfftfreq(frame_size, 1 / sample_rate)
+        # Where music and speech energy lives; ignores DC hum and codec hiss
+        self.band = slice(int(np.searchsorted(freqs, 100)), int(np.searchsorted(freqs, 4000)))
+
+    def _frames(self, samples: np.ndarray) -> np.ndarray:
+        count = len(samples) // self.frame_size
+        return samples[:count * self.frame_size].reshape(count, self.frame_size)
+
+    def check(self, pcm: bytes) -> GateResult:
+        """Classify the first ``seconds`` of sound after any leading silence"""
+        samples = pcm_to_samples(pcm[:len(pcm) - len(pcm) % 2])
+        frames = self._frames(samples)
+        if len(frames) == 0:
+            return GateResult(SILENCE)
+
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        level_db = 20 * np.log10(rms + 1e-10)
+        loud = level_db > self.silence_db
+        if not loud.any():
+            return GateResult(SILENCE)
+
+        # Keep one frame of lead-in so an onset is not clipped
+        first = max(int(np.argmax(loud)) - 1, 0)
+        trim_bytes = first * self.frame_size * 2
+        if first * self.frame_size < self.min_trim * self.sample_rate:
+            # Not worth re-encoding the clip for a short lead-in
+            trim_bytes = 0
+
+        analysed = int(self.seconds * self.sample_rate / self.frame_size)
+        frames = frames[first:first + analysed]
+        loud = loud[first:first + analysed]
+        level_db = level_db[first:first + analysed]
+
+        active_ratio = float(loud.mean())
+        if active_ratio < self.min_active_ratio:
+            return GateResult(SILENCE, trim_bytes, active_ratio)
+
+        power = np.abs(np.fft.rfft(frames[loud] * self.window, axis=1))[:, self.band] ** 2 + 1e-12
+        flatness = float(np.median(np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)))
+        if flatness > self.max_flatness:
+            return GateResult(NOISE, trim_bytes, active_ratio, flatness)
+
+        peaks = np.argmax(power, axis=1)
+        persistence = float(np.mean(np.abs(np.diff(peaks)) <= 1)) if len(peaks) > 1 else 1.0
+
+        if self.reject_speech:
+            # Pauses between words: frames well below the typical loud level
+            pauses = float(np.mean(level_db < np.median(level_db[loud]) - 15))
+            if pauses > self.max_pause_ratio and persistence < self.min_persistence:
+                return GateResult(SPEECH, trim_bytes, active_ratio, flatness, persistence)
+
+        return GateResult(PASS, trim_bytes, active_ratio, flatness, persistence)
+
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark audio-track extraction from video fixtures
+
+Generates short test videos with ffmpeg (a sine tone over a test pattern),
+then measures how long AudioExtractor takes to pull the recognition window
+out of each one, reported as milliseconds per MB of input.
+
+Usage: python benchmarks/bench_audio_extract.py [--rounds N] [--workers N]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from audio_extract import AudioExtractor  # noqa: E402
+
+# (name, duration in seconds, video size) for each generated fixture
+FIXTURES = [
+    ('video_note_15s', 15, '384x384'),
+    ('video_30s', 30, '640x360'),
+    ('video_60s', 60, '1280x720'),
+]
+
+WINDOW_SECONDS = 20
+
+
+def make_fixture(directory: str, name: str, duration: int, size: str) -> str:
+    """Render a test video with an audio track"""
+    path = os.path.join(directory, f"{name}.mp4")
+    subprocess.run(
+        [
+            'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f"testsrc=size={size}:rate=30:duration={duration}",
+            '-f', 'lavfi', '-i', f"sine=frequency=440:duration={duration}",
+            '-c:v', 'libx264', '-preset', 'veryfast',
+            '-c:a', 'aac', '-b:a', '128k',
+            '-shortest', path,
+        ],
+        check=True,
+    )
+    return path
+
+
+async def bench_fixture(extractor: AudioExtractor, data: bytes, rounds: int, concurrency: int):
+    """Return seconds per extraction for one fixture"""
+    async def one():
+        await extractor.extract(data, window_seconds=WINDOW_SECONDS)
+
+    # Warm up ffmpeg and the page cache
+    await one()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return elapsed / (rounds * concurrency)
+
+
+async def run(rounds: int, workers: int) -> int:
+    extractor = AudioExtractor(workers=workers)
+
+    print("🎬 Audio Extraction Benchmark")
+    print("=" * 60)
+    print(f"Window: {WINDOW_SECONDS}s | Workers: {workers} | Rounds: {rounds}")
+    print()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, duration, size in FIXTURES:
+            path = make_fixture(directory, name, duration, size)
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            megabytes = len(data) / (1024 * 1024)
+            per_file = await bench_fixture(extractor, data, rounds, workers)
+
+            print(f"{name:<16} {megabytes:6.2f} MB  "
+                  f"{per_file * 1000:8.1f} ms/file  "
+                  f"{per_file * 1000 / megabytes:8.1f} ms/MB")
+
+    return 0
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    try:
+        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        print("❌ ffmpeg is required to generate fixtures and run the benchmark")
+        return 1
+
+    return asyncio.run(run(args.rounds, args.workers))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
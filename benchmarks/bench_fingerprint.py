@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark the NumPy fingerprinting engine on synthetic clips
+
+Generates tones, melodies, chirps and noise at 16 kHz, then reports
+fingerprinting throughput (clips/sec per core), the time spent in each
+stage of the engine and the number of landmarks produced per clip.
+
+Usage: python benchmarks/bench_fingerprint.py [--seconds N] [--rounds N] [--processes N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fingerprint import FingerprintEngine  # noqa: E402
+
+SOURCE_RATE = 16000
+
+
+def make_clips(seconds: int, seed: int = 0):
+    """Synthetic test signals keyed by name"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * SOURCE_RATE, dtype=np.float32) / SOURCE_RATE
+
+    tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+
+    # A new pair of notes every quarter second
+    notes = rng.uniform(110, 3000, size=(seconds * 4, 2)).astype(np.float32)
+    note = np.repeat(notes, SOURCE_RATE // 4, axis=0)[:len(t)]
+    melody = 0.3 * np.sin(2 * np.pi * note[:, 0] * t) + 0.2 * np.sin(2 * np.pi * note[:, 1] * t)
+
+    chirp = 0.5 * np.sin(2 * np.pi * (100 + 150 * t) * t)
+    noise = rng.normal(0, 0.3, size=len(t))
+    noisy_melody = melody + rng.normal(0, 0.1, size=len(t))
+
+    return {
+        'tone': tone,
+        'melody': melody,
+        'chirp': chirp,
+        'noise': noise,
+        'noisy_melody': noisy_melody,
+    }
+
+
+def time_stages(engine: FingerprintEngine, samples: np.ndarray):
+    """Time each engine stage once and return (stage timings, landmark count)"""
+    timings = {}
+    start = time.perf_counter()
+    resampled = engine.resample(samples, SOURCE_RATE)
+    timings['resample'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    spec = engine.spectrogram(resampled)
+    timings['stft'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames, bins = engine.find_peaks(spec)
+    timings['peaks'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hashes, _ = engine.hash_peaks(frames, bins)
+    timings['hashing'] = time.perf_counter() - start
+
+    return timings, len(hashes)
+
+
+def worker_throughput(args):
+    """Clips/sec of a single process fingerprinting every clip ``rounds`` times"""
+    seconds, rounds = args
+    engine = FingerprintEngine()
+    clips = list(make_clips(seconds).values())
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for samples in clips:
+            engine.fingerprint(samples, SOURCE_RATE)
+    return rounds * len(clips) / (time.perf_counter() - start)
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=12, help="clip length")
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    engine = FingerprintEngine()
+    clips = make_clips(args.seconds)
+
+    print("🎼 Fingerprint Engine Benchmark")
+    print("=" * 72)
+    print(f"Clip length: {args.seconds}s @ {SOURCE_RATE} Hz -> {engine.sample_rate} Hz, "
+          f"n_fft={engine.n_fft}, hop={engine.hop}")
+    print()
+    print(f"{'clip':<14}{'resample':>10}{'stft':>10}{'peaks':>10}{'hashing':>10}"
+          f"{'total':>10}{'landmarks':>11}")
+
+    for name, samples in clips.items():
+        # Warm up, then keep the best of a few runs to hide scheduler noise
+        time_stages(engine, samples)
+        runs = [time_stages(engine, samples) for _ in range(5)]
+        timings, landmarks = min(runs, key=lambda run: sum(run[0].values()))
+        total = sum(timings.values())
+        print(f"{name:<14}"
+              + "".join(f"{timings[stage] * 1000:>8.2f}ms"
+                        for stage in ('resample', 'stft', 'peaks', 'hashing'))
+              + f"{total * 1000:>8.2f}ms{landmarks:>11}")
+
+    print()
+    work = [(args.seconds, args.rounds)] * args.processes
+    if args.processes == 1:
+        rates = [worker_throughput(work[0])]
+    else:
+        with multiprocessing.Pool(args.processes) as pool:
+            rates = pool.map(worker_throughput, work)
+
+    per_core = sum(rates) / len(rates)
+    print(f"Throughput: {per_core:.1f} clips/sec per core "
+          f"({sum(rates):.1f} clips/sec on {args.processes} process(es))")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark lookup latency and size of the local fingerprint index
+
+Builds a synthetic index (random landmarks, default 100k tracks) directly in
+the on-disk format, opens it through FingerprintIndex and times lookups of
+partial, noisy clips of indexed tracks as well as clips of unknown audio.
+Then adds --new-tracks tracks and compacts them into the base in a thread,
+timing lookups made while the merge runs.
+
+Usage: python benchmarks/bench_fingerprint_index.py [--tracks N] [--landmarks N]
+       [--new-tracks N]
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fingerprint_index import (  # noqa: E402
+    ENTRIES_FILE,
+    HASHES_FILE,
+    TRACKS_FILE,
+    VERSION_FILE,
+    FingerprintIndex,
+)
+
+HASH_SPACE = 1 << 26
+FRAMES_PER_CLIP = 625
+
+
+def build_index(directory: str, tracks: int, landmarks: int, seed: int = 0):
+    """Write a sorted synthetic index and return the per-track landmarks used"""
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, HASH_SPACE, size=tracks * landmarks, dtype=np.uint32)
+    offsets = rng.integers(0, FRAMES_PER_CLIP, size=tracks * landmarks, dtype=np.uint32)
+    # Same packing as pack_entries(): track id in the high 32 bits, offset in the low
+    track_ids = np.repeat(np.arange(tracks, dtype=np.uint64), landmarks)
+    entries = (track_ids << np.uint64(32)) | offsets.astype(np.uint64)
+
+    order = np.argsort(hashes, kind='stable')
+    hashes[order].tofile(os.path.join(directory, HASHES_FILE))
+    entries[order].tofile(os.path.join(directory, ENTRIES_FILE))
+    del order, entries, track_ids
+
+    with open(os.path.join(directory, TRACKS_FILE), 'w', encoding='utf-8') as f:
+        for track_id in range(tracks):
+            f.write(f'{track_id}\t{{"key": "{track_id}", "title": "Track {track_id}"}}\n')
+    # Same engine version FingerprintIndex opens with by default
+    with open(os.path.join(directory, VERSION_FILE), 'w', encoding='utf-8') as f:
+        f.write('0')
+
+    return hashes.reshape(tracks, landmarks), offsets.reshape(tracks, landmarks)
+
+
+def make_query(rng, hashes, offsets, track_id: int, keep: float, noise: int):
+    """A clip covering part of a track, shifted in time and padded with noise"""
+    count = hashes.shape[1]
+    picked = rng.choice(count, size=int(count * keep), replace=False)
+    shift = int(rng.integers(0, 100))
+    query_offsets = offsets[track_id, picked].astype(np.int64) + shift
+    query_hashes = hashes[track_id, picked]
+
+    noise_hashes = rng.integers(0, HASH_SPACE, size=noise, dtype=np.uint32)
+    noise_offsets = rng.integers(0, FRAMES_PER_CLIP, size=noise)
+    return (np.concatenate([query_hashes, noise_hashes]),
+            np.concatenate([query_offsets, noise_offsets]).astype(np.uint32))
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=100_000)
+    parser.add_argument('--landmarks', type=int, default=500, help="landmarks per track")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--new-tracks', type=int, default=2000, help="tracks added, then compacted")
+    args = parser.parse_args()
+
+    print("🔎 Local Fingerprint Index Benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        hashes, offsets = build_index(directory, args.tracks, args.landmarks)
+        print(f"Built {args.tracks:,} tracks x {args.landmarks} landmarks "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        # Compacted explicitly below, not by add()
+        index = FingerprintIndex(directory, min_matches=20,
+                                 compact_threshold=args.new_tracks * args.landmarks + 1)
+        print(f"Opened index in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        on_disk = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in (HASHES_FILE, ENTRIES_FILE, TRACKS_FILE)
+        )
+        print(f"Landmarks: {index.size:,} | Landmark storage: {index.nbytes() / 2**20:.1f} MB "
+              f"| On disk: {on_disk / 2**20:.1f} MB")
+        print()
+
+        rng = np.random.default_rng(1)
+        for label, keep, known in (("known clip", 0.3, True), ("unknown clip", 0.0, False)):
+            latencies = []
+            hits = 0
+            for _ in range(args.queries):
+                track_id = int(rng.integers(0, args.tracks))
+                query = make_query(rng, hashes, offsets, track_id, keep, noise=args.landmarks)
+                start = time.perf_counter()
+                track = index.lookup(*query)
+                latencies.append(time.perf_counter() - start)
+                if known and track and track['key'] == str(track_id):
+                    hits += 1
+                elif not known and track is None:
+                    hits += 1
+
+            print(f"{label:<13} p50 {percentile_ms(latencies, 50):7.2f} ms  "
+                  f"p95 {percentile_ms(latencies, 95):7.2f} ms  "
+                  f"p99 {percentile_ms(latencies, 99):7.2f} ms  "
+                  f"correct {hits}/{args.queries}")
+
+        print()
+        rng = np.random.default_rng(2)
+        for i in range(args.new_tracks):
+            index.add({'key': f"new{i}"},
+                      rng.integers(0, HASH_SPACE, size=args.landmarks, dtype=np.uint32),
+                      rng.integers(0, FRAMES_PER_CLIP, size=args.landmarks, dtype=np.uint32))
+        # The first lookup after adds sorts the pending delta; keep that out of the timings
+        index.lookup(*make_query(rng, hashes, offsets, 0, 0.3, noise=args.landmarks))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        compactor = threading.Thread(target=index.compact)
+        start = time.perf_counter()
+        compactor.start()
+        latencies = []
+        while compactor.is_alive():
+            track_id = int(rng.integers(0, args.tracks))
+            query = make_query(rng, hashes, offsets, track_id, 0.3, noise=args.landmarks)
+            started = time.perf_counter()
+            index.lookup(*query)
+            latencies.append(time.perf_counter() - started)
+        compactor.join()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"Compacted {args.new_tracks:,} new tracks into {index.size:,} landmarks "
+              f"in {time.perf_counter() - start:.1f}s, peak RSS grew by "
+              f"{(rss_after - rss_before) / 1024:.0f} MB")
+        if latencies:
+            print(f"{'during merge':<13} p50 {percentile_ms(latencies, 50):7.2f} ms  "
+                  f"p99 {percentile_ms(latencies, 99):7.2f} ms  "
+                  f"max {max(latencies) * 1000:7.2f} ms  ({len(latencies)} lookups)")
+
+        # Release the memory maps before the directory is removed
+        del index
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
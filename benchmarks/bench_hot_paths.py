@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark the hot in-process paths of the bot on recorded Shazam JSON
+
+Each benchmark calls one ShazamIOBot method in a tight loop, in rounds
+calibrated to about --round-ms each, and reports min / median / mean /
+stddev per call and operations per second, like pytest-benchmark does.
+
+Track data comes from benchmarks/fixtures (responses of recognize,
+search_track and top_world_tracks). A benchmark fails when its median
+is above its budget in BUDGETS_US, or, with --compare, more than
+--max-regression slower than the saved baseline. --save writes a baseline.
+
+Usage: python benchmarks/bench_hot_paths.py [--rounds N] [--only NAME,...]
+       [--save FILE] [--compare FILE] [--max-regression 0.25]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+sys.path.insert(0, ROOT)
+
+# Median time per call (microseconds) above which a benchmark fails
+BUDGETS_US = {
+    'check_rate_limit': 5,
+    'get_text': 5,
+    'build_track_card': 400,
+    'build_inline_result': 300,
+    'format_charts': 1500,
+}
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def make_benchmarks(bot):
+    """Name -> zero-argument callable for every hot path"""
+    from i18n import Msg
+
+    recognized = load_fixture('recognize.json')['track']
+    hits = [hit['track'] for hit in load_fixture('search_track.json')['tracks']['hits']]
+    charts = load_fixture('top_world_tracks.json')['tracks'][:10]
+
+    # Enough users to exercise the session table rather than one hot row
+    users = itertools.cycle(range(1_000_000, 1_010_000))
+    messages = itertools.cycle([Msg.START, Msg.HELP, Msg.ERROR_RATE_LIMITED, Msg.ERROR_NO_RESULTS])
+    for index, user_id in enumerate(range(1_000_000, 1_010_000)):
+        if index % 3 == 0:
+            bot.set_user_language(user_id, 'fa')
+    inline_tracks = itertools.cycle(hits)
+
+    return {
+        'check_rate_limit': lambda: bot.check_rate_limit(next(users)),
+        'get_text': lambda: bot.get_text(next(users), next(messages)),
+        'build_track_card': lambda: bot.build_track_card(recognized),
+        'build_inline_result': lambda: bot.build_inline_result(next(inline_tracks)),
+        'format_charts': lambda: bot.format_charts(charts),
+    }
+
+
+def measure(func, rounds: int, round_ms: float) -> dict:
+    """Per-call timings (seconds) over ``rounds`` calibrated rounds"""
+    # Calibrate: grow the loop until one round takes about round_ms
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed * 1000 >= round_ms / 4 or number >= 10_000_000:
+            break
+        number *= 4
+    number = max(1, int(number * round_ms / 1000 / max(elapsed, 1e-9)))
+
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'ops': 1 / statistics.median(timings),
+        'rounds': rounds,
+        'iterations': number,
+    }
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=15)
+    parser.add_argument('--round-ms', type=float, default=50, help="target duration of one round")
+    parser.add_argument('--only', help="comma-separated benchmark names")
+    parser.add_argument('--save', help="write the results as a JSON baseline")
+    parser.add_argument('--compare', help="baseline JSON to check for regressions")
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help="allowed median slowdown against --compare (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    print("⏱️  Hot Path Micro-Benchmarks")
+    print("=" * 78)
+
+    # The bot writes its log and index files to the working directory
+    with tempfile.TemporaryDirectory() as cwd:
+        os.chdir(cwd)
+        import logging
+        import bot as bot_module
+
+        logging.getLogger().setLevel(logging.ERROR)
+        instance = bot_module.ShazamIOBot()
+        instance.warm_up()
+        benchmarks = make_benchmarks(instance)
+        if args.only:
+            wanted = args.only.split(',')
+            unknown = set(wanted) - benchmarks.keys()
+            if unknown:
+                parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+            benchmarks = {name: benchmarks[name] for name in wanted}
+
+        results = {name: measure(func, args.rounds, args.round_ms) for name, func in benchmarks.items()}
+        instance.sessions.close()
+        os.chdir(ROOT)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['benchmarks']
+
+    print(f"{'benchmark':<22}{'min':>10}{'median':>10}{'mean':>10}{'stddev':>10}{'ops/s':>12}  budget")
+    failures = []
+    for name, stats in results.items():
+        median_us = stats['median'] * 1e6
+        budget = BUDGETS_US[name]
+        verdict = "✅" if median_us <= budget else "❌"
+        if median_us > budget:
+            failures.append(f"{name}: {median_us:.2f} us is above the {budget} us budget")
+        if name in baseline:
+            previous = baseline[name]['median'] * 1e6
+            change = median_us / previous - 1
+            if change > args.max_regression:
+                verdict = "❌"
+                failures.append(f"{name}: {change:+.0%} against the baseline ({previous:.2f} us)")
+        print(f"{name:<22}" + "".join(f"{stats[key] * 1e6:>8.2f}us" for key in ('min', 'median', 'mean', 'stddev'))
+              + f"{stats['ops']:>12,.0f}  {verdict} {budget}us")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'benchmarks': results}, f, indent=2)
+        print(f"💾 Baseline written to {args.save}")
+
+    print()
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ All hot paths within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+Load-test the bot end to end against a local Bot API and Shazam stand-in
+
+A child process serves two local HTTP servers: a fake Telegram Bot API
+(method calls and file downloads, with synthetic WAV clips) and a stub
+Shazam (recognize, search and charts), each with configurable latency
+(log-normal around a median) and error rate. ShazamIOBot runs in this
+process with its real handlers and update processor, pointed at the fake
+Bot API and given a Shazam client that talks to the stub. With --replay
+the bot gets recorded Shazam responses instead (see upstream.py), served
+with their recorded latency times --replay-latency-scale.
+
+Synthetic /track commands, inline queries and audio uploads arrive as a
+Poisson stream at the target rate. The run reports throughput, p50/p95/p99
+per handler, CPU and memory, and writes everything as JSON so runs can be
+compared over time.
+
+With --clients N the bot balances over N stub Shazam clients (see
+client_pool.py). --client-limit caps the calls each client may have in
+flight, like a per-account upstream limit; over it the stub answers 429.
+The first --bad-clients clients always fail, to watch them get ejected.
+
+Updates go through the bot's priority lanes; --no-lanes turns them off
+to compare, e.g. inline latency under a flood of slow recognitions
+(--mix inline=0.5,audio=0.5 --recognize-latency 3000).
+
+The loop watchdog runs during the load and its stalls are reported with
+their call sites; with --strict-loop, blocking calls in handlers raise and
+show up as handler errors.
+
+Usage: python benchmarks/bench_load.py [--rps 20] [--duration 30]
+       [--mix track=0.3,inline=0.5,audio=0.2] [--no-lanes] [--strict-loop]
+       [--clients 1] [--client-limit 0] [--bad-clients 0] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+TOKEN = '123456:LOADTEST'
+SAMPLE_RATE = 16000
+TITLES = ["Bohemian Rhapsody", "Blinding Lights", "Shape of You", "Billie Jean", "Hotel California",
+          "Smells Like Teen Spirit", "Rolling in the Deep", "Dance Monkey", "Levitating", "Believer",
+          "Bad Guy", "Someone Like You", "Lose Yourself", "Take On Me", "Wonderwall"]
+
+
+def sample_latency(rng: random.Random, median_ms: float, jitter: float) -> float:
+    """Seconds drawn from a log-normal distribution around ``median_ms``"""
+    return median_ms / 1000 * math.exp(rng.gauss(0, jitter)) if median_ms > 0 else 0.0
+
+
+def fake_track(key: str) -> dict:
+    title = TITLES[int(key) % len(TITLES)]
+    return {'key': key, 'title': f"{title} #{key}", 'subtitle': f"Artist {int(key) % 97}",
+            'url': f"https://www.shazam.com/track/{key}"}
+
+
+def make_clip(index: int, seconds: float) -> bytes:
+    """A WAV clip of random chords over light noise, different for every index"""
+    import numpy as np
+
+    rng = np.random.default_rng(index)
+    samples = int(seconds * SAMPLE_RATE)
+    t = np.arange(samples) / SAMPLE_RATE
+    signal = rng.normal(0, 0.02, samples)
+    step = SAMPLE_RATE // 2
+    for start in range(0, samples, step):
+        for freq in rng.uniform(110, 1760, 3):
+            signal[start:start + step] += 0.2 * np.sin(2 * np.pi * freq * t[start:start + step])
+    pcm = (np.clip(signal, -1, 1) * 32767).astype('<i2').tobytes()
+
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return out.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Stand-in servers (run in the child process)
+# ---------------------------------------------------------------------------
+
+async def serve(args):
+    from aiohttp import web
+
+    rng = random.Random(args.seed + 1)
+    clips = [make_clip(i, args.clip_seconds) for i in range(args.clips)]
+    stats = {'bot_api': Counter(), 'shazam': Counter()}
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+
+    async def bot_method(request):
+        method = request.match_info['method']
+        stats['bot_api'][method] += 1
+        params = await request.post()
+        await asyncio.sleep(sample_latency(rng, args.bot_api_latency, args.bot_api_jitter))
+        if rng.random() < args.bot_api_error_rate:
+            stats['bot_api']['errors'] += 1
+            return web.json_response({'ok': False, 'error_code': 500,
+                                      'description': "Internal Server Error"}, status=500)
+
+        text = params.get('text') or params.get('caption') or ''
+        if text.startswith(('❌', '⚠️')):
+            stats['bot_api']['error_replies'] += 1
+
+        if method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'Load', 'username': 'loadtestbot'}
+        elif method == 'getFile':
+            file_id = params['file_id']
+            clip = int(file_id.split('_')[0][len('clip'):]) % len(clips)
+            result = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': len(clips[clip]),
+                      'file_path': f"music/{clip}.wav"}
+        elif method in ('sendMessage', 'sendPhoto', 'editMessageText'):
+            chat_id = int(json.loads(params.get('chat_id', '1')))
+            result = {'message_id': rng.randrange(1, 2**31), 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': text}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def bot_file(request):
+        stats['bot_api']['downloads'] += 1
+        data = clips[int(request.match_info['clip']) % len(clips)]
+        await asyncio.sleep(sample_latency(rng, args.bot_api_latency, args.bot_api_jitter))
+        if request.http_range.start is not None:
+            start, stop, _ = request.http_range.indices(len(data))
+            headers = {'Content-Range': f"bytes {start}-{stop - 1}/{len(data)}"}
+            return web.Response(body=data[start:stop], status=206, headers=headers)
+        return web.Response(body=data)
+
+    in_flight = Counter()
+
+    async def shazam_call(request, kind: str):
+        stats['shazam'][kind] += 1
+        client = int(request.query.get('client', 0))
+        if args.client_limit and in_flight[client] >= args.client_limit:
+            stats['shazam']['throttled'] += 1
+            raise web.HTTPTooManyRequests()
+        median = args.recognize_latency if kind == 'recognize' and args.recognize_latency else args.shazam_latency
+        in_flight[client] += 1
+        try:
+            await asyncio.sleep(sample_latency(rng, median, args.shazam_jitter))
+        finally:
+            in_flight[client] -= 1
+        if client < args.bad_clients or rng.random() < args.shazam_error_rate:
+            stats['shazam']['errors'] += 1
+            raise web.HTTPInternalServerError()
+
+    async def recognize(request):
+        body = await request.read()
+        await shazam_call(request, 'recognize')
+        if rng.random() < args.shazam_miss_rate:
+            return web.json_response({'matches': []})
+        # The same audio always matches the same track
+        key = str(int(hashlib.blake2b(body[:65536], digest_size=4).hexdigest(), 16))
+        return web.json_response({'matches': [{'id': key}], 'track': fake_track(key)})
+
+    async def search(request):
+        await shazam_call(request, 'search')
+        query = request.query.get('query', '')
+        offset = int(request.query.get('offset', 0))
+        limit = int(request.query.get('limit', 10))
+        base = int(hashlib.blake2b(query.encode(), digest_size=3).hexdigest(), 16)
+        hits = [{'track': fake_track(str(base + offset + i))} for i in range(limit)]
+        return web.json_response({'tracks': {'hits': hits}})
+
+    async def top(request):
+        await shazam_call(request, 'top')
+        return web.json_response({'tracks': [fake_track(str(i)) for i in range(10)]})
+
+    async def get_stats(request):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return web.json_response({
+            'bot_api': dict(stats['bot_api']),
+            'shazam': dict(stats['shazam']),
+            'cpu_seconds': usage.ru_utime + usage.ru_stime - cpu_start.ru_utime - cpu_start.ru_stime,
+        })
+
+    bot_api = web.Application()
+    bot_api.router.add_post('/bot{token}/{method}', bot_method)
+    bot_api.router.add_get('/file/bot{token}/music/{clip}.wav', bot_file)
+    bot_api.router.add_get('/stats', get_stats)
+
+    shazam = web.Application(client_max_size=64 * 2**20)
+    shazam.router.add_post('/recognize', recognize)
+    shazam.router.add_get('/search', search)
+    shazam.router.add_get('/top', top)
+
+    urls = {}
+    for name, app in (('bot_api', bot_api), ('shazam', shazam)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        urls[name] = f"http://{host}:{port}"
+
+    print(json.dumps(urls), flush=True)
+    await asyncio.Event().wait()
+
+
+# ---------------------------------------------------------------------------
+# Bot side
+# ---------------------------------------------------------------------------
+
+class StubShazam:
+    """The Shazam methods the bot uses, served by the stub server"""
+
+    def __init__(self, url: str, client: int = 0):
+        import aiohttp
+
+        self.url = url
+        self.client = client
+        self.session = aiohttp.ClientSession()
+
+    async def _get(self, path: str, **params):
+        params['client'] = self.client
+        async with self.session.get(f"{self.url}{path}", params=params) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def recognize(self, data: bytes):
+        async with self.session.post(f"{self.url}/recognize", data=bytes(data),
+                                     params={'client': self.client}) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def search_track(self, query: str, limit: int = 7, offset: int = 0):
+        return await self._get('/search', query=query, limit=limit, offset=offset)
+
+    async def top_world_tracks(self, limit: int = 200, offset: int = 0):
+        return await self._get('/top', limit=limit, offset=offset)
+
+    async def close(self):
+        await self.session.close()
+
+
+class UpdateFactory:
+    """Synthetic Bot API updates for each kind of request"""
+
+    def __init__(self, rng: random.Random, users: int, clips: int, repeat_ratio: float):
+        self.rng = rng
+        self.users = users
+        self.clips = clips
+        self.repeat_ratio = repeat_ratio
+        self.update_id = 0
+        self.uploads = []
+
+    def _user(self) -> dict:
+        return {'id': self.rng.randrange(1, self.users + 1), 'is_bot': False, 'first_name': 'Load'}
+
+    def _message(self, user: dict, **fields) -> dict:
+        message = {'message_id': self.update_id, 'date': int(time.time()), 'from': user,
+                   'chat': {'id': user['id'], 'type': 'private'}}
+        message.update(fields)
+        return message
+
+    def make(self, kind: str) -> dict:
+        self.update_id += 1
+        user = self._user()
+        title = self.rng.choice(TITLES)
+
+        if kind == 'track':
+            text = f"/track {title}"
+            message = self._message(user, text=text, entities=[
+                {'type': 'bot_command', 'offset': 0, 'length': len('/track')}
+            ])
+        elif kind == 'inline':
+            return {'update_id': self.update_id, 'inline_query': {
+                'id': str(self.update_id), 'from': user, 'query': title, 'offset': '',
+            }}
+        else:
+            # Some uploads are files the bot has seen before (forwards, re-sends)
+            if self.uploads and self.rng.random() < self.repeat_ratio:
+                file_id = self.rng.choice(self.uploads)
+            else:
+                file_id = f"clip{self.rng.randrange(self.clips)}_{self.update_id}"
+                self.uploads.append(file_id)
+            message = self._message(user, audio={
+                'file_id': file_id, 'file_unique_id': file_id, 'duration': 12,
+                'mime_type': 'audio/wav', 'file_name': 'clip.wav', 'file_size': 400000,
+            })
+
+        return {'update_id': self.update_id, 'message': message}
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def percentiles(samples) -> dict:
+    import numpy as np
+
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2), 'max_ms': round(max(samples) * 1000, 2)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+async def load_test(args, mix: dict, urls: dict) -> dict:
+    import aiohttp
+    import bot as bot_module
+    from telegram import Update
+    from telegram.ext import Application
+    from upstream import FixtureStore, ReplayShazam
+
+    logging.getLogger().setLevel(args.log_level)
+
+    if args.no_lanes:
+        bot_module.ENABLE_PRIORITY_LANES = False
+    bot_module.ENABLE_LOOP_WATCHDOG = True
+    bot_module.LOOP_WATCHDOG_STRICT = args.strict_loop
+    instance = bot_module.ShazamIOBot()
+    if args.replay:
+        client = ReplayShazam(FixtureStore(args.replay), latency_scale=args.replay_latency_scale)
+    else:
+        client = StubShazam(urls['shazam'])
+    # Same wrapping as in production, so the adaptive limits take part
+    clients = [client]
+    if args.clients > 1 and not args.replay:
+        clients += [StubShazam(urls['shazam'], i) for i in range(1, args.clients)]
+        instance._shazam = instance.build_client_pool({
+            f"client{stub.client}": instance.limit_upstream(stub, f"client{stub.client}") for stub in clients
+        })
+    else:
+        instance._shazam = instance.limit_upstream(client)
+    instance.warm_up()
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"{urls['bot_api']}/bot")
+        .base_file_url(f"{urls['bot_api']}/file/bot")
+        .concurrent_updates(instance.build_update_processor())
+        .build()
+    )
+    instance.setup_handlers(application)
+
+    kinds = {}
+    errors = Counter()
+
+    async def count_error(update, context):
+        if isinstance(update, Update):
+            errors[kinds.get(update.update_id, 'unknown')] += 1
+
+    application.add_error_handler(count_error)
+
+    rng = random.Random(args.seed)
+    factory = UpdateFactory(rng, args.users, args.clips, args.repeat_ratio)
+    latencies = defaultdict(list)
+    rss_samples = []
+    tasks = set()
+    loop = asyncio.get_running_loop()
+
+    async def handle(kind: str, update: Update):
+        started = loop.time()
+        await application.update_processor.process_update(update, application.process_update(update))
+        latencies[kind].append(loop.time() - started)
+
+    async def sample_memory():
+        while True:
+            rss_samples.append(rss_bytes())
+            await asyncio.sleep(0.5)
+
+    async with application:
+        monitor = asyncio.create_task(sample_memory())
+        instance.loop_watchdog.start()
+        rss_start = rss_bytes()
+        cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        started = loop.time()
+        next_at = started
+        sent = Counter()
+
+        while next_at - started < args.duration:
+            next_at += rng.expovariate(args.rps)
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+            data = factory.make(kind)
+            kinds[data['update_id']] = kind
+            sent[kind] += 1
+            task = asyncio.create_task(handle(kind, Update.de_json(data, application.bot)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        offered = loop.time() - started
+        unfinished = 0
+        if tasks:
+            _, pending = await asyncio.wait(set(tasks), timeout=args.drain)
+            unfinished = len(pending)
+            for task in pending:
+                task.cancel()
+        elapsed = loop.time() - started
+        cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+        monitor.cancel()
+        await instance.loop_watchdog.stop()
+
+    for stub in clients:
+        if isinstance(stub, StubShazam):
+            await stub.close()
+    if instance.http_session is not None:
+        await instance.http_session.close()
+    instance.sessions.close()
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{urls['bot_api']}/stats") as resp:
+            stubs = await resp.json()
+
+    completed = sum(len(samples) for samples in latencies.values())
+    cpu_seconds = cpu_end.ru_utime + cpu_end.ru_stime - cpu_start.ru_utime - cpu_start.ru_stime
+    return {
+        'target_rps': args.rps,
+        'offered_rps': round(sum(sent.values()) / offered, 2),
+        'throughput_rps': round(completed / elapsed, 2),
+        'elapsed_seconds': round(elapsed, 2),
+        'sent': sum(sent.values()),
+        'completed': completed,
+        'unfinished': unfinished,
+        'handlers': {
+            kind: dict(sent=sent[kind], completed=len(latencies[kind]), errors=errors[kind],
+                       **percentiles(latencies[kind]))
+            for kind in mix
+        },
+        'resources': {
+            'cpu_seconds': round(cpu_seconds, 2),
+            'cpu_percent': round(cpu_seconds / elapsed * 100, 1),
+            'rss_start_mb': round(rss_start / 2**20, 1),
+            'rss_peak_mb': round(max(rss_samples, default=rss_start) / 2**20, 1),
+            'rss_end_mb': round(rss_bytes() / 2**20, 1),
+            'stub_cpu_seconds': round(stubs.pop('cpu_seconds'), 2),
+        },
+        'calls': stubs,
+        **instance.metrics(),
+    }
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('track', 'inline', 'audio'):
+            raise argparse.ArgumentTypeError(f"unknown request kind {kind!r}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rps', type=float, default=20, help="target requests per second")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of offered load")
+    parser.add_argument('--mix', type=parse_mix, default='track=0.3,inline=0.5,audio=0.2')
+    parser.add_argument('--users', type=int, default=100000, help="distinct synthetic users")
+    parser.add_argument('--clips', type=int, default=20, help="distinct audio clips served")
+    parser.add_argument('--clip-seconds', type=float, default=12)
+    parser.add_argument('--repeat-ratio', type=float, default=0.2,
+                        help="share of uploads re-sending a file already seen")
+    parser.add_argument('--bot-api-latency', type=float, default=30, help="median ms")
+    parser.add_argument('--bot-api-jitter', type=float, default=0.3, help="log-normal sigma")
+    parser.add_argument('--bot-api-error-rate', type=float, default=0.0)
+    parser.add_argument('--shazam-latency', type=float, default=400, help="median ms")
+    parser.add_argument('--recognize-latency', type=float, default=0,
+                        help="median ms of recognize calls (default: --shazam-latency)")
+    parser.add_argument('--shazam-jitter', type=float, default=0.5, help="log-normal sigma")
+    parser.add_argument('--shazam-error-rate', type=float, default=0.02)
+    parser.add_argument('--shazam-miss-rate', type=float, default=0.3)
+    parser.add_argument('--replay', help="recorded Shazam fixture file to serve instead of the stub")
+    parser.add_argument('--replay-latency-scale', type=float, default=1.0,
+                        help="multiplier for recorded latencies (0 = instant)")
+    parser.add_argument('--clients', type=int, default=1, help="stub Shazam clients to balance over")
+    parser.add_argument('--client-limit', type=int, default=0,
+                        help="calls in flight per client before the stub answers 429 (0 = no limit)")
+    parser.add_argument('--bad-clients', type=int, default=0, help="clients whose calls always fail")
+    parser.add_argument('--no-lanes', action='store_true',
+                        help="disable the priority lanes, to compare against")
+    parser.add_argument('--strict-loop', action='store_true',
+                        help="fail handlers that make blocking calls on the event loop")
+    parser.add_argument('--drain', type=float, default=60, help="seconds to wait for in-flight work")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='ERROR', help="bot log level during the run")
+    parser.add_argument('--output', default='load_results.json', help="JSON results file")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args))
+        return 0
+
+    print("🔥 End-to-end Load Test")
+    print("=" * 72)
+
+    output = os.path.abspath(args.output)
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', *sys.argv[1:]],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        urls = json.loads(server.stdout.readline())
+        # The bot writes its log, index and stats files to the working directory
+        with tempfile.TemporaryDirectory() as cwd:
+            os.chdir(cwd)
+            results = asyncio.run(load_test(args, args.mix, urls))
+            os.chdir(ROOT)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"Offered {results['offered_rps']} rps for {args.duration:.0f}s, "
+          f"completed {results['completed']}/{results['sent']} "
+          f"({results['throughput_rps']} rps, {results['unfinished']} unfinished)")
+    print()
+    print(f"{'handler':<10}{'sent':>8}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for kind, stats in results['handlers'].items():
+        cells = ''.join(f"{stats[key]:>8.0f}ms" if stats[key] is not None else f"{'-':>10}"
+                        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+        print(f"{kind:<10}{stats['sent']:>8}{stats['errors']:>8}{cells}")
+    print()
+    res = results['resources']
+    print(f"CPU: {res['cpu_seconds']}s in the bot ({res['cpu_percent']}% of one core), "
+          f"{res['stub_cpu_seconds']}s in the stand-ins")
+    print(f"RSS: {res['rss_start_mb']} MB at start, {res['rss_peak_mb']} MB peak, "
+          f"{res['rss_end_mb']} MB at the end")
+    print(f"Upstream calls: {results['calls']}")
+    for name, stats in results['clients'].items():
+        print(f"  {name}: {stats['state']}, {stats['requests']} calls, {stats['errors']} errors, "
+              f"{stats['ejections']} ejections, latency {stats['latency_ms']} ms")
+    shed = {name: stats['rejected'] + stats['expired'] for name, stats in results['lanes'].items()}
+    print(f"Updates shed per lane: {shed}")
+    loop_stats = results['loop']
+    print(f"Event loop: lag {loop_stats['lag_ms']} ms (max {loop_stats['max_lag_ms']} ms), "
+          f"{loop_stats['stalls']} stalls, {loop_stats['blocked_calls']} blocking calls")
+    for site, stats in loop_stats['sites'].items():
+        print(f"  {site}: {stats['count']}x, {stats['total_ms']} ms total, max {stats['max_ms']} ms")
+
+    report = {
+        'benchmark': 'load',
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('serve', 'output')},
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"💾 Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
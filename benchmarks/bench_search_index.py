@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local track search index at a million indexed titles
+
+Synthetic tracks (titles and artists drawn from a Zipf-distributed
+vocabulary of made-up words, a share of them in Persian script) are added
+one by one, as the bot does, then queried in four ways:
+
+  exact   the full "title artist" of an indexed track
+  prefix  the title cut mid-word, as while typing an inline query
+  typo    the title with one letter replaced
+  miss    words that were never indexed
+
+The run reports build time, index memory, lookup latency percentiles per
+query kind, and how often the intended track came back in the top results.
+It fails when a p95 is above --max-p95-ms.
+
+Usage: python benchmarks/bench_search_index.py [--tracks 1000000]
+       [--queries 2000] [--limit 10] [--max-p95-ms 25]
+"""
+
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+# Onsets, vowels and codas combine into a few thousand syllables, so words
+# share trigrams about as unevenly as real titles do
+LATIN_ONSETS = ['', 'b', 'c', 'd', 'f', 'g', 'h', 'j', 'k', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'w',
+                'br', 'ch', 'cl', 'dr', 'fl', 'gr', 'sh', 'sl', 'st', 'th', 'tr', 'wh']
+LATIN_VOWELS = ['a', 'e', 'i', 'o', 'u', 'y', 'ea', 'ee', 'ou', 'ai', 'oo', 'ie']
+LATIN_CODAS = ['', '', 'n', 'r', 's', 't', 'l', 'm', 'ng', 'ck', 'st', 'nd', 'ght']
+PERSIAN_ONSETS = ['ب', 'پ', 'ت', 'ج', 'چ', 'د', 'ر', 'ز', 'س', 'ش', 'ف', 'ک', 'گ', 'ل', 'م', 'ن', 'و', 'ه', 'ی', 'خ']
+PERSIAN_VOWELS = ['ا', 'و', 'ی', '']
+PERSIAN_CODAS = ['', '', 'ن', 'ر', 'م', 'ل', 'د', 'ست']
+
+
+def syllables(onsets, vowels, codas):
+    return [onset + vowel + coda for onset in onsets for vowel in vowels for coda in codas
+            if onset + vowel + coda]
+
+
+def make_vocabulary(rng: random.Random, size: int, parts, persian: bool):
+    words = set()
+    while len(words) < size:
+        word = ''.join(rng.choice(parts) for _ in range(rng.randint(1, 3)))
+        words.add(word if persian else word.capitalize())
+    return sorted(words)
+
+
+def zipf_choice(rng: random.Random, words, skew: float = 1.1):
+    """A word picked with Zipf-like popularity (low indexes are common)"""
+    index = int(len(words) * rng.random() ** (skew * 3))
+    return words[min(index, len(words) - 1)]
+
+
+def make_tracks(rng: random.Random, count: int, persian_share: float):
+    latin = make_vocabulary(rng, 60000, syllables(LATIN_ONSETS, LATIN_VOWELS, LATIN_CODAS), persian=False)
+    persian = make_vocabulary(rng, 15000, syllables(PERSIAN_ONSETS, PERSIAN_VOWELS, PERSIAN_CODAS), persian=True)
+    artists = [' '.join(zipf_choice(rng, latin) for _ in range(rng.randint(1, 3))) for _ in range(count // 20)]
+    for key in range(count):
+        words = persian if rng.random() < persian_share else latin
+        title = ' '.join(zipf_choice(rng, words) for _ in range(rng.randint(1, 5)))
+        yield {'key': str(key), 'title': title, 'subtitle': rng.choice(artists),
+               'images': {'coverart': f"https://img.example/{key}.jpg"}}
+
+
+def make_queries(rng: random.Random, tracks, count: int):
+    """(kind, query, expected track key) tuples"""
+    queries = []
+    for _ in range(count):
+        track = rng.choice(tracks)
+        title, artist = track['title'], track['subtitle']
+        queries.append(('exact', f"{title} {artist}", track['key']))
+        cut = rng.randint(min(len(title), max(3, len(title) // 2)), len(title))
+        queries.append(('prefix', title[:cut], track['key']))
+        position = rng.randrange(len(title))
+        typo = title[:position] + rng.choice('aeiouxz') + title[position + 1:]
+        queries.append(('typo', f"{typo} {artist}", track['key']))
+        queries.append(('miss', f"qqv{rng.randint(0, 10**6)} zzx", None))
+    rng.shuffle(queries)
+    return queries
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=2000, help="queries per kind")
+    parser.add_argument('--limit', type=int, default=10, help="results per query")
+    parser.add_argument('--min-score', type=float, default=0.8)
+    parser.add_argument('--persian-share', type=float, default=0.2)
+    parser.add_argument('--max-p95-ms', type=float, default=25)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from search_index import TrackSearchIndex
+
+    print("🔎 Local Track Search Index Benchmark")
+    print("=" * 72)
+
+    rng = random.Random(args.seed)
+    tracks = list(make_tracks(rng, args.tracks, args.persian_share))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    index = TrackSearchIndex(args.tracks, min_score=args.min_score)
+    started = time.perf_counter()
+    for track in tracks:
+        index.add(track)
+    index.compact()
+    build = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"Indexed {len(index):,} tracks in {build:.1f}s ({build / len(tracks) * 1e6:.1f} us per add)")
+    print(f"Index data: {index.nbytes() / 2**20:.1f} MB, peak RSS grew by {(rss_after - rss_before) / 1024:.0f} MB")
+    print()
+
+    timings = {}
+    found = {}
+    for kind, query, expected in make_queries(rng, tracks, args.queries):
+        started = time.perf_counter()
+        results = index.search(query, args.limit)
+        timings.setdefault(kind, []).append(time.perf_counter() - started)
+        if expected is None:
+            hit = not results
+        else:
+            hit = any(track['key'] == expected for track, _ in results)
+        found.setdefault(kind, []).append(hit)
+
+    print(f"{'query':<10}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}{'found':>9}")
+    failures = []
+    for kind in ('exact', 'prefix', 'typo', 'miss'):
+        samples = [t * 1000 for t in timings[kind]]
+        p95 = percentile(samples, 0.95)
+        verdict = "✅" if p95 <= args.max_p95_ms else "❌"
+        if p95 > args.max_p95_ms:
+            failures.append(f"{kind}: p95 {p95:.2f} ms is above {args.max_p95_ms} ms")
+        rate = sum(found[kind]) / len(found[kind])
+        print(f"{kind:<10}" + "".join(f"{value:>8.2f}ms" for value in (
+            percentile(samples, 0.5), p95, percentile(samples, 0.99), statistics.fmean(samples)))
+            + f"{rate:>8.1%} {verdict}")
+    print("(found: intended track in the top results; for miss, no results at all)")
+
+    print()
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ All lookups within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
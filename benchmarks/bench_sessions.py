@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark memory per user of the session store against the old per-user dicts
+
+For each population size a fresh interpreter creates one session per user
+(every user makes a request, 10% pick a language) and reports the resident
+memory it took, the cost of a rate-limit check and of an eviction sweep.
+The "legacy" layout is the previous user_requests / user_languages /
+user_data dicts, measured up to --legacy-max users.
+
+Usage: python benchmarks/bench_sessions.py [--sizes 1000000,5000000,10000000] [--legacy-max N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure_store(users: int) -> dict:
+    # The store imports NumPy on its first sweep; keep that out of the timings
+    import numpy  # noqa: F401
+    from sessions import SessionStore
+
+    store = SessionStore(['en', 'fa'], rate_limit=10, idle_seconds=3600)
+    before = rss_bytes()
+    start = time.perf_counter()
+    for user_id in range(1_000_000_000, 1_000_000_000 + users):
+        store.allow(user_id)
+        if user_id % 10 == 0:
+            store.set_language(user_id, 1)
+    build = time.perf_counter() - start
+    memory = rss_bytes() - before
+
+    start = time.perf_counter()
+    for user_id in range(1_000_000_000, 1_000_000_000 + 100_000):
+        store.allow(user_id)
+    check_ns = (time.perf_counter() - start) / 100_000 * 1e9
+
+    start = time.perf_counter()
+    asyncio.run(store.evict_idle())
+    sweep_ms = (time.perf_counter() - start) * 1000
+
+    return {'memory': memory, 'build': build, 'check_ns': check_ns, 'sweep_ms': sweep_ms,
+            'columns': store.nbytes()}
+
+
+def measure_legacy(users: int) -> dict:
+    from datetime import datetime
+
+    user_requests = {}
+    user_languages = {}
+    user_data = {}
+    before = rss_bytes()
+    start = time.perf_counter()
+    for user_id in range(1_000_000_000, 1_000_000_000 + users):
+        user_requests[user_id] = [datetime.now()]
+        if user_id % 10 == 0:
+            user_languages[user_id] = 'fa'
+            user_data[user_id] = {}
+    build = time.perf_counter() - start
+    return {'memory': rss_bytes() - before, 'build': build}
+
+
+def run_child(kind: str, users: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, __file__, '--child', kind, '--sizes', str(users)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000000,5000000,10000000')
+    parser.add_argument('--legacy-max', type=int, default=1_000_000,
+                        help="largest population measured with the legacy dicts")
+    parser.add_argument('--child', choices=('store', 'legacy'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.child:
+        measure = measure_store if args.child == 'store' else measure_legacy
+        print(json.dumps(measure(sizes[0])))
+        return 0
+
+    print("👥 Session Store Memory Benchmark")
+    print("=" * 72)
+    print(f"{'users':>12}{'layout':>9}{'RSS':>11}{'bytes/user':>12}{'build':>9}"
+          f"{'check':>10}{'sweep':>10}")
+
+    for users in sizes:
+        layouts = ['store'] + (['legacy'] if users <= args.legacy_max else [])
+        for kind in layouts:
+            stats = run_child(kind, users)
+            line = (f"{users:>12,}{kind:>9}{stats['memory'] / 2**20:>8.0f} MB"
+                    f"{stats['memory'] / users:>12.0f}{stats['build']:>8.1f}s")
+            if kind == 'store':
+                line += f"{stats['check_ns']:>8.0f}ns{stats['sweep_ms']:>8.0f}ms"
+            print(line)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
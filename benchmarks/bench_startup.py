@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark bot cold start: import profile and time until updates can be handled
+
+Starts fresh interpreters (in a scratch directory, so no log file or index
+is left behind) and reports:
+
+* the slowest imports under ``import bot``, from ``python -X importtime``;
+* time-to-ready: process spawn until ShazamIOBot is built and its handlers
+  are registered on an Application, which bounds how soon the first update
+  can be handled. The run fails when the median exceeds ``--target-ms``.
+
+Usage: python benchmarks/bench_startup.py [--rounds N] [--target-ms N] [--top N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+READY_SNIPPET = """
+import sys
+import bot
+from telegram.ext import Application
+application = Application.builder().token('123456:TEST').build()
+instance = bot.ShazamIOBot()
+instance.setup_handlers(application)
+print('ready', 'shazamio' in sys.modules, flush=True)
+"""
+
+
+def run_python(args, cwd: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT), PYTHONWARNINGS='ignore')
+    return subprocess.run([sys.executable, *args], cwd=cwd, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_profile(cwd: str):
+    """(module, cumulative us, nesting depth) for every import under ``import bot``"""
+    result = run_python(['-X', 'importtime', '-c', 'import bot'], cwd)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # importtime indents each nesting level by two spaces
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(cumulative), depth))
+    return rows
+
+
+def time_to_ready(cwd: str) -> float:
+    """Seconds from process spawn until the handlers are registered"""
+    start = time.perf_counter()
+    result = run_python(['-c', READY_SNIPPET], cwd)
+    elapsed = time.perf_counter() - start
+    # The bot logs to stdout as well; the marker is the last line
+    marker = result.stdout.strip().splitlines()[-1].split()
+    if marker[0] != 'ready':
+        raise RuntimeError(f"unexpected output: {result.stdout!r}")
+    if marker[1] == 'True':
+        print("⚠️  shazamio was imported during startup")
+    return elapsed
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=1000,
+                        help="fail when the median time-to-ready is above this")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    print("🚀 Bot Cold Start Benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as cwd:
+        rows = import_profile(cwd)
+        total = next(cumulative for name, cumulative, _ in rows if name == 'bot')
+        print(f"import bot: {total / 1000:.1f} ms")
+        print()
+        print(f"{'slowest direct imports of bot':<40}{'cumulative':>12}")
+        direct = sorted((row for row in rows if row[2] == 1), key=lambda row: -row[1])
+        for name, cumulative, _ in direct[:args.top]:
+            print(f"  {name:<38}{cumulative / 1000:>9.1f} ms")
+        print()
+
+        # The first spawn also warms the OS file cache; keep it out of the stats
+        time_to_ready(cwd)
+        timings = [time_to_ready(cwd) for _ in range(args.rounds)]
+
+    median = statistics.median(timings) * 1000
+    print(f"Time to ready: median {median:.0f} ms, best {min(timings) * 1000:.0f} ms, "
+          f"worst {max(timings) * 1000:.0f} ms over {args.rounds} runs")
+
+    if median > args.target_ms:
+        print(f"❌ Above the {args.target_ms:.0f} ms target")
+        return 1
+    print(f"✅ Within the {args.target_ms:.0f} ms target")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
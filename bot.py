@@ -4,12 +4,16 @@ ShazamIO Telegram Bot
 A powerful music identification and search bot for Telegram
 """
 
+import time
+
+# Reference point for the startup timings logged below
+STARTED_AT = time.perf_counter()
+
 import asyncio
 import logging
 import os
-import sys
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union
+import signal
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple, Union
 from io import BytesIO
 
 from telegram import (
@@ -22,6 +26,8 @@ from telegram import (
     Audio,
     Voice,
     Document,
+    Video,
+    VideoNote,
     BotCommand,
     BotCommandScopeDefault,
 )
@@ -32,105 +38,583 @@ from telegram.ext import (
     InlineQueryHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters,
     ConversationHandler,
 )
 from telegram.error import TelegramError
 
-from shazamio import Shazam, Serialize
 import json
 
+# shazamio (and the aiohttp stack under it) is the slowest import by far,
+# so it is loaded on first use or by the background warm-up after startup
+if TYPE_CHECKING:
+    import aiohttp
+    from shazamio import Shazam
+
+    from audio_gate import AudioGate
+    from fingerprint import FingerprintEngine
+    from fingerprint_index import FingerprintIndex
+    from near_duplicates import NearDuplicateIndex, PerceptualHasher
+    from search_index import TrackSearchIndex
+    from slice_recognition import SlicePlanner, SliceRecognizer, StrategyStats
+
 # Import configuration
+import config
 from config import *
 
-# Set up logging
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(LOG_FILE) if LOG_FILE else logging.NullHandler()
-    ]
+from inline_pages import InlinePageCache
+from downloads import (
+    BufferPool,
+    DownloadTooLarge,
+    STREAMABLE_FORMATS,
+    estimate_download_limit,
+    stream_download,
+)
+from audio_formats import SNIFF_BYTES, UnsupportedFormatError, is_candidate_mime, sniff_format
+from audio_extract import SAMPLE_RATE, AudioExtractor, cleanup_temp_files, pcm_to_wav
+from cache import TTLCache
+from media_group import MediaGroupCollector
+from i18n import ERROR_IDS, CatalogError, MessageCatalog, Msg
+from sessions import NO_LANGUAGE, SessionStore
+from lifecycle import DrainingUpdateProcessor, Lifecycle
+from loop_watchdog import LoopWatchdog
+from log_pipeline import new_trace_id, setup_logging
+from settings import (
+    CATALOG_SETTINGS,
+    HANDLER_SETTINGS,
+    INLINE_SETTINGS,
+    Settings,
+    SettingsError,
+    read_config,
+    restart_required,
+)
+from upstream import CALL_CLASSES, LimitedShazam, wrap_client
+from client_pool import ClientPool, PoolMember, client_factory
+from adaptive_limit import AdaptiveLimiter
+from priority import BACKGROUND, COMMAND, INLINE, RECOGNITION, LaneScheduler, lane, parse_lanes, single_lane
+from artists import ArtistCache
+
+# Set up logging: handlers only queue records, a background thread writes them
+log_pipeline = setup_logging(
+    LOG_LEVEL,
+    LOG_FILE,
+    json_file=LOG_JSON,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    queue_size=LOG_QUEUE_SIZE,
+    repeat_window=LOG_REPEAT_WINDOW,
+    repeat_burst=LOG_REPEAT_BURST,
 )
 logger = logging.getLogger(__name__)
 
-# Rate limiting storage
-user_requests: Dict[int, List[datetime]] = {}
+def get_serializer():
+    """shazamio's Serialize helpers, imported on first use"""
+    from shazamio import Serialize
+    return Serialize
 
 class ShazamIOBot:
     def __init__(self):
-        self.shazam = Shazam()
-        self.user_languages: Dict[int, str] = {}
-        self.user_data: Dict[int, Dict] = {}
+        self._shazam: Optional['Shazam'] = None
+        self.first_update_seen = False
+        # Settings that /reload and SIGHUP can change; the rest are read once
+        self.config_values = {name: value for name, value in vars(config).items() if name.isupper()}
+        self.settings = Settings(self.config_values)
+        self._reload_lock: Optional[asyncio.Lock] = None
+        self.application: Optional[Application] = None
+        self.catalog = self.build_catalog(self.settings)
+        # Per-user language and rate-limit state
+        self.sessions = SessionStore(
+            self.catalog.languages,
+            rate_limit=self.settings.max_requests_per_minute,
+            idle_seconds=SESSION_IDLE_SECONDS,
+            database=DATABASE_FILE if ENABLE_DATABASE and DATABASE_FILE else None,
+        )
+        self.eviction_task: Optional[asyncio.Task] = None
+        self.lifecycle = Lifecycle(CHECKPOINT_FILE, drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        self.language_keyboard = self.build_language_keyboard(self.settings)
+        self.inline_pages = self.build_inline_pages(self.settings)
+        self.buffer_pool = BufferPool(
+            budget=DOWNLOAD_MEMORY_BUDGET,
+            chunk_size=DOWNLOAD_CHUNK_SIZE,
+            max_idle=DOWNLOAD_MAX_IDLE_BUFFERS,
+        )
+        self.http_session: Optional['aiohttp.ClientSession'] = None
+        self.audio_extractor = AudioExtractor(workers=AUDIO_EXTRACT_WORKERS, ffmpeg=FFMPEG_BINARY)
+        self.recognition_cache = TTLCache(RECOGNITION_CACHE_SIZE, RECOGNITION_CACHE_TTL)
+        self.artists = ArtistCache(
+            self.search_artist,
+            self.fetch_artist_profile,
+            ARTIST_CACHE_SIZE,
+            ttl=ARTIST_CACHE_TTL,
+            name_ttl=ARTIST_NAME_TTL,
+            miss_ttl=ARTIST_MISS_TTL,
+        )
+        self.warm_task: Optional[asyncio.Task] = None
+        self.media_groups = MediaGroupCollector(MEDIA_GROUP_DELAY, self.process_media_group)
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        # Update slots and queued upstream calls are shared out by priority lane
+        self.update_slots = LaneScheduler(
+            MAX_CONCURRENT_UPDATES, parse_lanes(PRIORITY_LANES)
+        ) if ENABLE_PRIORITY_LANES else single_lane(MAX_CONCURRENT_UPDATES)
+        # Adaptive limiters by name: "<class>", or "<client>/<class>" in a client pool
+        self.upstream_limiters: Dict[str, AdaptiveLimiter] = {}
+        
+        # NumPy and the audio analysis modules are only imported for the
+        # features that use them, so a bot without them starts faster
+        self.track_index: Optional['TrackSearchIndex'] = None
+        if ENABLE_LOCAL_SEARCH:
+            from search_index import TrackSearchIndex
+            self.track_index = TrackSearchIndex(
+                LOCAL_SEARCH_MAX_TRACKS,
+                min_score=LOCAL_SEARCH_MIN_SCORE,
+            )
+        self.fingerprint_engine: Optional['FingerprintEngine'] = None
+        self.local_index: Optional['FingerprintIndex'] = None
+        self.perceptual_hasher: Optional['PerceptualHasher'] = None
+        self.near_duplicates: Optional['NearDuplicateIndex'] = None
+        if ENABLE_LOCAL_INDEX or ENABLE_NEAR_DUPLICATES:
+            from fingerprint import ENGINE_VERSION, FingerprintEngine
+            self.fingerprint_engine = FingerprintEngine()
+        if ENABLE_LOCAL_INDEX:
+            from fingerprint_index import FingerprintIndex
+            self.local_index = FingerprintIndex(
+                LOCAL_INDEX_DIR,
+                min_matches=LOCAL_INDEX_MIN_MATCHES,
+                compact_threshold=LOCAL_INDEX_COMPACT_THRESHOLD,
+                version=ENGINE_VERSION,
+            )
+        if ENABLE_NEAR_DUPLICATES:
+            from near_duplicates import NearDuplicateIndex, PerceptualHasher
+            self.perceptual_hasher = PerceptualHasher(
+                self.fingerprint_engine, silence_db=NEAR_DUPLICATE_SILENCE_DB
+            )
+            self.near_duplicates = NearDuplicateIndex(
+                NEAR_DUPLICATE_WINDOW,
+                max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+            )
+        self.audio_gate: Optional['AudioGate'] = None
+        if ENABLE_AUDIO_GATE:
+            from audio_gate import AudioGate
+            self.audio_gate = AudioGate(
+                sample_rate=SAMPLE_RATE,
+                seconds=AUDIO_GATE_SECONDS,
+                silence_db=AUDIO_GATE_SILENCE_DB,
+                max_flatness=AUDIO_GATE_MAX_FLATNESS,
+                reject_speech=AUDIO_GATE_REJECT_SPEECH,
+            )
+        self.slice_stats: Optional['StrategyStats'] = None
+        self.slice_planner: Optional['SlicePlanner'] = None
+        self.slice_recognizer: Optional['SliceRecognizer'] = None
+        if ENABLE_MULTI_SLICE:
+            from slice_recognition import SlicePlanner, SliceRecognizer, StrategyStats
+            self.slice_stats = StrategyStats(MULTI_SLICE_STATS_FILE or None)
+            self.slice_planner = SlicePlanner(SAMPLE_RATE, slice_seconds=MULTI_SLICE_SECONDS)
+            self.slice_recognizer = SliceRecognizer(
+                self.recognize_pcm,
+                self.slice_stats,
+                concurrency=MULTI_SLICE_CONCURRENCY,
+                max_attempts=MULTI_SLICE_MAX_ATTEMPTS,
+                timeout=MULTI_SLICE_TIMEOUT,
+            )
+        self.loop_watchdog = LoopWatchdog(
+            threshold=LOOP_WATCHDOG_THRESHOLD,
+            interval=LOOP_WATCHDOG_INTERVAL,
+            strict=LOOP_WATCHDOG_STRICT,
+        ) if ENABLE_LOOP_WATCHDOG else None
+        
+    @property
+    def shazam(self) -> 'Shazam':
+        """Shazam client (or pool of clients), created (and shazamio imported) on first use"""
+        if self._shazam is None:
+            # A replayed fixture answers for every client, so there is only one
+            specs = [] if SHAZAM_REPLAY_FILE else SHAZAM_CLIENTS
+            if len(specs) > 1:
+                names = [spec.get('name') or f"client{i}" for i, spec in enumerate(specs)]
+                self._shazam = self.build_client_pool({
+                    name: self.limit_upstream(self.create_client(spec), name)
+                    for name, spec in zip(names, specs)
+                })
+            else:
+                self._shazam = self.limit_upstream(self.create_client(specs[0] if specs else {}))
+        return self._shazam
+    
+    @property
+    def reload_lock(self) -> asyncio.Lock:
+        """Lock serializing reloads, created inside the running loop
+        
+        On Python 3.8/3.9 asyncio primitives bind to the loop current when
+        they are created, and the bot is built before asyncio.run().
+        """
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        return self._reload_lock
+    
+    @property
+    def batch_slots(self) -> asyncio.Semaphore:
+        """Slots shared by the files of all media groups, created inside the running loop"""
+        if self._batch_slots is None:
+            self._batch_slots = asyncio.Semaphore(MEDIA_GROUP_CONCURRENCY)
+        return self._batch_slots
+    
+    @staticmethod
+    def create_client(spec: Dict):
+        """A Shazam client configured by a SHAZAM_CLIENTS entry: replayed, recording, or real"""
+        return wrap_client(
+            client_factory(spec),
+            record_file=SHAZAM_RECORD_FILE,
+            replay_file=SHAZAM_REPLAY_FILE,
+            latency_scale=SHAZAM_REPLAY_LATENCY_SCALE,
+        )
+    
+    def build_client_pool(self, clients: Dict[str, object]) -> ClientPool:
+        """Balance Shazam calls over several named clients, ejecting the failing ones"""
+        return ClientPool(
+            [PoolMember(name, client) for name, client in clients.items()],
+            balance=SHAZAM_POOL_BALANCE,
+            max_failures=SHAZAM_POOL_MAX_FAILURES,
+            eject_seconds=SHAZAM_POOL_EJECT_SECONDS,
+            max_ejected=SHAZAM_POOL_MAX_EJECTED,
+        )
+    
+    def limit_upstream(self, client, member: Optional[str] = None):
+        """Put a Shazam client behind its own adaptive per-class concurrency limits"""
+        if not ENABLE_ADAPTIVE_CONCURRENCY:
+            return client
+        limiters = {}
+        for call_class in sorted(set(CALL_CLASSES.values())):
+            name = f"{member}/{call_class}" if member else call_class
+            if name not in self.upstream_limiters:
+                self.upstream_limiters[name] = AdaptiveLimiter(
+                    name,
+                    initial_limit=UPSTREAM_INITIAL_LIMIT,
+                    min_limit=UPSTREAM_MIN_LIMIT,
+                    max_limit=UPSTREAM_MAX_LIMIT,
+                    tolerance=UPSTREAM_LATENCY_TOLERANCE,
+                    # Upstream calls are short, so lanes only get weights there, not caps
+                    lanes=parse_lanes(PRIORITY_LANES, shares=False) if ENABLE_PRIORITY_LANES else None,
+                )
+            limiters[call_class] = self.upstream_limiters[name]
+        return LimitedShazam(client, limiters)
+    
+    def metrics(self) -> Dict[str, Dict]:
+        """Adaptive upstream limits, update slots per lane, loop lag, logging and Shazam client health"""
+        return {
+            'upstream': {name: limiter.snapshot() for name, limiter in self.upstream_limiters.items()},
+            'lanes': self.update_slots.snapshot(),
+            'loop': self.loop_watchdog.snapshot() if self.loop_watchdog is not None else {},
+            'logging': log_pipeline.snapshot(),
+            'clients': self._shazam.snapshot() if isinstance(self._shazam, ClientPool) else {},
+        }
+    
+    @staticmethod
+    def classify_update(update: object) -> str:
+        """Priority lane of an update: inline query, recognition or command"""
+        if not isinstance(update, Update):
+            return COMMAND
+        if update.inline_query:
+            return INLINE
+        message = update.message
+        if message and (message.audio or message.voice or message.document
+                        or message.video or message.video_note):
+            return RECOGNITION
+        return COMMAND
+    
+    @staticmethod
+    def describe_update(update: object) -> Dict:
+        """Log context of an update: user, handler and a trace id for its records"""
+        if not isinstance(update, Update):
+            return {'trace_id': new_trace_id()}
+        if update.inline_query:
+            handler = 'inline'
+        elif update.callback_query:
+            handler = 'callback'
+        else:
+            message = update.effective_message
+            text = (message.text or '') if message else ''
+            if text.startswith('/'):
+                handler = text.split()[0].split('@')[0][1:] or 'command'
+            elif message and message.voice:
+                handler = 'voice'
+            elif message and (message.audio or message.document or message.video or message.video_note):
+                handler = 'audio'
+            else:
+                handler = 'message'
+        user = update.effective_user
+        return {
+            'user_id': user.id if user else None,
+            'handler': handler,
+            'trace_id': new_trace_id(),
+        }
+    
+    def build_update_processor(self) -> DrainingUpdateProcessor:
+        """Update processor that drains on shutdown, schedules updates by lane and tags their logs"""
+        return DrainingUpdateProcessor(
+            self.lifecycle, MAX_CONCURRENT_UPDATES, self.update_slots, self.classify_update,
+            describe=self.describe_update,
+        )
+    
+    def get_http_session(self) -> 'aiohttp.ClientSession':
+        """Get the shared HTTP session used for file downloads"""
+        if self.http_session is None or self.http_session.closed:
+            import aiohttp
+            self.http_session = aiohttp.ClientSession()
+        return self.http_session
+    
+    def warm_up(self):
+        """Import the lazily loaded dependencies ahead of the first recognition"""
+        started = time.perf_counter()
+        get_serializer()
+        import aiohttp  # noqa: F401
+        logger.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+    
+    async def warm_caches(self):
+        """Load shazamio off the event loop, then fetch the charts ahead of /artist and inline queries"""
+        await asyncio.get_running_loop().run_in_executor(None, self.warm_up)
+        warm_artists = ARTIST_WARM_COUNT and self.settings.enable_artist_info
+        if not warm_artists and self.track_index is None:
+            return
+        
+        with lane(BACKGROUND):
+            try:
+                results = await self.shazam.top_world_tracks(limit=100)
+                tracks = (results or {}).get('tracks', [])
+                self.index_tracks(tracks)
+                if not warm_artists:
+                    return
+                warmed = await self.artists.warm(tracks, ARTIST_WARM_COUNT)
+            except Exception as e:
+                logger.warning(f"Could not warm the caches from the charts: {e}")
+                return
+        logger.info(f"Artist cache warmed with {warmed} chart artists")
+    
+    async def track_first_update(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Log how long after startup the first update arrived"""
+        if not self.first_update_seen:
+            self.first_update_seen = True
+            logger.info(f"First update received {time.perf_counter() - STARTED_AT:.3f}s after start")
+    
+    async def load_session(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Load the sender's stored language off the loop before any handler reads it"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            await self.sessions.load(user.id)
+    
+    @staticmethod
+    def build_catalog(settings: Settings) -> MessageCatalog:
+        """Compile the message tables from config, failing fast on missing translations"""
+        messages = {
+            Msg.INLINE_DESCRIPTION: settings.inline_description,
+            Msg.START: settings.start_message,
+            Msg.HELP: settings.help_message,
+            Msg.ABOUT: settings.bot_about_text,
+            Msg.MEDIA_GROUP_PROCESSING: settings.media_group_processing_message,
+            Msg.MEDIA_GROUP_SUMMARY: settings.media_group_summary_message,
+            Msg.MEDIA_GROUP_NOT_RECOGNIZED: settings.media_group_not_recognized,
+            Msg.MEDIA_GROUP_ITEM_FAILED: settings.media_group_item_failed,
+        }
+        for error_key, message_id in ERROR_IDS.items():
+            messages[message_id] = {
+                lang: table[error_key] for lang, table in settings.error_messages.items() if error_key in table
+            }
         
+        return MessageCatalog(
+            messages,
+            languages=settings.language_names,
+            default_language=settings.default_language,
+            constants={'bot_username': settings.bot_username},
+        )
+    
+    @staticmethod
+    def build_language_keyboard(settings: Settings) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton(name, callback_data=f"lang_{code}")
+            for code, name in settings.language_names.items()
+        ]])
+    
+    def build_inline_pages(self, settings: Settings) -> InlinePageCache:
+        return InlinePageCache(
+            fetcher=self.fetch_inline_page,
+            page_size=settings.max_inline_results,
+            max_pages=settings.inline_max_pages,
+            max_queries=INLINE_CURSOR_CACHE_SIZE,
+            ttl=settings.inline_cursor_ttl,
+        )
+    
     def get_user_language(self, user_id: int) -> str:
         """Get user's preferred language or default"""
-        return self.user_languages.get(user_id, DEFAULT_LANGUAGE)
+        return self.catalog.languages[self.get_language_index(user_id)]
+    
+    def get_language_index(self, user_id: int) -> int:
+        """Catalog column of the user's preferred language"""
+        language = self.sessions.language(user_id)
+        return self.catalog.default_index if language == NO_LANGUAGE else language
     
     def set_user_language(self, user_id: int, language: str):
         """Set user's preferred language"""
-        self.user_languages[user_id] = language
-    
-    def get_text(self, user_id: int, text_dict: Dict) -> str:
-        """Get text in user's preferred language"""
-        lang = self.get_user_language(user_id)
-        return text_dict.get(lang, text_dict.get('en', ''))
+        self.sessions.set_language(user_id, self.catalog.language_index(language))
     
-    def get_error_text(self, user_id: int, error_key: str) -> str:
-        """Get error message in user's preferred language"""
-        lang = self.get_user_language(user_id)
-        return ERROR_MESSAGES[lang].get(error_key, ERROR_MESSAGES['en'].get(error_key, ''))
+    def get_text(self, user_id: int, message_id: Msg) -> str:
+        """Get a message in user's preferred language"""
+        return self.catalog.get(message_id, self.get_language_index(user_id))
     
     def check_rate_limit(self, user_id: int) -> bool:
         """Check if user is rate limited"""
-        if not ENABLE_RATE_LIMITING:
+        if not self.settings.enable_rate_limiting:
             return True
+        return self.sessions.allow(user_id)
+    
+    async def evict_idle_sessions(self):
+        """Periodically move idle sessions out of memory"""
+        while True:
+            await asyncio.sleep(SESSION_EVICTION_INTERVAL)
+            try:
+                evicted = await self.sessions.evict_idle()
+            except Exception as e:
+                logger.warning(f"Session eviction failed: {e}")
+                continue
+            if evicted:
+                logger.info(f"Evicted {evicted} idle sessions, {len(self.sessions)} active")
+    
+    async def reload_settings(self) -> Tuple[Set[str], List[str]]:
+        """Re-read config.py and apply the reloadable settings that changed
+        
+        Only what depends on a changed setting is rebuilt. Nothing is swapped
+        in unless the whole file is valid. Returns the changed settings and
+        the changed config names that still need a restart.
+        """
+        async with self.reload_lock:
+            # Reading and executing the file is blocking I/O: keep it off the loop
+            values = await asyncio.get_running_loop().run_in_executor(
+                None, read_config, config.__file__
+            )
+            settings = Settings(values)
+            changed = self.settings.changed(settings)
             
-        now = datetime.now()
-        if user_id not in user_requests:
-            user_requests[user_id] = []
-        
-        # Clean old requests (older than 1 minute)
-        user_requests[user_id] = [
-            req_time for req_time in user_requests[user_id]
-            if now - req_time < timedelta(minutes=1)
-        ]
+            # Build everything that can fail before touching the running state
+            catalog = self.build_catalog(settings) if changed & CATALOG_SETTINGS else self.catalog
+            log_level = getattr(logging, settings.log_level, None)
+            if not isinstance(log_level, int):
+                raise SettingsError(f"Unknown LOG_LEVEL {settings.log_level!r}")
+            
+            self.settings = settings
+            if changed & CATALOG_SETTINGS:
+                # Stored language choices are catalog columns; keep them pointing at the same language
+                self.sessions.set_languages(catalog.languages)
+                self.catalog = catalog
+                self.language_keyboard = self.build_language_keyboard(settings)
+            if changed & INLINE_SETTINGS:
+                # Cached pages were cut to the old page size
+                self.inline_pages = self.build_inline_pages(settings)
+            if 'max_requests_per_minute' in changed:
+                self.sessions.set_rate_limit(settings.max_requests_per_minute)
+            if 'log_level' in changed:
+                logging.getLogger().setLevel(log_level)
+            if changed & HANDLER_SETTINGS and self.application is not None:
+                self.register_handlers(self.application)
+                try:
+                    await self.set_bot_commands(self.application)
+                except TelegramError as e:
+                    logger.warning(f"Could not update bot commands: {e}")
+            
+            restart = restart_required(self.config_values, values)
         
-        # Check if user exceeded limit
-        if len(user_requests[user_id]) >= MAX_REQUESTS_PER_MINUTE:
-            return False
+        logger.info(f"Settings reloaded: changed {', '.join(sorted(changed)) or 'nothing'}"
+                    + (f"; restart needed for {', '.join(restart)}" if restart else ""))
+        return changed, restart
+    
+    def request_reload(self):
+        """SIGHUP handler: reload the settings in the background"""
+        logger.info("SIGHUP received, reloading settings")
+        task = asyncio.ensure_future(self.reload_settings())
+        task.add_done_callback(self._log_background_error)
+    
+    async def reload_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /reload command (admins only)"""
+        if update.effective_user.id not in self.settings.admin_user_ids:
+            return
         
-        user_requests[user_id].append(now)
-        return True
+        try:
+            changed, restart = await self.reload_settings()
+        except (SettingsError, CatalogError) as e:
+            logger.warning(f"Settings reload failed: {e}")
+            await update.message.reply_text(f"❌ Reload failed, the current settings stay active:\n{e}")
+            return
+        
+        message = "✅ Settings reloaded\n"
+        message += f"Changed: {', '.join(sorted(changed))}" if changed else "Nothing changed"
+        if restart:
+            message += f"\n⚠️ Restart needed for: {', '.join(restart)}"
+        await update.message.reply_text(message)
+    
+    async def metrics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /metrics command (admins only)"""
+        if update.effective_user.id not in self.settings.admin_user_ids:
+            return
+        
+        metrics = self.metrics()
+        lines = ["📈 Upstream concurrency limits"]
+        for name, stats in metrics['upstream'].items():
+            lines.append(
+                f"{name}: limit {stats['limit']}, {stats['in_flight']} in flight, {stats['queued']} queued, "
+                f"latency {stats['latency_ms']} ms (no-load {stats['min_latency_ms']} ms), "
+                f"{stats['requests']} calls, {stats['errors']} errors"
+            )
+        if not ENABLE_ADAPTIVE_CONCURRENCY:
+            lines.append("Adaptive concurrency is disabled")
+        
+        if metrics['clients']:
+            lines.append("\n🔀 Shazam clients")
+            for name, stats in metrics['clients'].items():
+                state = stats['state']
+                if stats['back_in_s']:
+                    state += f" (back in {stats['back_in_s']:.0f}s)"
+                lines.append(
+                    f"{name}: {state}, {stats['outstanding']} in flight, latency {stats['latency_ms']} ms, "
+                    f"{stats['requests']} calls, {stats['errors']} errors, {stats['ejections']} ejections"
+                )
+        
+        lines.append("\n🚦 Update lanes")
+        for name, stats in metrics['lanes'].items():
+            lines.append(
+                f"{name}: {stats['running']} running, {stats['queued']} queued, "
+                f"{stats['admitted']} admitted, {stats['rejected'] + stats['expired']} shed"
+            )
+        
+        lines.append("\n⏱ Event loop")
+        loop_stats = metrics['loop']
+        if loop_stats:
+            lines.append(
+                f"lag {loop_stats['lag_ms']} ms (max {loop_stats['max_lag_ms']} ms), "
+                f"{loop_stats['stalls']} stalls, {loop_stats['blocked_calls']} blocking calls"
+            )
+            for site, stats in list(loop_stats['sites'].items())[:5]:
+                lines.append(f"{site}: {stats['count']}x, {stats['total_ms']} ms total, max {stats['max_ms']} ms")
+        else:
+            lines.append("Loop watchdog is disabled")
+        
+        log_stats = metrics['logging']
+        lines.append(
+            f"\n📝 Logging: {log_stats['queued']} queued, {log_stats['dropped']} dropped, "
+            f"{log_stats['suppressed']} repeats suppressed"
+        )
+        await update.message.reply_text("\n".join(lines))
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user_id = update.effective_user.id
-        message = self.get_text(user_id, START_MESSAGE).format(
-            bot_username=BOT_USERNAME
-        )
-        
-        # Create language selection keyboard
-        keyboard = [
-            [
-                InlineKeyboardButton("🇺🇸 English", callback_data="lang_en"),
-                InlineKeyboardButton("🇮🇷 فارسی", callback_data="lang_fa")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        message = self.get_text(user_id, Msg.START)
         
         await update.message.reply_text(
             message,
-            reply_markup=reply_markup,
+            reply_markup=self.language_keyboard,
             parse_mode='Markdown'
         )
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
         user_id = update.effective_user.id
-        message = self.get_text(user_id, HELP_MESSAGE).format(
-            bot_username=BOT_USERNAME
-        )
+        message = self.get_text(user_id, Msg.HELP)
         
         await update.message.reply_text(
             message,
@@ -140,27 +624,19 @@ class ShazamIOBot:
     async def about_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /about command"""
         user_id = update.effective_user.id
-        message = self.get_text(user_id, BOT_ABOUT_TEXT)
+        message = self.get_text(user_id, Msg.ABOUT)
         
         await update.message.reply_text(message)
     
     async def language_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /language command"""
-        keyboard = [
-            [
-                InlineKeyboardButton("🇺🇸 English", callback_data="lang_en"),
-                InlineKeyboardButton("🇮🇷 فارسی", callback_data="lang_fa")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         user_id = update.effective_user.id
         current_lang = self.get_user_language(user_id)
-        current_lang_text = "English" if current_lang == 'en' else "فارسی"
+        current_lang_text = self.settings.language_names[current_lang]
         
         message = f"🌐 Current language: {current_lang_text}\n\nPlease select your preferred language:"
         
-        await update.message.reply_text(message, reply_markup=reply_markup)
+        await update.message.reply_text(message, reply_markup=self.language_keyboard)
     
     async def language_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle language selection callback"""
@@ -169,154 +645,474 @@ class ShazamIOBot:
         
         user_id = query.from_user.id
         lang_code = query.data.replace('lang_', '')
+        if lang_code not in self.settings.language_names:
+            return
         
         self.set_user_language(user_id, lang_code)
         
-        lang_text = "English" if lang_code == 'en' else "فارسی"
+        lang_text = self.settings.language_names[lang_code]
         message = f"✅ Language changed to {lang_text}"
         
         await query.edit_message_text(message)
     
+    def get_audio_attachment(self, message: Message) -> Optional[Union[Audio, Voice, Document]]:
+        """Pick the recognizable audio attachment of a message, if any"""
+        audio = message.audio or message.voice
+        
+        # Documents are pre-filtered by MIME type and sniffed later
+        if not audio and message.document and is_candidate_mime(
+            message.document.mime_type,
+            message.document.file_name,
+            self.settings.supported_audio_formats,
+        ):
+            audio = message.document
+        
+        return audio
+    
     async def handle_audio(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle audio file recognition"""
-        if not ENABLE_AUDIO_RECOGNITION:
+        if not self.settings.enable_audio_recognition:
             return
             
         user_id = update.effective_user.id
+        message = update.message
         
-        if not self.check_rate_limit(user_id):
-            error_msg = self.get_error_text(user_id, 'rate_limited')
-            await update.message.reply_text(error_msg)
+        # Check if message has audio
+        audio = self.get_audio_attachment(message)
+        if not audio:
+            error_msg = self.get_text(user_id, Msg.ERROR_UNSUPPORTED_FORMAT)
+            await message.reply_text(error_msg)
             return
         
-        # Check if message has audio
-        audio = None
-        if update.message.audio:
-            audio = update.message.audio
-        elif update.message.voice:
-            audio = update.message.voice
-        elif update.message.document and any(
-            update.message.document.file_name.lower().endswith(ext)
-            for ext in SUPPORTED_AUDIO_FORMATS
-        ):
-            audio = update.message.document
+        if message.media_group_id and self.settings.enable_media_groups:
+            self.media_groups.add(update, context)
+            return
         
-        if not audio:
-            error_msg = self.get_error_text(user_id, 'unsupported_format')
-            await update.message.reply_text(error_msg)
+        if not self.check_rate_limit(user_id):
+            error_msg = self.get_text(user_id, Msg.ERROR_RATE_LIMITED)
+            await message.reply_text(error_msg)
             return
         
         # Check file size
-        if audio.file_size > MAX_AUDIO_FILE_SIZE:
-            error_msg = self.get_error_text(user_id, 'file_too_large')
-            await update.message.reply_text(error_msg)
+        if (audio.file_size or 0) > self.settings.max_audio_file_size:
+            error_msg = self.get_text(user_id, Msg.ERROR_FILE_TOO_LARGE)
+            await message.reply_text(error_msg)
             return
         
-        # Send processing message
-        processing_msg = await update.message.reply_text("🎵 Processing audio file...")
+        cached = self.recognition_cache.get(audio.file_unique_id)
+        if cached:
+            await self.send_track_info(update, cached, user_id)
+            return
         
         try:
-            # Download audio file
             file = await context.bot.get_file(audio.file_id)
-            audio_data = await file.download_as_bytearray()
-            
-            # Save to temporary file
-            temp_file = f"temp_{user_id}_{audio.file_id}.mp3"
-            with open(temp_file, 'wb') as f:
-                f.write(audio_data)
-            
-            # Recognize song
-            result = await self.shazam.recognize(temp_file)
-            
-            # Clean up temp file
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            
-            if result and result.get('track'):
-                track = result['track']
-                await self.send_track_info(update, track, user_id)
-            else:
-                error_msg = self.get_error_text(user_id, 'audio_recognition_failed')
-                await update.message.reply_text(error_msg)
+            media_format, head = await self.probe_audio(file, audio)
+        except Exception as e:
+            logger.error(f"Error probing audio: {e}")
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
+            await message.reply_text(error_msg)
+            return
+        
+        # Reject non-audio documents before downloading the rest of the file
+        if not media_format:
+            error_msg = self.get_text(user_id, Msg.ERROR_UNSUPPORTED_FORMAT)
+            await message.reply_text(error_msg)
+            return
+        
+        # Send processing message
+        processing_msg = await message.reply_text("🎵 Processing audio file...")
+        
+        try:
+            track = await self.recognize_audio(file, audio, media_format, head)
+            await self.reply_recognition(update, user_id, track)
             
             # Delete processing message
             await processing_msg.delete()
             
+        except DownloadTooLarge as e:
+            logger.warning(f"Audio file refused: {e}")
+            error_msg = self.get_text(user_id, Msg.ERROR_FILE_TOO_LARGE)
+            await message.reply_text(error_msg)
+            await processing_msg.delete()
         except Exception as e:
             logger.error(f"Error processing audio: {e}")
-            error_msg = self.get_error_text(user_id, 'api_error')
-            await update.message.reply_text(error_msg)
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
+            await message.reply_text(error_msg)
             await processing_msg.delete()
     
-    async def send_track_info(self, update: Update, track_data: Dict, user_id: int):
-        """Send track information to user"""
+    async def handle_video(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle recognition of music playing in videos and video notes"""
+        if not self.settings.enable_video_recognition:
+            return
+        
+        user_id = update.effective_user.id
+        message = update.message
+        video = message.video or message.video_note
+        
+        if not video:
+            return
+        
+        if message.media_group_id and self.settings.enable_media_groups:
+            self.media_groups.add(update, context)
+            return
+        
+        if not self.check_rate_limit(user_id):
+            error_msg = self.get_text(user_id, Msg.ERROR_RATE_LIMITED)
+            await message.reply_text(error_msg)
+            return
+        
+        # Check file size
+        if (video.file_size or 0) > self.settings.max_video_file_size:
+            error_msg = self.get_text(user_id, Msg.ERROR_FILE_TOO_LARGE)
+            await message.reply_text(error_msg)
+            return
+        
+        cached = self.recognition_cache.get(video.file_unique_id)
+        if cached:
+            await self.send_track_info(update, cached, user_id)
+            return
+        
+        # Send processing message
+        processing_msg = await message.reply_text("🎬 Processing video...")
+        
         try:
-            serialized = Serialize.track(track_data)
+            file = await context.bot.get_file(video.file_id)
+            track = await self.recognize_video(file, video)
+            await self.reply_recognition(update, user_id, track)
             
-            # Create message
-            title = serialized.title or "Unknown Title"
-            artist = serialized.subtitle or "Unknown Artist"
-            album = serialized.sections.get('metadata', [{}])[0].get('text', 'Unknown Album') if serialized.sections else 'Unknown Album'
-            
-            message = f"🎵 **{title}**\n"
-            message += f"👤 **Artist:** {artist}\n"
-            message += f"💿 **Album:** {album}\n"
-            
-            # Add genres if available
-            if hasattr(serialized, 'genres') and serialized.genres:
-                message += f"🎼 **Genre:** {', '.join(serialized.genres)}\n"
-            
-            # Add year if available
-            if hasattr(serialized, 'year') and serialized.year:
-                message += f"📅 **Year:** {serialized.year}\n"
-            
-            # Add Spotify link if available
-            if hasattr(serialized, 'spotify_url') and serialized.spotify_url:
-                message += f"🎧 [Listen on Spotify]({serialized.spotify_url})\n"
-            
-            # Add Apple Music link if available
-            if hasattr(serialized, 'apple_music_url') and serialized.apple_music_url:
-                message += f"🍎 [Listen on Apple Music]({serialized.apple_music_url})\n"
-            
-            # Add YouTube link if available
-            if hasattr(serialized, 'youtube_url') and serialized.youtube_url:
-                message += f"📺 [Watch on YouTube]({serialized.youtube_url})\n"
-            
-            # Create keyboard with action buttons
-            keyboard = []
-            row = []
-            
-            if hasattr(serialized, 'spotify_url') and serialized.spotify_url:
-                row.append(InlineKeyboardButton("🎧 Spotify", url=serialized.spotify_url))
+            # Delete processing message
+            await processing_msg.delete()
             
-            if hasattr(serialized, 'apple_music_url') and serialized.apple_music_url:
-                row.append(InlineKeyboardButton("🍎 Apple Music", url=serialized.apple_music_url))
+        except DownloadTooLarge as e:
+            logger.warning(f"Video file refused: {e}")
+            error_msg = self.get_text(user_id, Msg.ERROR_FILE_TOO_LARGE)
+            await message.reply_text(error_msg)
+            await processing_msg.delete()
+        except Exception as e:
+            logger.error(f"Error processing video: {e}")
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
+            await message.reply_text(error_msg)
+            await processing_msg.delete()
+    
+    async def process_media_group(self, updates: List[Update], context: ContextTypes.DEFAULT_TYPE):
+        """Recognize every file of a media group and reply with one summary"""
+        # The album is answered as one job, so shutdown drains or checkpoints it whole
+        with self.lifecycle.job(updates):
+            await self.summarize_media_group(updates, context)
+    
+    async def summarize_media_group(self, updates: List[Update], context: ContextTypes.DEFAULT_TYPE):
+        """Recognize the files of a media group and send the summary"""
+        first = updates[0]
+        user_id = first.effective_user.id
+        
+        # A whole album counts as a single request
+        if not self.check_rate_limit(user_id):
+            error_msg = self.get_text(user_id, Msg.ERROR_RATE_LIMITED)
+            await first.message.reply_text(error_msg)
+            return
+        
+        processing_msg = await first.message.reply_text(
+            self.get_text(user_id, Msg.MEDIA_GROUP_PROCESSING).format(count=len(updates))
+        )
+        
+        # Identical files inside the album share one recognition
+        jobs: Dict[str, asyncio.Task] = {}
+        keys = []
+        for update in updates:
+            attachment = (
+                self.get_audio_attachment(update.message)
+                or update.message.video
+                or update.message.video_note
+            )
+            key = attachment.file_unique_id if attachment else None
+            if key and key not in jobs:
+                jobs[key] = asyncio.ensure_future(self.recognize_group_item(context, attachment))
+            keys.append(key)
+        
+        await asyncio.gather(*jobs.values(), return_exceptions=True)
+        
+        lines = []
+        found = 0
+        for i, key in enumerate(keys, 1):
+            job = jobs.get(key)
+            if job is None or job.exception():
+                if job is not None:
+                    logger.error(f"Error recognizing media group item: {job.exception()}")
+                lines.append(f"{i}. ⚠️ {self.get_text(user_id, Msg.MEDIA_GROUP_ITEM_FAILED)}")
+            elif job.result():
+                found += 1
+                lines.append(f"{i}. {self.format_track_line(job.result())}")
+            else:
+                lines.append(f"{i}. ❌ {self.get_text(user_id, Msg.MEDIA_GROUP_NOT_RECOGNIZED)}")
+        
+        message = self.get_text(user_id, Msg.MEDIA_GROUP_SUMMARY).format(
+            found=found, total=len(keys)
+        )
+        message += "\n".join(lines)
+        
+        try:
+            await first.message.reply_text(message, parse_mode='Markdown')
+        finally:
+            await processing_msg.delete()
+    
+    async def recognize_group_item(self, context: ContextTypes.DEFAULT_TYPE, attachment) -> Optional[Dict]:
+        """Recognize one file of a media group under the shared batch budget"""
+        cached = self.recognition_cache.get(attachment.file_unique_id)
+        if cached:
+            return cached
+        
+        is_video = isinstance(attachment, (Video, VideoNote))
+        max_size = self.settings.max_video_file_size if is_video else self.settings.max_audio_file_size
+        if (attachment.file_size or 0) > max_size:
+            raise UnsupportedFormatError("file too large")
+        
+        async with self.batch_slots:
+            file = await context.bot.get_file(attachment.file_id)
+            if is_video:
+                return await self.recognize_video(file, attachment)
             
-            if row:
-                keyboard.append(row)
+            media_format, head = await self.probe_audio(file, attachment)
+            if not media_format:
+                raise UnsupportedFormatError("not an audio file")
+            return await self.recognize_audio(file, attachment, media_format, head)
+    
+    async def recognize_audio(self, file, audio: Union[Audio, Voice, Document],
+                              media_format: str, head: bytes = b'') -> Optional[Dict]:
+        """Download just enough of an audio file and recognize it"""
+        # Stream only as much of the file as recognition needs
+        limit = estimate_download_limit(
+            audio.file_size or self.settings.max_audio_file_size,
+            getattr(audio, 'duration', None),
+            self.settings.recognition_window_seconds,
+            media_format in STREAMABLE_FORMATS,
+        )
+        
+        # Recognition runs under the lease, so the pool budget bounds the memory
+        # of every upload in progress; the bytes sent upstream are a copy of
+        # the buffer (shazamio wants bytes), so the lease makes room for both
+        async with self.buffer_pool.lease(2 * limit) as buffer:
+            size = await self.download_into(file, buffer, limit, head)
+            data = bytes(memoryview(buffer)[:size])
             
-            # Add similar songs button
-            keyboard.append([InlineKeyboardButton("🎵 Similar Songs", callback_data=f"similar_{track_data.get('key', '')}")])
+            # The local stages work on decoded audio; upstream still gets the original bytes
+            pcm = None
+            if (self.audio_gate is not None or self.local_index is not None
+                    or self.near_duplicates is not None):
+                try:
+                    pcm = await self.decode_window(data, media_format)
+                except Exception as e:
+                    logger.warning(f"Could not decode audio for local matching: {e}")
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            return await self.recognize_clip(audio.file_unique_id, data, pcm)
+    
+    async def recognize_video(self, file, video: Union[Video, VideoNote]) -> Optional[Dict]:
+        """Extract the audio track of a video and recognize it"""
+        # Video containers can't be truncated, but only the window is decoded
+        async with self.buffer_pool.lease(video.file_size or self.settings.max_video_file_size) as buffer:
+            size = await self.download_into(file, buffer, len(buffer))
+            pcm = await self.audio_extractor.extract(
+                memoryview(buffer)[:size], window_seconds=self.settings.recognition_window_seconds
+            )
+        
+        if not pcm:
+            return None
+        
+        return await self.recognize_clip(video.file_unique_id, None, pcm)
+    
+    async def recognize_clip(self, file_unique_id: str, data: Optional[bytes],
+                             pcm: Optional[bytes]) -> Optional[Dict]:
+        """Recognize a clip, trying near-duplicates and the local index before Shazam
+        
+        ``data`` is the original file sent upstream; when it is None the decoded
+        ``pcm`` is wrapped as WAV instead.
+        """
+        loop = asyncio.get_running_loop()
+        
+        # Silence, noise and speech-only clips would only fail upstream
+        if self.audio_gate is not None and pcm:
+            gate = await loop.run_in_executor(None, self.audio_gate.check, pcm)
+            if not gate.passed:
+                logger.info(f"Audio gate rejected {file_unique_id}: {gate}")
+                return None
+            if gate.trim_bytes:
+                # Send the trimmed clip upstream instead of the original file
+                pcm, data = pcm[gate.trim_bytes:], None
+        
+        # A re-encoded copy of a recent upload reuses its result, misses included
+        bits = None
+        if self.near_duplicates is not None and pcm:
+            bits = await loop.run_in_executor(None, self.perceptual_hasher.hash_pcm, pcm)
+            if bits is not None:
+                duplicate = self.near_duplicates.find(bits)
+                if duplicate is not None:
+                    logger.info(f"Reusing the recognition of a near-duplicate clip for {file_unique_id}")
+                    return self.remember_recognition(file_unique_id, {'track': duplicate.track})
+        
+        # Try the local fingerprint index before going upstream
+        landmarks = None
+        if self.local_index is not None and pcm:
+            track, landmarks = await self.match_locally(pcm)
+            if track:
+                self.remember_near_duplicate(bits, track)
+                return self.remember_recognition(file_unique_id, {'track': track})
+        
+        # Recognize song
+        started = loop.time()
+        result = await self.shazam.recognize(data if data is not None else pcm_to_wav(pcm))
+        matched = bool(result and result.get('track'))
+        
+        # A miss on the whole clip gets another chance on its most promising slices
+        if self.slice_stats is not None:
+            self.slice_stats.record('full', matched, loop.time() - started)
+        if not matched and self.slice_recognizer is not None and pcm:
+            result = await self.recognize_slices(file_unique_id, pcm)
+        
+        track = self.remember_recognition(file_unique_id, result)
+        self.index_locally(track, landmarks)
+        self.remember_near_duplicate(bits, track)
+        return track
+    
+    async def recognize_slices(self, file_unique_id: str, pcm: bytes) -> Optional[Dict]:
+        """Retry recognition on slices of the clip, best strategies first"""
+        from slice_recognition import STRATEGIES
+        
+        loop = asyncio.get_running_loop()
+        strategies = self.slice_stats.rank(STRATEGIES)
+        slices = await loop.run_in_executor(None, self.slice_planner.plan, pcm, strategies)
+        
+        result, matched = await self.slice_recognizer.first_match(pcm, slices)
+        if matched is not None:
+            logger.info(f"Recognized {file_unique_id} from the {matched.strategy} slice")
+        return result
+    
+    async def recognize_pcm(self, pcm: bytes) -> Optional[Dict]:
+        """Recognize raw decoded audio with Shazam"""
+        return await self.shazam.recognize(pcm_to_wav(pcm))
+    
+    async def decode_window(self, data: bytes, media_format: str) -> bytes:
+        """Decode the recognition window of an audio file to PCM"""
+        window = self.settings.recognition_window_seconds
+        if media_format in STREAMABLE_FORMATS:
+            return await self.audio_extractor.decode(data, window_seconds=window)
+        return await self.audio_extractor.extract(data, window_seconds=window)
+    
+    async def match_locally(self, pcm: bytes):
+        """Look decoded audio up in the local fingerprint index
+        
+        Returns the matched track (or None) and the clip's landmarks so a later
+        upstream match can be indexed without fingerprinting twice.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            landmarks = await loop.run_in_executor(None, self.fingerprint_engine.fingerprint_pcm, pcm)
+            track = await loop.run_in_executor(None, self.local_index.lookup, *landmarks)
+        except Exception as e:
+            logger.warning(f"Local fingerprint lookup failed: {e}")
+            return None, None
+        
+        if track:
+            logger.info(f"Recognized {track.get('key')} from the local index")
+        return track, landmarks
+    
+    def index_locally(self, track: Optional[Dict], landmarks):
+        """Add an upstream match to the local fingerprint index in the background"""
+        if self.local_index is None or not track or landmarks is None:
+            return
+        
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self.local_index.add, track, *landmarks)
+        future.add_done_callback(self._log_background_error)
+    
+    @staticmethod
+    def _log_background_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            logger.warning(f"Background task failed: {future.exception()}")
+    
+    def remember_near_duplicate(self, bits, track: Optional[Dict]):
+        """Remember the outcome for a perceptual hash so re-encoded copies can reuse it"""
+        if self.near_duplicates is not None and bits is not None:
+            self.near_duplicates.add(bits, track)
+    
+    def remember_recognition(self, file_unique_id: str, result: Optional[Dict]) -> Optional[Dict]:
+        """Cache a successful match by file and return the matched track"""
+        track = result.get('track') if result else None
+        if track:
+            self.recognition_cache.set(file_unique_id, track)
+            self.index_tracks([track])
+        return track
+    
+    def index_tracks(self, tracks: List[Dict]):
+        """Add tracks to the local search index behind inline queries"""
+        if self.track_index is None:
+            return
+        for track in tracks:
+            try:
+                self.track_index.add(track)
+            except Exception as e:
+                logger.debug(f"Could not index track {track.get('key')}: {e}")
+    
+    def format_track_line(self, track: Dict) -> str:
+        """Format a track as a one-line summary"""
+        serialized = get_serializer().track(track)
+        title = serialized.title or "Unknown Title"
+        artist = serialized.subtitle or "Unknown Artist"
+        return f"**{title}** - {artist}"
+    
+    async def reply_recognition(self, update: Update, user_id: int, track: Optional[Dict]):
+        """Send the outcome of a recognition to the user"""
+        if track:
+            await self.send_track_info(update, track, user_id)
+        else:
+            error_msg = self.get_text(user_id, Msg.ERROR_AUDIO_RECOGNITION_FAILED)
+            await update.message.reply_text(error_msg)
+    
+    async def probe_audio(self, file, audio: Union[Audio, Voice, Document]):
+        """Sniff the container format from the first bytes of a file
+        
+        Returns the detected format (None for non-audio) and the sniffed head,
+        which is reused as the start of the full download.
+        """
+        if isinstance(audio, Voice):
+            # Voice messages are always Opus in an Ogg container
+            return 'opus', b''
+        
+        head = bytearray(SNIFF_BYTES)
+        size = await stream_download(
+            self.get_http_session(), file.file_path, head, SNIFF_BYTES, DOWNLOAD_CHUNK_SIZE
+        )
+        head = bytes(head[:size])
+        return sniff_format(head), head
+    
+    async def download_into(self, file, buffer: bytearray, limit: int, head: bytes = b'') -> int:
+        """Download a file into a pooled buffer, continuing after an already fetched head"""
+        limit = min(limit, len(buffer))
+        done = min(len(head), limit)
+        buffer[:done] = head[:done]
+        
+        if done >= limit or (head and len(head) < SNIFF_BYTES):
+            # The head already covered the whole file
+            return done
+        
+        with memoryview(buffer) as view:
+            size = await stream_download(
+                self.get_http_session(), file.file_path, view[done:], limit - done,
+                DOWNLOAD_CHUNK_SIZE, start=done,
+            )
+        return done + size
+    
+    async def send_track_info(self, update: Update, track_data: Dict, user_id: int):
+        """Send track information to user"""
+        try:
+            message, reply_markup, image_url = self.build_track_card(track_data)
             
             # Add album art if available
-            if hasattr(serialized, 'images') and serialized.images:
-                # Get the largest image
-                image_url = max(serialized.images, key=lambda x: x.get('width', 0)).get('url', '')
-                if image_url:
-                    await update.message.reply_photo(
-                        photo=image_url,
-                        caption=message,
-                        reply_markup=reply_markup,
-                        parse_mode='Markdown'
-                    )
-                else:
-                    await update.message.reply_text(
-                        message,
-                        reply_markup=reply_markup,
-                        parse_mode='Markdown'
-                    )
+            if image_url:
+                await update.message.reply_photo(
+                    photo=image_url,
+                    caption=message,
+                    reply_markup=reply_markup,
+                    parse_mode='Markdown'
+                )
             else:
                 await update.message.reply_text(
                     message,
@@ -326,12 +1122,75 @@ class ShazamIOBot:
                 
         except Exception as e:
             logger.error(f"Error sending track info: {e}")
-            error_msg = self.get_error_text(user_id, 'api_error')
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
             await update.message.reply_text(error_msg)
     
+    def build_track_card(self, track_data: Dict):
+        """Build the Markdown text, keyboard and album art URL ('' if none) for a track"""
+        serialized = get_serializer().track(track_data)
+        
+        # Create message
+        title = serialized.title or "Unknown Title"
+        artist = serialized.subtitle or "Unknown Artist"
+        # The album is in the metadata of the song section
+        album = next((
+            meta.text
+            for section in serialized.sections or []
+            if getattr(section, 'type', None) == 'SONG'
+            for meta in section.metadata
+            if meta.title == 'Album'
+        ), 'Unknown Album')
+        
+        message = f"🎵 **{title}**\n"
+        message += f"👤 **Artist:** {artist}\n"
+        message += f"💿 **Album:** {album}\n"
+        
+        # Add genres if available
+        if hasattr(serialized, 'genres') and serialized.genres:
+            message += f"🎼 **Genre:** {', '.join(serialized.genres)}\n"
+        
+        # Add year if available
+        if hasattr(serialized, 'year') and serialized.year:
+            message += f"📅 **Year:** {serialized.year}\n"
+        
+        # Add Spotify link if available
+        if hasattr(serialized, 'spotify_url') and serialized.spotify_url:
+            message += f"🎧 [Listen on Spotify]({serialized.spotify_url})\n"
+        
+        # Add Apple Music link if available
+        if hasattr(serialized, 'apple_music_url') and serialized.apple_music_url:
+            message += f"🍎 [Listen on Apple Music]({serialized.apple_music_url})\n"
+        
+        # Add YouTube link if available
+        if hasattr(serialized, 'youtube_url') and serialized.youtube_url:
+            message += f"📺 [Watch on YouTube]({serialized.youtube_url})\n"
+        
+        # Create keyboard with action buttons
+        keyboard = []
+        row = []
+        
+        if hasattr(serialized, 'spotify_url') and serialized.spotify_url:
+            row.append(InlineKeyboardButton("🎧 Spotify", url=serialized.spotify_url))
+        
+        if hasattr(serialized, 'apple_music_url') and serialized.apple_music_url:
+            row.append(InlineKeyboardButton("🍎 Apple Music", url=serialized.apple_music_url))
+        
+        if row:
+            keyboard.append(row)
+        
+        # Add similar songs button
+        keyboard.append([InlineKeyboardButton("🎵 Similar Songs", callback_data=f"similar_{track_data.get('key', '')}")])
+        
+        image_url = ''
+        if hasattr(serialized, 'images') and serialized.images:
+            # Get the largest image
+            image_url = max(serialized.images, key=lambda x: x.get('width', 0)).get('url', '')
+        
+        return message, InlineKeyboardMarkup(keyboard), image_url
+    
     async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle inline queries"""
-        if not ENABLE_INLINE_MODE:
+        if not self.settings.enable_inline_mode:
             return
             
         query = update.inline_query
@@ -343,63 +1202,96 @@ class ShazamIOBot:
         if not self.check_rate_limit(user_id):
             return
         
+        offset = self.inline_pages.parse_offset(query.offset)
+        
         try:
-            # Search for tracks
-            results = await self.shazam.search_track(query=query.query, limit=MAX_INLINE_RESULTS)
+            # Only the first page (no offset at all) is tried locally
+            tracks = self.search_local(query.query) if not query.offset else []
+            if tracks:
+                # Scrolling on continues with Shazam's first page
+                next_offset = '0'
+            else:
+                tracks, next_offset = await self.inline_pages.get_page(query.query, offset)
             
-            if not results or not results.get('tracks', {}).get('hits'):
+            if not tracks:
                 return
             
             inline_results = []
             
-            for hit in results['tracks']['hits'][:MAX_INLINE_RESULTS]:
-                track = hit.get('track', {})
-                if not track:
-                    continue
-                
+            for track in tracks:
                 try:
-                    serialized = Serialize.track(track)
-                    
-                    title = serialized.title or "Unknown Title"
-                    artist = serialized.subtitle or "Unknown Artist"
-                    
-                    # Create message content
-                    message_text = f"🎵 **{title}**\n👤 {artist}"
-                    
-                    if hasattr(serialized, 'spotify_url') and serialized.spotify_url:
-                        message_text += f"\n🎧 [Listen on Spotify]({serialized.spotify_url})"
-                    
-                    # Create inline result
-                    result = InlineQueryResultArticle(
-                        id=str(track.get('key', '')),
-                        title=f"{title} - {artist}",
-                        description=f"Track by {artist}",
-                        input_message_content=InputTextMessageContent(
-                            message_text=message_text,
-                            parse_mode='Markdown'
-                        ),
-                        thumb_url=serialized.images[0].get('url', '') if serialized.images else '',
-                        reply_markup=InlineKeyboardMarkup([
-                            [InlineKeyboardButton("🎧 Spotify", url=serialized.spotify_url)] if hasattr(serialized, 'spotify_url') and serialized.spotify_url else [],
-                            [InlineKeyboardButton("🍎 Apple Music", url=serialized.apple_music_url)] if hasattr(serialized, 'apple_music_url') and serialized.apple_music_url else []
-                        ])
-                    )
-                    
-                    inline_results.append(result)
-                    
+                    inline_results.append(self.build_inline_result(track))
                 except Exception as e:
                     logger.error(f"Error processing inline result: {e}")
                     continue
             
             if inline_results:
-                await query.answer(inline_results, cache_time=300)
+                await query.answer(inline_results, cache_time=300, next_offset=next_offset)
                 
         except Exception as e:
             logger.error(f"Error in inline query: {e}")
     
+    def search_local(self, query: str) -> List[Dict]:
+        """Tracks from the local search index, or [] unless the best one clearly is the query
+
+        Generic words ("love", "remix") match many titles but none of them
+        closely, so they are left to Shazam's search.
+        """
+        if self.track_index is None or len(query.strip()) < 3:
+            return []
+        matches = self.track_index.search(query, self.settings.max_inline_results)
+        if not matches:
+            return []
+        best = matches[0][1]
+        runner_up = matches[1][1] if len(matches) > 1 else 0.0
+        if best < LOCAL_SEARCH_CONFIDENT_SCORE or best - runner_up < LOCAL_SEARCH_MIN_MARGIN:
+            return []
+        return [track for track, _ in matches]
+    
+    async def fetch_inline_page(self, query: str, offset: int, limit: int) -> List[Dict]:
+        """Fetch one page of inline search results from Shazam"""
+        results = await self.shazam.search_track(query=query, limit=limit, offset=offset)
+        
+        if not results:
+            return []
+        
+        hits = results.get('tracks', {}).get('hits', [])
+        tracks = [hit['track'] for hit in hits[:limit] if hit.get('track')]
+        self.index_tracks(tracks)
+        return tracks
+    
+    def build_inline_result(self, track: Dict) -> InlineQueryResultArticle:
+        """Build an inline result article for a track"""
+        serialized = get_serializer().track(track)
+        
+        title = serialized.title or "Unknown Title"
+        artist = serialized.subtitle or "Unknown Artist"
+        
+        # Create message content
+        message_text = f"🎵 **{title}**\n👤 {artist}"
+        
+        if hasattr(serialized, 'spotify_url') and serialized.spotify_url:
+            message_text += f"\n🎧 [Listen on Spotify]({serialized.spotify_url})"
+        
+        # Create inline result
+        return InlineQueryResultArticle(
+            id=str(track.get('key', '')),
+            title=f"{title} - {artist}",
+            description=f"Track by {artist}",
+            input_message_content=InputTextMessageContent(
+                message_text=message_text,
+                parse_mode='Markdown'
+            ),
+            thumbnail_url=getattr(serialized, 'photo_url', None),
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🎧 Spotify", url=serialized.spotify_url)] if hasattr(serialized, 'spotify_url') and serialized.spotify_url else [],
+                [InlineKeyboardButton("🍎 Apple Music", url=serialized.apple_music_url)] if hasattr(serialized, 'apple_music_url') and serialized.apple_music_url else []
+            ])
+        )
+    
     async def track_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /track command"""
-        if not ENABLE_TRACK_INFO:
+        if not self.settings.enable_track_info:
             return
             
         if not context.args:
@@ -409,7 +1301,7 @@ class ShazamIOBot:
         user_id = update.effective_user.id
         
         if not self.check_rate_limit(user_id):
-            error_msg = self.get_error_text(user_id, 'rate_limited')
+            error_msg = self.get_text(user_id, Msg.ERROR_RATE_LIMITED)
             await update.message.reply_text(error_msg)
             return
         
@@ -421,22 +1313,23 @@ class ShazamIOBot:
             if results and results.get('tracks', {}).get('hits'):
                 track = results['tracks']['hits'][0].get('track', {})
                 if track:
+                    self.index_tracks([track])
                     await self.send_track_info(update, track, user_id)
                 else:
-                    error_msg = self.get_error_text(user_id, 'no_results')
+                    error_msg = self.get_text(user_id, Msg.ERROR_NO_RESULTS)
                     await update.message.reply_text(error_msg)
             else:
-                error_msg = self.get_error_text(user_id, 'no_results')
+                error_msg = self.get_text(user_id, Msg.ERROR_NO_RESULTS)
                 await update.message.reply_text(error_msg)
                 
         except Exception as e:
             logger.error(f"Error in track command: {e}")
-            error_msg = self.get_error_text(user_id, 'api_error')
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
             await update.message.reply_text(error_msg)
     
     async def artist_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /artist command"""
-        if not ENABLE_ARTIST_INFO:
+        if not self.settings.enable_artist_info:
             return
             
         if not context.args:
@@ -446,56 +1339,60 @@ class ShazamIOBot:
         user_id = update.effective_user.id
         
         if not self.check_rate_limit(user_id):
-            error_msg = self.get_error_text(user_id, 'rate_limited')
+            error_msg = self.get_text(user_id, Msg.ERROR_RATE_LIMITED)
             await update.message.reply_text(error_msg)
             return
         
         query = ' '.join(context.args)
         
         try:
-            results = await self.shazam.search_artist(query=query, limit=1)
+            artist_info = await self.artists.lookup(query)
             
-            if results and results.get('artists', {}).get('hits'):
-                artist_data = results['artists']['hits'][0]
-                artist_id = artist_data.get('artist', {}).get('id')
+            if artist_info:
+                serialized = get_serializer().artist(artist_info)
                 
-                if artist_id:
-                    artist_info = await self.shazam.artist_about(artist_id)
-                    serialized = Serialize.artist(artist_info)
-                    
-                    message = f"👤 **{serialized.name or 'Unknown Artist'}**\n"
-                    
-                    if hasattr(serialized, 'genres') and serialized.genres:
-                        message += f"🎼 **Genres:** {', '.join(serialized.genres)}\n"
-                    
-                    if hasattr(serialized, 'verified') and serialized.verified:
-                        message += "✅ **Verified Artist**\n"
-                    
-                    if hasattr(serialized, 'followers') and serialized.followers:
-                        message += f"👥 **Followers:** {serialized.followers:,}\n"
-                    
-                    await update.message.reply_text(message, parse_mode='Markdown')
-                else:
-                    error_msg = self.get_error_text(user_id, 'no_results')
-                    await update.message.reply_text(error_msg)
+                message = f"👤 **{serialized.name or 'Unknown Artist'}**\n"
+                
+                if hasattr(serialized, 'genres') and serialized.genres:
+                    message += f"🎼 **Genres:** {', '.join(serialized.genres)}\n"
+                
+                if hasattr(serialized, 'verified') and serialized.verified:
+                    message += "✅ **Verified Artist**\n"
+                
+                if hasattr(serialized, 'followers') and serialized.followers:
+                    message += f"👥 **Followers:** {serialized.followers:,}\n"
+                
+                await update.message.reply_text(message, parse_mode='Markdown')
             else:
-                error_msg = self.get_error_text(user_id, 'no_results')
+                error_msg = self.get_text(user_id, Msg.ERROR_NO_RESULTS)
                 await update.message.reply_text(error_msg)
                 
         except Exception as e:
             logger.error(f"Error in artist command: {e}")
-            error_msg = self.get_error_text(user_id, 'api_error')
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
             await update.message.reply_text(error_msg)
     
+    async def search_artist(self, name: str) -> Optional[Tuple[str, str]]:
+        """Best Shazam match for an artist name, as (artist id, name)"""
+        results = await self.shazam.search_artist(query=name, limit=1)
+        hits = (results or {}).get('artists', {}).get('hits') or []
+        artist = hits[0].get('artist', {}) if hits else {}
+        artist_id = artist.get('id') or artist.get('adamid')
+        return (str(artist_id), artist.get('name', '')) if artist_id else None
+    
+    async def fetch_artist_profile(self, artist_id: str) -> Dict:
+        """Artist profile from Shazam"""
+        return await self.shazam.artist_about(artist_id)
+    
     async def charts_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /charts command"""
-        if not ENABLE_CHARTS:
+        if not self.settings.enable_charts:
             return
             
         user_id = update.effective_user.id
         
         if not self.check_rate_limit(user_id):
-            error_msg = self.get_error_text(user_id, 'rate_limited')
+            error_msg = self.get_text(user_id, Msg.ERROR_RATE_LIMITED)
             await update.message.reply_text(error_msg)
             return
         
@@ -504,35 +1401,41 @@ class ShazamIOBot:
             results = await self.shazam.top_world_tracks(limit=10)
             
             if results and results.get('tracks'):
-                message = "🌍 **Top 10 Global Tracks**\n\n"
-                
-                for i, track in enumerate(results['tracks'][:10], 1):
-                    try:
-                        serialized = Serialize.track(track)
-                        title = serialized.title or "Unknown Title"
-                        artist = serialized.subtitle or "Unknown Artist"
-                        message += f"{i}. **{title}** - {artist}\n"
-                    except Exception as e:
-                        logger.error(f"Error serializing track: {e}")
-                        continue
-                
+                self.index_tracks(results['tracks'])
+                message = self.format_charts(results['tracks'][:10])
                 await update.message.reply_text(message, parse_mode='Markdown')
             else:
-                error_msg = self.get_error_text(user_id, 'no_results')
+                error_msg = self.get_text(user_id, Msg.ERROR_NO_RESULTS)
                 await update.message.reply_text(error_msg)
                 
         except Exception as e:
             logger.error(f"Error in charts command: {e}")
-            error_msg = self.get_error_text(user_id, 'api_error')
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
             await update.message.reply_text(error_msg)
     
+    def format_charts(self, tracks: List[Dict]) -> str:
+        """Format chart tracks as a numbered Markdown list"""
+        message = "🌍 **Top 10 Global Tracks**\n\n"
+        
+        for i, track in enumerate(tracks, 1):
+            try:
+                serialized = get_serializer().track(track)
+                title = serialized.title or "Unknown Title"
+                artist = serialized.subtitle or "Unknown Artist"
+                message += f"{i}. **{title}** - {artist}\n"
+            except Exception as e:
+                logger.error(f"Error serializing track: {e}")
+                continue
+        
+        return message
+    
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors"""
         logger.error(f"Update {update} caused error {context.error}")
         
         if update and update.effective_message:
             user_id = update.effective_user.id
-            error_msg = self.get_error_text(user_id, 'api_error')
+            error_msg = self.get_text(user_id, Msg.ERROR_API_ERROR)
             try:
                 await update.effective_message.reply_text(error_msg)
             except Exception:
@@ -540,35 +1443,55 @@ class ShazamIOBot:
     
     def setup_handlers(self, application: Application):
         """Set up all handlers"""
+        self.application = application
+        
+        # Startup timing, ahead of every other handler
+        application.add_handler(TypeHandler(Update, self.track_first_update), group=-1)
+        # Its own group: only the first matching handler of a group runs
+        application.add_handler(TypeHandler(Update, self.load_session), group=-2)
+        
+        self.register_handlers(application)
+        
+        # Error handler
+        application.add_error_handler(self.error_handler)
+    
+    def register_handlers(self, application: Application):
+        """(Re-)register the command and message handlers allowed by the feature flags"""
+        for handler in list(application.handlers.get(0, [])):
+            application.remove_handler(handler)
+        
         # Command handlers
         application.add_handler(CommandHandler("start", self.start_command))
+        application.add_handler(CommandHandler("reload", self.reload_command))
+        application.add_handler(CommandHandler("metrics", self.metrics_command))
         application.add_handler(CommandHandler("help", self.help_command))
         application.add_handler(CommandHandler("about", self.about_command))
         application.add_handler(CommandHandler("language", self.language_command))
         
-        if ENABLE_TRACK_INFO:
+        if self.settings.enable_track_info:
             application.add_handler(CommandHandler("track", self.track_command))
         
-        if ENABLE_ARTIST_INFO:
+        if self.settings.enable_artist_info:
             application.add_handler(CommandHandler("artist", self.artist_command))
         
-        if ENABLE_CHARTS:
+        if self.settings.enable_charts:
             application.add_handler(CommandHandler("charts", self.charts_command))
         
         # Callback handler for language selection
-        if ENABLE_LANGUAGE_SELECTION:
+        if self.settings.enable_language_selection:
             application.add_handler(CallbackQueryHandler(self.language_callback, pattern="^lang_"))
         
         # Inline query handler
-        if ENABLE_INLINE_MODE:
+        if self.settings.enable_inline_mode:
             application.add_handler(InlineQueryHandler(self.inline_query))
         
         # Audio message handler
-        if ENABLE_AUDIO_RECOGNITION:
+        if self.settings.enable_audio_recognition:
             application.add_handler(MessageHandler(filters.AUDIO | filters.VOICE | filters.Document.ALL, self.handle_audio))
         
-        # Error handler
-        application.add_error_handler(self.error_handler)
+        # Video message handler
+        if self.settings.enable_video_recognition:
+            application.add_handler(MessageHandler(filters.VIDEO | filters.VIDEO_NOTE, self.handle_video))
     
     async def set_bot_commands(self, application: Application):
         """Set bot commands"""
@@ -579,37 +1502,136 @@ class ShazamIOBot:
             BotCommand("language", "Change bot language"),
         ]
         
-        if ENABLE_TRACK_INFO:
+        if self.settings.enable_track_info:
             commands.append(BotCommand("track", "Search for a track"))
         
-        if ENABLE_ARTIST_INFO:
+        if self.settings.enable_artist_info:
             commands.append(BotCommand("artist", "Search for an artist"))
         
-        if ENABLE_CHARTS:
+        if self.settings.enable_charts:
             commands.append(BotCommand("charts", "View global music charts"))
         
         await application.bot.set_my_commands(commands, scope=BotCommandScopeDefault())
     
     async def run(self):
-        """Run the bot"""
+        """Run the bot until SIGTERM/SIGINT, then shut down without dropping work"""
+        application = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(self.build_update_processor())
+            .build()
+        )
+        self.setup_handlers(application)
+        self.lifecycle.install_signal_handlers()
+        if hasattr(signal, 'SIGHUP'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.request_reload)
+        
+        if self.loop_watchdog is not None:
+            self.loop_watchdog.start()
+        
         try:
-            # Create application
-            application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-            
-            # Set up handlers
-            self.setup_handlers(application)
-            
-            # Set bot commands
-            await self.set_bot_commands(application)
-            
-            logger.info("Bot started successfully!")
-            
-            # Start polling
-            await application.run_polling(drop_pending_updates=True)
+            async with application:
+                try:
+                    await self.set_bot_commands(application)
+                except TelegramError as e:
+                    logger.warning(f"Could not set bot commands: {e}")
+                
+                try:
+                    pending = [
+                        Update.de_json(data, application.bot)
+                        for data in self.restore_checkpoint(self.lifecycle.load_checkpoint())
+                    ]
+                except Exception as e:
+                    logger.error(f"Could not restore the checkpoint: {e}")
+                    self.lifecycle.set_aside_checkpoint()
+                    pending = []
+                else:
+                    self.lifecycle.remove_checkpoint()
+                cleanup_temp_files()
+                
+                await application.start()
+                # Updates queued while the bot was down are answered, not dropped
+                await application.updater.start_polling(drop_pending_updates=False)
+                for update in pending:
+                    await application.update_queue.put(update)
+                
+                logger.info(f"Bot started successfully in {time.perf_counter() - STARTED_AT:.3f}s!")
+                
+                # Load shazamio in the background instead of on the first recognition
+                self.warm_task = asyncio.create_task(self.warm_caches())
+                self.eviction_task = asyncio.create_task(self.evict_idle_sessions())
+                
+                await self.lifecycle.wait_for_stop()
+                await self.shutdown(application)
             
         except Exception as e:
-            logger.error(f"Error starting bot: {e}")
+            logger.error(f"Error running bot: {e}")
             raise
+        finally:
+            if self.eviction_task is not None:
+                self.eviction_task.cancel()
+            if self.warm_task is not None:
+                self.warm_task.cancel()
+            if self.loop_watchdog is not None:
+                await self.loop_watchdog.stop()
+            if self.slice_stats is not None:
+                self.slice_stats.save()
+            try:
+                await self.sessions.flush()
+            except Exception as e:
+                logger.warning(f"Could not save the sessions: {e}")
+            self.sessions.close()
+            close_shazam = getattr(self._shazam, 'close', None)
+            if close_shazam is not None:
+                close_shazam()
+            if self.http_session is not None:
+                await self.http_session.close()
+    
+    async def shutdown(self, application: Application):
+        """Stop intake, drain in-flight work and checkpoint whatever is left"""
+        # No new updates; Telegram keeps everything not yet fetched
+        await application.updater.stop()
+        
+        # Albums still being collected are processed now rather than lost
+        self.media_groups.flush_all()
+        await asyncio.sleep(0)
+        
+        leftovers = await self.lifecycle.drain()
+        self.save_checkpoint(leftovers)
+        await application.stop()
+        logger.info("Shutdown complete")
+    
+    def save_checkpoint(self, updates: List[object]):
+        """Write unfinished updates and warm caches for the next process"""
+        state = {
+            'updates': [json.loads(update.to_json()) for update in updates if isinstance(update, Update)],
+            'recognition_cache': self.recognition_cache.dump(),
+            'artist_cache': self.artists.dump(),
+        }
+        try:
+            self.lifecycle.save_checkpoint(state)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Could not write checkpoint: {e}")
+            return
+        logger.info(f"Checkpoint saved: {len(state['updates'])} pending updates, "
+                    f"{len(state['recognition_cache'])} cached recognitions")
+    
+    def restore_checkpoint(self, state: Dict) -> List[Dict]:
+        """Reload caches from a checkpoint and return the updates to replay"""
+        if not state:
+            return []
+        
+        elapsed = max(time.time() - state.get('saved_at', time.time()), 0)
+        for key, track, ttl in state.get('recognition_cache', []):
+            if ttl > elapsed:
+                self.recognition_cache.set(key, track, ttl=ttl - elapsed)
+                self.index_tracks([track])
+        self.artists.restore(state.get('artist_cache', {}), elapsed)
+        
+        updates = state.get('updates', [])
+        logger.info(f"Restored checkpoint: {len(updates)} pending updates, "
+                    f"{len(self.recognition_cache)} cached recognitions")
+        return updates
 
 def main():
     """Main function"""
@@ -0,0 +1,70 @@
+"""
+Small in-process caches used by the ShazamIO Telegram Bot
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator, List, Optional, Tuple
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after a fixed time-to-live"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry and mark it as recently used"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entries when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry and return its value"""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        """Drop every entry"""
+        self._data.clear()
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        """Iterate over live entries, oldest first"""
+        now = time.monotonic()
+        for key, (expires_at, value) in list(self._data.items()):
+            if expires_at >= now:
+                yield key, value
+
+    def dump(self) -> List[Tuple[Hashable, Any, float]]:
+        """Live entries with their remaining time-to-live, oldest first"""
+        now = time.monotonic()
+        return [
+            (key, value, expires_at - now)
+            for key, (expires_at, value) in self._data.items()
+            if expires_at >= now
+        ]
@@ -0,0 +1,208 @@
+"""
+Pool of independently configured Shazam clients with load balancing and ejection
+"""
+
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from upstream import METHODS, is_transport_error
+
+logger = logging.getLogger(__name__)
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY = 'latency'
+BALANCE_MODES = (LEAST_OUTSTANDING, LATENCY)
+
+HEALTHY = 'healthy'
+EJECTED = 'ejected'
+PROBING = 'probing'
+
+
+class ProxiedShazam:
+    """Sends every Shazam call of a client through ``proxy``"""
+
+    def __init__(self, client, proxy: str):
+        self.client = client
+        self.proxy = proxy
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if name not in METHODS:
+            return attr
+
+        async def proxied(*args, **kwargs):
+            kwargs.setdefault('proxy', self.proxy)
+            return await attr(*args, **kwargs)
+
+        return proxied
+
+
+def client_factory(options: Mapping[str, Any]) -> Callable[[], Any]:
+    """Factory of a shazamio client configured by one SHAZAM_CLIENTS entry"""
+    def create():
+        from shazamio import Shazam
+        client = Shazam(
+            language=options.get('language', 'en-US'),
+            endpoint_country=options.get('endpoint_country', 'GB'),
+        )
+        proxy = options.get('proxy')
+        return ProxiedShazam(client, proxy) if proxy else client
+
+    return create
+
+
+class PoolMember:
+    """One client of a pool and its health"""
+
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.outstanding = 0
+        # Smoothed latency of successful calls; None until the first one
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.state = HEALTHY
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.requests = 0
+        self.errors = 0
+
+
+class ClientPool:
+    """Spreads Shazam calls over several clients and takes failing ones out of rotation
+
+    Each call goes to the available client with the fewest calls in flight
+    (``least_outstanding``) or the lowest smoothed latency weighted by its
+    calls in flight (``latency``); ties are broken at random.
+
+    A client that fails ``max_failures`` calls in a row is ejected for
+    ``eject_seconds``, doubled for each recent ejection (up to 8x). Once
+    that time is up it gets a single probe call: success brings it back,
+    failure ejects it again. At most ``max_ejected`` of the clients are
+    ejected at once, and if every client is out anyway, the one due back
+    first is used. Only transport failures (see ``is_transport_error``)
+    count: a call that was cancelled, shed by the priority lanes or failed
+    for any other reason leaves the client's health alone.
+    """
+
+    def __init__(self, members: List[PoolMember], balance: str = LEAST_OUTSTANDING,
+                 max_failures: int = 5, eject_seconds: float = 30, max_ejected: float = 0.5,
+                 smoothing: float = 0.2):
+        if not members:
+            raise ValueError("a client pool needs at least one client")
+        if balance not in BALANCE_MODES:
+            raise ValueError(f"unknown balance mode {balance!r}, "
+                             f"expected one of {', '.join(BALANCE_MODES)}")
+        self.members = members
+        self.balance = balance
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.max_ejected = max_ejected
+        self.smoothing = smoothing
+
+    def _available(self, now: float) -> List[PoolMember]:
+        available = []
+        for member in self.members:
+            if member.state == EJECTED and now >= member.ejected_until:
+                member.state = PROBING
+            if member.state == HEALTHY or (member.state == PROBING and not member.outstanding):
+                available.append(member)
+        return available
+
+    def _score(self, member: PoolMember) -> float:
+        if self.balance == LATENCY:
+            # Untried clients go first, so every client gets a latency
+            return (member.latency or 0.0) * (member.outstanding + 1)
+        return member.outstanding
+
+    def pick(self) -> PoolMember:
+        """The client the next call goes to"""
+        now = time.monotonic()
+        available = self._available(now)
+        if not available:
+            return min(self.members, key=lambda member: (member.ejected_until, member.outstanding))
+        best = min(self._score(member) for member in available)
+        return random.choice([member for member in available if self._score(member) == best])
+
+    def _succeeded(self, member: PoolMember, latency: float):
+        member.failures = 0
+        if member.latency is None:
+            member.latency = latency
+        else:
+            member.latency += self.smoothing * (latency - member.latency)
+        if member.state != HEALTHY:
+            member.state = HEALTHY
+            member.ejections = max(member.ejections - 1, 0)
+            logger.info(f"Shazam client {member.name} is back in rotation")
+
+    def _failed(self, member: PoolMember, error: Exception):
+        member.errors += 1
+        member.failures += 1
+        if member.state == PROBING:
+            self._eject(member, f"probe failed: {error}")
+            return
+        if member.state != HEALTHY or member.failures < self.max_failures:
+            return
+        ejected = sum(1 for other in self.members if other.state != HEALTHY)
+        # At least one client may be ejected, and at least one always stays
+        limit = min(max(int(self.max_ejected * len(self.members)), 1), len(self.members) - 1)
+        if ejected >= limit:
+            if member.failures == self.max_failures:
+                logger.warning(f"Shazam client {member.name} keeps failing ({error}), "
+                               f"but too many clients are ejected already")
+            return
+        self._eject(member, f"{member.failures} failures in a row, last: {error}")
+
+    def _eject(self, member: PoolMember, reason: str):
+        duration = self.eject_seconds * 2 ** min(member.ejections, 3)
+        member.state = EJECTED
+        member.ejected_until = time.monotonic() + duration
+        member.ejections += 1
+        logger.warning(f"Ejected Shazam client {member.name} for {duration:.0f}s ({reason})")
+
+    def __getattr__(self, name: str):
+        if name not in METHODS:
+            return getattr(self.members[0].client, name)
+
+        async def pooled(*args, **kwargs):
+            member = self.pick()
+            member.outstanding += 1
+            member.requests += 1
+            started = time.perf_counter()
+            try:
+                result = await getattr(member.client, name)(*args, **kwargs)
+            except Exception as e:
+                if is_transport_error(e):
+                    self._failed(member, e)
+                raise
+            else:
+                self._succeeded(member, time.perf_counter() - started)
+                return result
+            finally:
+                member.outstanding -= 1
+
+        return pooled
+
+    def close(self):
+        for member in self.members:
+            close = getattr(member.client, 'close', None)
+            if close is not None:
+                close()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            member.name: {
+                'state': member.state,
+                'outstanding': member.outstanding,
+                'latency_ms': round(member.latency * 1000) if member.latency is not None else None,
+                'requests': member.requests,
+                'errors': member.errors,
+                'ejections': member.ejections,
+                'back_in_s': (round(max(member.ejected_until - now, 0), 1)
+                              if member.state == EJECTED else 0),
+            }
+            for member in self.members
+        }
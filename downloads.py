@@ -0,0 +1,165 @@
+"""
+Chunked, memory-bounded downloads of Telegram files
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Union
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Extra bytes read past the estimated window to cover container headers
+HEADER_SLACK_BYTES = 64 * 1024
+
+# Containers that decode fine when truncated; MP4/M4A keep their index at the end
+STREAMABLE_FORMATS = {'mp3', 'mpeg', 'ogg', 'opus', 'flac', 'wav', 'aac', 'webm'}
+
+
+class DownloadTooLarge(Exception):
+    """Raised for a buffer that could never fit in the memory budget"""
+
+
+class BufferPool:
+    """Reusable download buffers sharing one global memory budget
+
+    Every in-flight download leases a single buffer sized up front, so a
+    lease is granted all-or-nothing and concurrent downloads can never
+    deadlock on partially acquired memory. Idle buffers kept for reuse
+    count against the same budget and are dropped when space is needed.
+    A buffer larger than the whole budget is refused with DownloadTooLarge
+    rather than handed out short, which would cut the file off.
+    """
+
+    def __init__(self, budget: int, chunk_size: int, max_idle: int):
+        self.budget = budget
+        self.chunk_size = chunk_size
+        self.max_idle = max_idle
+        self.in_use = 0
+        self._idle: List[bytearray] = []
+        # Made on first use: on Python 3.8/3.9 it binds to the loop current
+        # when created, and the pool is built before asyncio.run()
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    @property
+    def idle_bytes(self) -> int:
+        return sum(len(buf) for buf in self._idle)
+
+    def _capacity(self, size: int) -> int:
+        if size > self.budget:
+            raise DownloadTooLarge(f"{size} bytes don't fit in the "
+                                   f"{self.budget} byte download budget")
+        chunks = max(1, -(-size // self.chunk_size))
+        # Rounding up to whole chunks never takes a buffer past the budget
+        return min(chunks * self.chunk_size, self.budget)
+
+    def _take_idle(self, capacity: int) -> Optional[bytearray]:
+        fitting = [buf for buf in self._idle if len(buf) >= capacity]
+        if not fitting:
+            return None
+        buf = min(fitting, key=len)
+        self._idle.remove(buf)
+        return buf
+
+    async def acquire(self, size: int) -> bytearray:
+        """Wait until the budget allows a buffer of at least ``size`` bytes
+
+        Raises DownloadTooLarge right away if ``size`` is over the budget.
+        """
+        capacity = self._capacity(size)
+
+        async with self._condition:
+            while True:
+                buf = self._take_idle(capacity)
+                if buf is not None:
+                    self.in_use += len(buf)
+                    return buf
+
+                # Free idle buffers that are in the way of this allocation
+                while self._idle and self.in_use + self.idle_bytes + capacity > self.budget:
+                    self._idle.pop(0)
+
+                if self.in_use + self.idle_bytes + capacity <= self.budget:
+                    self.in_use += capacity
+                    return bytearray(capacity)
+
+                await self._cond.wait()
+
+    async def release(self, buf: bytearray):
+        """Return a buffer to the pool and wake up waiting downloads"""
+        async with self._condition:
+            self.in_use -= len(buf)
+            if len(self._idle) < self.max_idle:
+                self._idle.append(buf)
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def lease(self, size: int) -> AsyncIterator[bytearray]:
+        """Hold a pooled buffer for the duration of a ``with`` block"""
+        buf = await self.acquire(size)
+        try:
+            yield buf
+        finally:
+            await self.release(buf)
+
+
+def estimate_download_limit(file_size: int, duration: Optional[int], window_seconds: int,
+                            streamable: bool) -> int:
+    """Estimate how many bytes hold ``window_seconds`` of audio
+
+    Falls back to the whole file when the container can't be decoded from a
+    prefix or the duration is unknown.
+    """
+    if not streamable or not duration or duration <= window_seconds:
+        return file_size
+
+    bytes_per_second = file_size / duration
+    limit = int(bytes_per_second * window_seconds) + HEADER_SLACK_BYTES
+    return min(limit, file_size)
+
+
+async def stream_download(session: 'aiohttp.ClientSession', url: str, buf: Union[bytearray, memoryview],
+                          limit: int, chunk_size: int, start: int = 0) -> int:
+    """Stream ``url`` into ``buf`` chunk by chunk, stopping after ``limit`` bytes
+
+    Bytes are requested from offset ``start`` with a Range header. A server
+    that ignores it answers 200 with the whole file, whose first ``start``
+    bytes are then skipped; a partial answer for another range raises
+    ValueError. Returns the number of bytes written to the buffer.
+    """
+    limit = min(limit, len(buf))
+    headers = {'Range': f"bytes={start}-{start + limit - 1}"}
+
+    pos = 0
+    async with session.get(url, headers=headers) as resp:
+        resp.raise_for_status()
+        skip = 0
+        if resp.status == 206:
+            content_range = resp.headers.get('Content-Range', '')
+            if not content_range.startswith(f"bytes {start}-"):
+                raise ValueError(f"Asked for bytes {start}- of {url}, got {content_range!r}")
+        elif start:
+            skip = start
+        with memoryview(buf) as view:
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk, skip = chunk[skip:], 0
+                take = min(len(chunk), limit - pos)
+                view[pos:pos + take] = chunk[:take]
+                pos += take
+                if pos >= limit:
+                    break
+
+    return pos
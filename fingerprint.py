@@ -0,0 +1,156 @@
+"""
+Vectorized landmark fingerprinting engine (spectral peak pairs) for decoded audio
+"""
+
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+
+# Bump whenever the landmark layout changes so stale indexes get rebuilt
+ENGINE_VERSION = 2
+
+Landmarks = Tuple[np.ndarray, np.ndarray]
+
+
+def pcm_to_samples(pcm: bytes) -> np.ndarray:
+    """View mono 16-bit PCM as float32 samples in [-1, 1]"""
+    return np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+
+
+class FingerprintEngine:
+    """Turns a whole clip into hashed constellation landmarks in one pass
+
+    Every stage works on full arrays: the signal is low-pass filtered and
+    resampled in one shot, framed through a strided (zero-copy) view,
+    transformed with a single batched FFT, peaks come from a separable 2-D
+    maximum filter and pairs are formed with broadcasting. No stage loops
+    over frames in Python.
+    """
+
+    def __init__(self, sample_rate: int = 8000, n_fft: int = 512, hop: int = 256,
+                 neighborhood: Tuple[int, int] = (7, 9), fan_out: int = 8,
+                 max_dt: int = 63, max_df: int = 96, threshold: float = 1.5):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop = hop
+        self.neighborhood = neighborhood
+        self.fan_out = fan_out
+        self.max_dt = max_dt
+        self.max_df = max_df
+        self.threshold = threshold
+        self.window = np.hanning(n_fft).astype(np.float32)
+
+        bins = n_fft // 2 + 1
+        self.freq_bits = int(bins - 1).bit_length()
+        if 2 * self.freq_bits + 6 > 32:
+            raise ValueError("n_fft too large to pack landmarks into 32 bits")
+
+    @property
+    def frames_per_second(self) -> float:
+        return self.sample_rate / self.hop
+
+    def resample(self, samples: np.ndarray, source_rate: int) -> np.ndarray:
+        """Resample to the engine rate, low-pass filtering first when downsampling"""
+        if source_rate == self.sample_rate or len(samples) == 0:
+            return samples.astype(np.float32, copy=False)
+
+        if source_rate > self.sample_rate:
+            # Windowed-sinc low-pass at the new Nyquist frequency
+            cutoff = self.sample_rate / source_rate
+            taps = np.arange(-32, 33)
+            kernel = cutoff * np.sinc(cutoff * taps) * np.hamming(len(taps))
+            kernel = (kernel / kernel.sum()).astype(np.float32)
+            padded = np.pad(samples.astype(np.float32, copy=False), 32)
+
+            if source_rate % self.sample_rate == 0:
+                # Integer factor: filter only the samples we keep, via a strided view
+                factor = source_rate // self.sample_rate
+                windows = sliding_window_view(padded, len(kernel))[::factor]
+                return windows @ kernel[::-1]
+
+            samples = np.convolve(padded, kernel, mode='valid')
+
+        duration = len(samples) / source_rate
+        positions = np.arange(int(duration * self.sample_rate), dtype=np.float64)
+        positions *= source_rate / self.sample_rate
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    def frames(self, samples: np.ndarray) -> np.ndarray:
+        """Overlapping analysis frames as a read-only strided view of ``samples``"""
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        n_frames = 1 + (len(samples) - self.n_fft) // self.hop
+        if n_frames <= 0:
+            return np.empty((0, self.n_fft), dtype=np.float32)
+
+        stride = samples.strides[0]
+        return as_strided(
+            samples,
+            shape=(n_frames, self.n_fft),
+            strides=(self.hop * stride, stride),
+            writeable=False,
+        )
+
+    def spectrogram(self, samples: np.ndarray) -> np.ndarray:
+        """Log-magnitude STFT with time along the first axis"""
+        frames = self.frames(samples)
+        if len(frames) == 0:
+            return np.empty((0, self.n_fft // 2 + 1), dtype=np.float32)
+        spectrum = np.fft.rfft(frames * self.window, axis=1)
+        return np.log1p(np.abs(spectrum)).astype(np.float32)
+
+    def find_peaks(self, spec: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Constellation peaks: local maxima of a time/frequency neighbourhood above the noise floor"""
+        if spec.shape[0] == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        dt, df = self.neighborhood
+        padded = np.pad(spec, ((dt, dt), (df, df)), mode='constant', constant_values=-np.inf)
+
+        # Separable maximum filter built from sliding-window views
+        local = sliding_window_view(padded, 2 * df + 1, axis=1).max(axis=-1)
+        local = sliding_window_view(local, 2 * dt + 1, axis=0).max(axis=-1)
+
+        floor = spec.mean() + self.threshold * spec.std()
+        frames, bins = np.nonzero((spec == local) & (spec > floor))
+        return frames, bins
+
+    def hash_peaks(self, frames: np.ndarray, bins: np.ndarray) -> Landmarks:
+        """Pair every anchor with the next ``fan_out`` peaks in its target zone
+
+        Returns (hashes, anchor frame offsets) as uint32 arrays; a hash packs
+        the anchor bin, the target bin and the frame delta.
+        """
+        if len(frames) < 2:
+            empty = np.empty(0, dtype=np.uint32)
+            return empty, empty
+
+        order = np.lexsort((bins, frames))
+        frames, bins = frames[order], bins[order]
+
+        # (anchor, k) target positions for every anchor at once
+        count = len(frames)
+        targets = np.arange(count)[:, None] + np.arange(1, self.fan_out + 1)[None, :]
+        in_range = targets < count
+        targets = np.minimum(targets, count - 1)
+
+        dt = frames[targets] - frames[:, None]
+        df = bins[targets] - bins[:, None]
+        valid = in_range & (dt > 0) & (dt <= self.max_dt) & (np.abs(df) <= self.max_df)
+
+        anchors = np.broadcast_to(np.arange(count)[:, None], targets.shape)[valid]
+        f1 = bins[anchors].astype(np.uint32)
+        f2 = bins[targets[valid]].astype(np.uint32)
+        hashes = (f1 << (self.freq_bits + 6)) | (f2 << 6) | dt[valid].astype(np.uint32)
+        return hashes, frames[anchors].astype(np.uint32)
+
+    def fingerprint(self, samples: np.ndarray, source_rate: int) -> Landmarks:
+        """Fingerprint float samples recorded at ``source_rate``"""
+        samples = self.resample(samples, source_rate)
+        frames, bins = self.find_peaks(self.spectrogram(samples))
+        return self.hash_peaks(frames, bins)
+
+    def fingerprint_pcm(self, pcm: bytes, source_rate: int = 16000) -> Landmarks:
+        """Fingerprint mono 16-bit PCM"""
+        return self.fingerprint(pcm_to_samples(pcm), source_rate)
@@ -0,0 +1,317 @@
+"""
+Local inverted index of landmark fingerprints for offline recognition
+"""
+
+import json
+import logging
+import mmap
+import os
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASHES_FILE = 'hashes.u32'
+ENTRIES_FILE = 'entries.u64'
+DELTA_FILE = 'delta.bin'
+# One "<track key>\t<track JSON>" line per indexed track
+TRACKS_FILE = 'tracks.tsv'
+VERSION_FILE = 'version'
+
+# One pending landmark as appended to DELTA_FILE
+DELTA_DTYPE = np.dtype([('hash', '<u4'), ('entry', '<u8')])
+
+# Base landmarks merged per step of a compaction
+MERGE_CHUNK = 1 << 20
+
+
+def pack_entries(track_id: int, offsets: np.ndarray) -> np.ndarray:
+    """Pack (track id, frame offset) pairs into sortable 64-bit entries"""
+    return (np.uint64(track_id) << np.uint64(32)) | offsets.astype(np.uint64)
+
+
+class FingerprintIndex:
+    """Inverted hash -> (track, offset) index backed by memory-mapped files
+
+    Compacted landmarks live in two sorted, memory-mapped arrays (hashes and
+    packed entries) that are searched with ``np.searchsorted``. New tracks go
+    to an append-only delta file first and are merged in by ``compact`` once
+    the delta grows past ``compact_threshold`` landmarks.
+
+    Compaction streams the sorted base through a merge with the sorted delta
+    into new files, a chunk at a time, while lookups and adds go on; only
+    swapping the new files in takes the lock.
+    """
+
+    def __init__(self, directory: str, min_matches: int = 20, compact_threshold: int = 1_000_000,
+                 version: int = 0):
+        self.directory = directory
+        self.version = version
+        self.min_matches = min_matches
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._compacting = threading.Lock()
+
+        # Track payloads stay on disk; only their file offsets are kept in memory
+        self._track_offsets = array('Q')
+        self._track_ids: Dict[str, int] = {}
+        self._hashes = np.empty(0, dtype=np.uint32)
+        self._entries = np.empty(0, dtype=np.uint64)
+        # Mappings behind _hashes and _entries, closed before their files are replaced
+        self._maps: List[mmap.mmap] = []
+        self._delta_parts: List[np.ndarray] = []
+        self._delta: Optional[np.ndarray] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _check_version(self):
+        """Discard an index built by a different fingerprint engine"""
+        version_path = self._path(VERSION_FILE)
+        if os.path.exists(version_path):
+            with open(version_path, encoding='utf-8') as f:
+                if f.read().strip() == str(self.version):
+                    return
+            logger.warning("Local fingerprint index was built by another engine version, rebuilding")
+
+        for name in (HASHES_FILE, ENTRIES_FILE, DELTA_FILE, TRACKS_FILE):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        with open(version_path, 'w', encoding='utf-8') as f:
+            f.write(str(self.version))
+
+    def _load(self):
+        self._check_version()
+
+        tracks_path = self._path(TRACKS_FILE)
+        if os.path.exists(tracks_path):
+            with open(tracks_path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    if line.endswith(b'\n'):
+                        key = line.split(b'\t', 1)[0].decode('utf-8')
+                        self._register_track(key, offset)
+                    offset += len(line)
+
+        self._map_base()
+
+        delta_path = self._path(DELTA_FILE)
+        if os.path.exists(delta_path) and os.path.getsize(delta_path):
+            # Drop a torn trailing record left by a crash mid-append
+            records = os.path.getsize(delta_path) // DELTA_DTYPE.itemsize
+            self._delta_parts.append(np.fromfile(delta_path, dtype=DELTA_DTYPE, count=records))
+
+        logger.info(f"Local fingerprint index loaded: {self.track_count} tracks, "
+                    f"{self.size} landmarks")
+
+    def _map_base(self):
+        hashes_path = self._path(HASHES_FILE)
+        entries_path = self._path(ENTRIES_FILE)
+        if os.path.exists(hashes_path) and os.path.getsize(hashes_path):
+            for path in (hashes_path, entries_path):
+                with open(path, 'rb') as f:
+                    self._maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self._hashes = np.frombuffer(self._maps[0], dtype=np.uint32)
+            self._entries = np.frombuffer(self._maps[1], dtype=np.uint64)
+        else:
+            self._hashes = np.empty(0, dtype=np.uint32)
+            self._entries = np.empty(0, dtype=np.uint64)
+
+    def _unmap_base(self):
+        """Drop the base arrays and close their mappings (Windows can't replace mapped files)"""
+        self._hashes = np.empty(0, dtype=np.uint32)
+        self._entries = np.empty(0, dtype=np.uint64)
+        for mapping in self._maps:
+            mapping.close()
+        self._maps = []
+
+    def _register_track(self, key: str, offset: int) -> int:
+        track_id = len(self._track_offsets)
+        self._track_offsets.append(offset)
+        self._track_ids[key] = track_id
+        return track_id
+
+    def _read_track(self, track_id: int) -> Dict:
+        with open(self._path(TRACKS_FILE), 'rb') as f:
+            f.seek(self._track_offsets[track_id])
+            return json.loads(f.readline().split(b'\t', 1)[1])
+
+    @property
+    def size(self) -> int:
+        """Number of landmarks stored in the index"""
+        return len(self._hashes) + sum(len(part) for part in self._delta_parts)
+
+    @property
+    def track_count(self) -> int:
+        return len(self._track_offsets)
+
+    def nbytes(self) -> int:
+        """Bytes used by landmark storage (mapped files plus pending delta)"""
+        return (self._hashes.nbytes + self._entries.nbytes
+                + sum(part.nbytes for part in self._delta_parts))
+
+    @staticmethod
+    def _sort_parts(parts: List[np.ndarray]) -> np.ndarray:
+        if not parts:
+            return np.empty(0, dtype=DELTA_DTYPE)
+        delta = np.concatenate(parts)
+        return delta[np.argsort(delta['hash'], kind='stable')]
+
+    def _sorted_delta(self) -> np.ndarray:
+        if self._delta is None:
+            self._delta = self._sort_parts(self._delta_parts)
+        return self._delta
+
+    @staticmethod
+    def _gather(sorted_hashes: np.ndarray, entries: np.ndarray, hashes: np.ndarray,
+                offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Collect every stored entry matching a query hash, plus that query's offset"""
+        lo = np.searchsorted(sorted_hashes, hashes, side='left')
+        hi = np.searchsorted(sorted_hashes, hashes, side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint32)
+
+        # Expand every [lo, hi) range into explicit positions without a Python loop
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(total)
+        return np.asarray(entries[positions]), np.repeat(offsets, counts)
+
+    def lookup(self, hashes: np.ndarray, offsets: np.ndarray) -> Optional[Dict]:
+        """Return the stored track whose landmarks align best with the query, if any"""
+        if len(hashes) == 0:
+            return None
+
+        with self._lock:
+            base_entries, base_offsets = self._gather(self._hashes, self._entries, hashes, offsets)
+            delta = self._sorted_delta()
+            delta_entries, delta_offsets = self._gather(delta['hash'], delta['entry'], hashes, offsets)
+
+            entries = np.concatenate([base_entries, delta_entries])
+            query_offsets = np.concatenate([base_offsets, delta_offsets])
+            if len(entries) < self.min_matches:
+                return None
+
+            # Vote on (track, time shift): true matches pile up on one shift
+            track_ids = (entries >> np.uint64(32)).astype(np.int64)
+            shifts = (entries & np.uint64(0xFFFFFFFF)).astype(np.int64) - query_offsets
+            votes = (track_ids << 32) | (shifts + (1 << 31))
+            keys, counts = np.unique(votes, return_counts=True)
+
+            best = int(np.argmax(counts))
+            if counts[best] < self.min_matches:
+                return None
+
+            return self._read_track(int(keys[best] >> 32))
+
+    def contains(self, track_key: str) -> bool:
+        with self._lock:
+            return str(track_key) in self._track_ids
+
+    def add(self, track: Dict, hashes: np.ndarray, offsets: np.ndarray):
+        """Index the landmarks of a clip matched upstream"""
+        if len(hashes) == 0:
+            return
+
+        key = str(track.get('key', ''))
+        if not key:
+            return
+
+        with self._lock:
+            track_id = self._track_ids.get(key)
+            if track_id is None:
+                line = f"{key}\t{json.dumps(track, ensure_ascii=False)}\n".encode('utf-8')
+                with open(self._path(TRACKS_FILE), 'ab') as f:
+                    track_id = self._register_track(key, f.tell())
+                    f.write(line)
+
+            records = np.empty(len(hashes), dtype=DELTA_DTYPE)
+            records['hash'] = hashes
+            records['entry'] = pack_entries(track_id, offsets)
+            with open(self._path(DELTA_FILE), 'ab') as f:
+                records.tofile(f)
+
+            self._delta_parts.append(records)
+            self._delta = None
+            full = sum(len(part) for part in self._delta_parts) >= self.compact_threshold
+
+        # Outside the lock: lookups go on while the merge runs
+        if full:
+            self.compact()
+
+    def compact(self):
+        """Merge pending landmarks into the sorted memory-mapped arrays
+
+        Does nothing if another compaction is already running.
+        """
+        if not self._compacting.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                parts = list(self._delta_parts)
+                base_hashes, base_entries = self._hashes, self._entries
+            if not parts:
+                return
+
+            delta = self._sort_parts(parts)
+            self._merge_to(base_hashes, base_entries, delta)
+            del base_hashes, base_entries
+
+            with self._lock:
+                # Landmarks added during the merge stay in the delta
+                remaining = self._delta_parts[len(parts):]
+                with open(self._path(DELTA_FILE + '.tmp'), 'wb') as f:
+                    for part in remaining:
+                        part.tofile(f)
+
+                self._unmap_base()
+                for name in (HASHES_FILE, ENTRIES_FILE, DELTA_FILE):
+                    # Renames only: freeing the old files' blocks can take a while
+                    if os.path.exists(self._path(name)):
+                        os.replace(self._path(name), self._path(name + '.old'))
+                    os.replace(self._path(name + '.tmp'), self._path(name))
+                self._delta_parts = remaining
+                self._delta = None
+                self._map_base()
+
+                logger.info(f"Local fingerprint index compacted: {len(self._hashes)} landmarks")
+
+            for name in (HASHES_FILE, ENTRIES_FILE, DELTA_FILE):
+                if os.path.exists(self._path(name + '.old')):
+                    os.remove(self._path(name + '.old'))
+        finally:
+            self._compacting.release()
+
+    def _merge_to(self, base_hashes: np.ndarray, base_entries: np.ndarray, delta: np.ndarray):
+        """Write the merge of the sorted base and the sorted delta to the .tmp files
+
+        Each delta landmark goes after the base landmarks with the same hash,
+        as a stable sort of the two would put it. The base is read and written
+        MERGE_CHUNK landmarks at a time, so it never has to fit in memory.
+        """
+        # Number of base landmarks that come before each delta landmark
+        positions = np.searchsorted(base_hashes, delta['hash'], side='right')
+        with open(self._path(HASHES_FILE + '.tmp'), 'wb') as hashes_file, \
+                open(self._path(ENTRIES_FILE + '.tmp'), 'wb') as entries_file:
+            taken = 0
+            for start in range(0, len(base_hashes), MERGE_CHUNK):
+                stop = min(start + MERGE_CHUNK, len(base_hashes))
+                # Delta landmarks landing after base[start - 1] and up to base[stop - 1]
+                until = (len(delta) if stop == len(base_hashes)
+                         else int(np.searchsorted(positions, stop, side='right')))
+                where = positions[taken:until] - start
+                added = delta[taken:until]
+                np.insert(base_hashes[start:stop], where, added['hash']).tofile(hashes_file)
+                np.insert(base_entries[start:stop], where, added['entry']).tofile(entries_file)
+                taken = until
+            if taken < len(delta):
+                # Empty base
+                delta['hash'][taken:].tofile(hashes_file)
+                delta['entry'][taken:].tofile(entries_file)
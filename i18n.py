@@ -0,0 +1,123 @@
+"""
+Compiled message catalog: every translation pre-formatted in one flat table
+"""
+
+import sys
+from enum import IntEnum
+from string import Formatter
+from typing import Dict, Iterable, List, Mapping, Set
+
+
+class Msg(IntEnum):
+    """Message ids; the catalog row of each message"""
+
+    INLINE_DESCRIPTION = 0
+    START = 1
+    HELP = 2
+    ABOUT = 3
+    MEDIA_GROUP_PROCESSING = 4
+    MEDIA_GROUP_SUMMARY = 5
+    MEDIA_GROUP_NOT_RECOGNIZED = 6
+    MEDIA_GROUP_ITEM_FAILED = 7
+    ERROR_AUDIO_RECOGNITION_FAILED = 8
+    ERROR_FILE_TOO_LARGE = 9
+    ERROR_UNSUPPORTED_FORMAT = 10
+    ERROR_NO_RESULTS = 11
+    ERROR_RATE_LIMITED = 12
+    ERROR_API_ERROR = 13
+
+
+# Msg member for each key of the ERROR_MESSAGES tables
+ERROR_IDS = {
+    'audio_recognition_failed': Msg.ERROR_AUDIO_RECOGNITION_FAILED,
+    'file_too_large': Msg.ERROR_FILE_TOO_LARGE,
+    'unsupported_format': Msg.ERROR_UNSUPPORTED_FORMAT,
+    'no_results': Msg.ERROR_NO_RESULTS,
+    'rate_limited': Msg.ERROR_RATE_LIMITED,
+    'api_error': Msg.ERROR_API_ERROR,
+}
+
+
+class CatalogError(Exception):
+    """Raised when translations are missing or disagree on their placeholders"""
+
+
+def _substitute(text: str, constants: Mapping[str, str]) -> str:
+    """Fill in the constant placeholders of a template, keeping the others
+
+    The result is still a valid ``str.format`` template when placeholders
+    remain, and plain text (braces unescaped) when none do.
+    """
+    parsed = list(Formatter().parse(text))
+    remaining = any(field is not None and field not in constants for _, field, _, _ in parsed)
+
+    parts = []
+    for literal, field, spec, conversion in parsed:
+        parts.append(literal.replace('{', '{{').replace('}', '}}') if remaining else literal)
+        if field is None:
+            continue
+        if field in constants:
+            parts.append(format(constants[field], spec or ''))
+        else:
+            parts.append('{' + field + (f'!{conversion}' if conversion else '')
+                         + (f':{spec}' if spec else '') + '}')
+    return ''.join(parts)
+
+
+def placeholders(text: str) -> Set[str]:
+    return {field for _, field, _, _ in Formatter().parse(text) if field is not None}
+
+
+class MessageCatalog:
+    """Translations compiled once at startup
+
+    Texts live in a flat list of interned strings at
+    ``message_id * len(languages) + language_index``. Constant
+    placeholders (such as ``bot_username``) are filled in while building,
+    and every message must exist in every language with the same
+    placeholders, so a broken translation fails at startup rather than on
+    a user's request.
+    """
+
+    def __init__(self, messages: Mapping[int, Mapping[str, str]], languages: Iterable[str],
+                 default_language: str, constants: Mapping[str, str] = None):
+        self.languages: List[str] = list(languages)
+        if default_language not in self.languages:
+            raise CatalogError(f"default language {default_language!r} is not in {self.languages}")
+
+        self.language_indexes: Dict[str, int] = {lang: i for i, lang in enumerate(self.languages)}
+        self.default_index = self.language_indexes[default_language]
+        self._stride = len(self.languages)
+
+        constants = constants or {}
+        size = max(messages, default=-1) + 1
+        self._texts: List[str] = [''] * (size * self._stride)
+
+        problems = []
+        for message_id, translations in messages.items():
+            name = getattr(message_id, 'name', message_id)
+            missing = [lang for lang in self.languages if lang not in translations]
+            if missing:
+                problems.append(f"{name}: missing {', '.join(missing)}")
+                continue
+
+            expected = placeholders(translations[default_language]) - constants.keys()
+            for lang in self.languages:
+                text = translations[lang]
+                fields = placeholders(text) - constants.keys()
+                if fields != expected:
+                    problems.append(f"{name}[{lang}]: placeholders {sorted(fields)} "
+                                    f"differ from {sorted(expected)}")
+                self._texts[message_id * self._stride + self.language_indexes[lang]] = sys.intern(
+                    _substitute(text, constants)
+                )
+
+        if problems:
+            raise CatalogError("Invalid message catalog:\n  " + "\n  ".join(problems))
+
+    def language_index(self, language: str) -> int:
+        """Catalog column of a language code, falling back to the default language"""
+        return self.language_indexes.get(language, self.default_index)
+
+    def get(self, message_id: int, language_index: int) -> str:
+        return self._texts[message_id * self._stride + language_index]
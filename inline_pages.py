@@ -0,0 +1,131 @@
+"""
+Offset-based pagination for inline search results
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache import TTLCache
+from priority import BACKGROUND, lane
+
+logger = logging.getLogger(__name__)
+
+# Fetches one page of track payloads: (query, offset, limit) -> tracks
+PageFetcher = Callable[[str, int, int], Awaitable[List[Dict]]]
+
+
+class QueryCursor:
+    """Pages fetched so far for a single inline query string"""
+
+    __slots__ = ('pages', 'prefetches', 'end_offset')
+
+    def __init__(self):
+        self.pages: Dict[int, asyncio.Task] = {}
+        # Pages fetched in the background lane, until someone asks for them
+        self.prefetches: Dict[int, asyncio.Task] = {}
+        # Offset of the first page known to be empty or short
+        self.end_offset: Optional[int] = None
+
+
+class InlinePageCache:
+    """Server-side cursor cache that fetches pages lazily and prefetches the next one"""
+
+    def __init__(self, fetcher: PageFetcher, page_size: int, max_pages: int,
+                 max_queries: int, ttl: float):
+        self.fetcher = fetcher
+        self.page_size = page_size
+        self.max_offset = page_size * max_pages
+        self.cursors = TTLCache(max_queries, ttl)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Collapse whitespace and case so equivalent queries share a cursor"""
+        return ' '.join(query.split()).casefold()
+
+    @staticmethod
+    def parse_offset(offset: str) -> int:
+        """Parse the offset Telegram echoes back from our previous next_offset"""
+        try:
+            return max(int(offset), 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def _cursor(self, key: str) -> QueryCursor:
+        cursor = self.cursors.get(key)
+        if cursor is None:
+            cursor = QueryCursor()
+            self.cursors.set(key, cursor)
+        return cursor
+
+    def _page_task(self, cursor: QueryCursor, query: str, offset: int) -> asyncio.Task:
+        task = cursor.pages.get(offset)
+        if task is None or (task.done() and (task.cancelled() or task.exception())):
+            task = asyncio.create_task(self.fetcher(query, offset, self.page_size))
+            cursor.pages[offset] = task
+        return task
+
+    async def get_page(self, query: str, offset: int):
+        """Return (tracks, next_offset) for a page, prefetching the following page"""
+        if offset >= self.max_offset:
+            return [], ''
+
+        key = self.normalize(query)
+        cursor = self._cursor(key)
+
+        if cursor.end_offset is not None and offset >= cursor.end_offset:
+            return [], ''
+
+        task = self._page_task(cursor, query, offset)
+        if cursor.prefetches.pop(offset, None) is task and not task.done():
+            tracks = await self._promote(cursor, query, offset, task)
+        else:
+            tracks = await task
+
+        next_offset = offset + self.page_size
+        if len(tracks) < self.page_size or next_offset >= self.max_offset:
+            cursor.end_offset = next_offset
+            return tracks, ''
+
+        # Warm page N+1 while the user is looking at page N
+        self.prefetch(query, next_offset)
+        return tracks, str(next_offset)
+
+    async def _promote(self, cursor: QueryCursor, query: str, offset: int,
+                       prefetch: asyncio.Task) -> List[Dict]:
+        """Wait for a page still being prefetched without waiting in the background lane
+
+        The prefetch may be queued behind (or shed with) background work, so
+        the page is fetched again in the caller's lane; whichever fetch
+        succeeds first is used and the other one is cancelled.
+        """
+        fetch = asyncio.create_task(self.fetcher(query, offset, self.page_size))
+        cursor.pages[offset] = fetch
+        pending = {prefetch, fetch}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    cursor.pages[offset] = task
+                    return task.result()
+        # Both failed: report the caller's own attempt
+        return await fetch
+
+    def prefetch(self, query: str, offset: int):
+        """Start fetching a page in the background if it is not cached yet"""
+        cursor = self._cursor(self.normalize(query))
+        if offset in cursor.pages:
+            return
+
+        # Prefetching is background work; a user waiting on a page is not
+        with lane(BACKGROUND):
+            task = self._page_task(cursor, query, offset)
+        cursor.prefetches[offset] = task
+        task.add_done_callback(self._log_prefetch_error)
+
+    @staticmethod
+    def _log_prefetch_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.debug(f"Inline prefetch failed: {task.exception()}")
@@ -0,0 +1,210 @@
+"""
+Graceful shutdown: stop intake, drain in-flight work and checkpoint what is left
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+from log_pipeline import log_context
+from loop_watchdog import handler_scope
+from priority import DEFAULT_LANE, LaneScheduler, Overloaded, lane, single_lane
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+class Lifecycle:
+    """Tracks running jobs and the updates they serve, and coordinates shutdown
+
+    Every job (one update, or a whole media group) registers the updates it
+    is answering. On SIGTERM/SIGINT ``wait_for_stop`` returns; the caller then
+    stops fetching updates and calls ``drain``. Jobs still running when the
+    drain deadline passes are cancelled and their updates are returned so
+    they can be written to the checkpoint and replayed by the next process.
+    """
+
+    def __init__(self, checkpoint_path: str, drain_timeout: float):
+        self.checkpoint_path = checkpoint_path
+        self.drain_timeout = drain_timeout
+        self._jobs: Dict[asyncio.Task, List[Any]] = {}
+        self._stop_requested = False
+        # Events are made inside the running loop: on Python 3.8/3.9 they bind
+        # to the loop current when they are created, and the lifecycle is
+        # built before asyncio.run() starts its own
+        self._stop: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_requested
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._jobs)
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.request_stop, signum)
+            except (NotImplementedError, RuntimeError):
+                # Windows event loops: Ctrl+C still raises KeyboardInterrupt
+                pass
+
+    def request_stop(self, signum: Optional[int] = None):
+        if not self._stop_requested:
+            name = signal.Signals(signum).name if signum else "request"
+            logger.info(f"Shutdown requested ({name}), draining in-flight work")
+        self._stop_requested = True
+        if self._stop is not None:
+            self._stop.set()
+
+    async def wait_for_stop(self):
+        if self._stop is None:
+            self._stop = asyncio.Event()
+            if self._stop_requested:
+                self._stop.set()
+        await self._stop.wait()
+
+    @contextmanager
+    def job(self, updates: List[Any]) -> Iterator[None]:
+        """Register the current task as serving ``updates`` until the block exits"""
+        task = asyncio.current_task()
+        self._jobs[task] = list(updates)
+        try:
+            yield
+        finally:
+            self._jobs.pop(task, None)
+            if not self._jobs and self._idle is not None:
+                self._idle.set()
+
+    async def drain(self) -> List[Any]:
+        """Wait up to ``drain_timeout`` for running jobs; cancel the rest
+
+        Returns the updates of the jobs that had to be cancelled.
+        """
+        if not self._jobs:
+            return []
+        # Set by the last job to finish
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+            return []
+        except asyncio.TimeoutError:
+            pass
+
+        leftovers = [update for updates in self._jobs.values() for update in updates]
+        tasks = list(self._jobs)
+        logger.warning(f"Drain deadline passed, cancelling {len(tasks)} jobs "
+                       f"({len(leftovers)} updates will be resumed after restart)")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return leftovers
+
+    def save_checkpoint(self, state: Dict[str, Any]):
+        """Atomically write ``state`` (JSON-serializable) to the checkpoint file"""
+        state = dict(state, version=CHECKPOINT_VERSION, saved_at=time.time())
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self) -> Dict[str, Any]:
+        """Read the checkpoint left by the previous process, if any
+
+        The file stays in place until the caller has restored it and calls
+        ``remove_checkpoint``; one that can't be read or is of another
+        version is set aside right away.
+        """
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.checkpoint_path}: {e}")
+            self.set_aside_checkpoint()
+            return {}
+
+        if not isinstance(state, dict) or state.get('version') != CHECKPOINT_VERSION:
+            logger.warning(f"Ignoring checkpoint {self.checkpoint_path} of another version")
+            self.set_aside_checkpoint()
+            return {}
+        return state
+
+    def remove_checkpoint(self):
+        """Delete the checkpoint once its state has been restored"""
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def set_aside_checkpoint(self):
+        """Rename a checkpoint that couldn't be restored to ``*.bad`` for inspection
+
+        Keeps the next start from tripping over it again, without losing it.
+        """
+        bad_path = self.checkpoint_path + '.bad'
+        try:
+            os.replace(self.checkpoint_path, bad_path)
+        except OSError as e:
+            logger.warning(f"Could not set aside checkpoint {self.checkpoint_path}: {e}")
+            return
+        logger.warning(f"Checkpoint moved to {bad_path}")
+
+
+class DrainingUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently and registers each one as a Lifecycle job
+
+    PTB's own semaphore is left effectively unbounded so every fetched update
+    is tracked at once; concurrency is limited by our own slots instead.
+    With a LaneScheduler, ``classify`` puts each update in a priority lane;
+    the handler then runs in that lane, and an update its lane sheds is
+    dropped with a warning. Handlers run in ``handler_scope``, where a
+    strict LoopWatchdog rejects blocking calls, and with the log context
+    ``describe`` gives for the update (user, handler, trace id).
+    """
+
+    def __init__(self, lifecycle: Lifecycle, max_concurrent_updates: int,
+                 slots: Optional[LaneScheduler] = None,
+                 classify: Optional[Callable[[object], str]] = None,
+                 describe: Optional[Callable[[object], Dict[str, Any]]] = None):
+        super().__init__(max_concurrent_updates=2**16)
+        self.lifecycle = lifecycle
+        self.slots = slots or single_lane(max_concurrent_updates)
+        self.classify = classify
+        self.describe = describe
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        name = self.classify(update) if self.classify else DEFAULT_LANE
+        fields = self.describe(update) if self.describe else {}
+        with self.lifecycle.job([update]), log_context(**fields):
+            try:
+                await self.slots.acquire(name)
+            except Overloaded as e:
+                coroutine.close()
+                logger.warning(f"Dropped update {getattr(update, 'update_id', '?')}: {e}")
+                return
+            except asyncio.CancelledError:
+                # Cancelled while waiting for a slot: the handler never started
+                coroutine.close()
+                raise
+            try:
+                with lane(name), handler_scope():
+                    await coroutine
+            finally:
+                self.slots.release(name)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
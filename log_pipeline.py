@@ -0,0 +1,215 @@
+"""
+Non-blocking logging: records are queued and written as JSON lines by a background thread
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Fields attached to every record logged while serving an update
+CONTEXT_FIELDS = ('user_id', 'handler', 'trace_id')
+
+_log_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """Attach ``fields`` to the records logged in the block (and tasks it creates)"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto each record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in _log_context.get().items():
+            setattr(record, name, value)
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """Lets at most ``burst`` warnings or errors per ``window`` seconds through from one call site
+
+    An error storm logs the same statement over and over, usually with a
+    different message each time (another user, another URL), so records
+    are grouped by logger, level and source line rather than by text. The
+    first record let through after some were held back carries their number
+    as ``suppressed``.
+    """
+
+    def __init__(self, window: float, burst: int, level: int = logging.WARNING):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.level = level
+        self.suppressed_total = 0
+        # Call site -> [window start, records let through, records held back]
+        self._sites: Dict[Tuple[str, int, str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level or not self.burst:
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._sites.get(key)
+            if state is None or now - state[0] >= self.window:
+                held = state[2] if state else 0
+                if len(self._sites) > 10000:
+                    self._sites.clear()
+                self._sites[key] = [now, 1, 0]
+                if held:
+                    record.suppressed = held
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            self.suppressed_total += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, context fields and traceback"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS + ('suppressed',):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, noting records a RepeatFilter held back"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', None)
+        if suppressed:
+            text += f" ({suppressed} similar records suppressed)"
+        return text
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the writer falls behind instead of blocking"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is rendered here, while its arguments are current; the
+        # traceback is formatted by the writer thread, off the caller's thread
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Root logging through a bounded queue to handlers run by a writer thread"""
+
+    def __init__(self, handler: DroppingQueueHandler, repeats: RepeatFilter,
+                 listener: logging.handlers.QueueListener):
+        self.handler = handler
+        self.repeats = repeats
+        self.listener = listener
+        self.running = False
+
+    def start(self):
+        self.listener.start()
+        self.running = True
+
+    def stop(self):
+        """Write out the queued records and stop the writer thread"""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'suppressed': self.repeats.suppressed_total,
+        }
+
+
+def setup_logging(level: str, log_file: Optional[str], json_file: bool = True, max_bytes: int = 0,
+                  backup_count: int = 5, queue_size: int = 10000, repeat_window: float = 60,
+                  repeat_burst: int = 5) -> LogPipeline:
+    """Send root logging through a queue to stdout (text) and ``log_file`` (JSON lines or text)
+
+    Loggers only put records on the queue, so a handler never waits on the
+    terminal or the disk; a background thread writes them. The log file
+    rotates at ``max_bytes`` (0 disables rotation), keeping ``backup_count``
+    old files. Records are dropped, and counted, when ``queue_size`` records
+    are already waiting.
+    """
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(TextFormatter(TEXT_FORMAT))
+    handlers = [console]
+    if log_file:
+        if max_bytes:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            )
+        else:
+            file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter() if json_file else TextFormatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    repeats = RepeatFilter(repeat_window, repeat_burst)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(repeats)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level))
+
+    pipeline = LogPipeline(queue_handler, repeats, listener)
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    return pipeline
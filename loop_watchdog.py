@@ -0,0 +1,271 @@
+"""
+Event loop watchdog: measures loop lag and reports the code that blocks the loop
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Audit events of calls that block the thread making them
+BLOCKING_EVENTS = frozenset({
+    'open', 'os.remove', 'os.rename', 'os.mkdir', 'os.rmdir', 'os.listdir', 'os.scandir',
+    'os.truncate', 'shutil.copyfile', 'shutil.rmtree', 'shutil.move', 'subprocess.Popen',
+    'os.system', 'os.posix_spawn', 'time.sleep', 'sqlite3.connect',
+})
+
+# Frames from these directories are library code, not the call site to blame
+_LIBRARY_PATHS = tuple(sorted({
+    os.path.normcase(path) for name, path in sysconfig.get_paths().items()
+    if name in ('stdlib', 'platstdlib', 'purelib', 'platlib')
+}))
+
+_in_handler: contextvars.ContextVar = contextvars.ContextVar('in_handler', default=False)
+
+# Loop thread id -> the strict watchdog of that loop
+_strict_loops: Dict[int, 'LoopWatchdog'] = {}
+_hook_installed = False
+# Set while a blocking call is reported: reading source lines opens files too
+_reporting = threading.local()
+
+
+class BlockingCallError(RuntimeError):
+    """Raised in strict mode when a handler blocks the event loop"""
+
+
+@contextmanager
+def handler_scope() -> Iterator[None]:
+    """Mark the block (and tasks it creates) as handler code, checked in strict mode"""
+    token = _in_handler.set(True)
+    try:
+        yield
+    finally:
+        _in_handler.reset(token)
+
+
+def _audit(event: str, args: tuple):
+    if event not in BLOCKING_EVENTS or not _strict_loops or getattr(_reporting, 'active', False):
+        return
+    if event == 'open' and isinstance(args[0], int):
+        # Wrapping a descriptor that is already open (pipes, sockets)
+        return
+    watchdog = _strict_loops.get(threading.get_ident())
+    if watchdog is not None and _in_handler.get():
+        watchdog._blocking_call(event, args)
+
+
+def _is_library(filename: str) -> bool:
+    return (filename.startswith('<frozen ') or filename == __file__
+            or os.path.normcase(filename).startswith(_LIBRARY_PATHS))
+
+
+def call_site(stack: List[traceback.FrameSummary]) -> str:
+    """The innermost frame of application code in a stack, as "file:line in function\""""
+    frames = [frame for frame in stack if not _is_library(frame.filename)] or stack
+    if not frames:
+        return "unknown"
+    frame = frames[-1]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+
+
+class _Site:
+    __slots__ = ('count', 'total', 'max', 'stack')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.stack = ''
+
+
+class LoopWatchdog:
+    """Measures the lag of the running event loop and catches what blocks it
+
+    A heartbeat task sleeps ``interval`` seconds and records by how much it
+    woke up late. A helper thread watches the heartbeat: once it is more than
+    ``threshold`` seconds overdue, the loop is stuck in a synchronous call,
+    and the thread grabs the loop thread's stack right then. When the loop
+    comes back the stall is logged with that stack and counted against the
+    call site (the innermost frame outside the standard library and
+    site-packages).
+
+    In ``strict`` mode file, process, sleep and sqlite calls made on the
+    loop thread inside ``handler_scope`` raise BlockingCallError (through an
+    audit hook), and ``check`` - also run when leaving ``async with`` -
+    raises if any stall or blocking call was seen. Meant for tests.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, strict: bool = False,
+                 max_sites: int = 100, smoothing: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.strict = strict
+        self.max_sites = max_sites
+        self.smoothing = smoothing
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.blocked_calls = 0
+        self.sites: Dict[str, _Site] = {}
+        self._loop_thread: Optional[int] = None
+        self._beat = 0.0
+        self._captured: Optional[Tuple[float, List[traceback.FrameSummary]]] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start watching the running loop"""
+        global _hook_installed
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        if self.strict:
+            if not _hook_installed:
+                # Audit hooks can't be removed, so one hook serves every watchdog
+                sys.addaudithook(_audit)
+                _hook_installed = True
+            _strict_loops[self._loop_thread] = self
+
+    async def stop(self):
+        """Stop watching"""
+        _strict_loops.pop(self._loop_thread, None)
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def __aenter__(self) -> 'LoopWatchdog':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+        if self.strict and exc_type is None:
+            self.check()
+
+    def check(self):
+        """Raise BlockingCallError if the loop was blocked since the start"""
+        if not self.sites:
+            return
+        worst = sorted(self.sites.items(), key=lambda item: -item[1].total)
+        details = "; ".join(f"{site} ({stats.count}x, max {stats.max * 1000:.0f} ms)"
+                            for site, stats in worst[:5])
+        raise BlockingCallError(f"Event loop blocked at {len(self.sites)} call sites: {details}")
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            beat = self._beat
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self._beat = time.monotonic()
+            self.lag += self.smoothing * (lag - self.lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                with self._lock:
+                    captured, self._captured = self._captured, None
+                stack = captured[1] if captured and captured[0] == beat else None
+                self._stall(lag, stack)
+
+    def _watch(self):
+        # Poll often enough to catch the loop while it is still stuck
+        poll = max(self.threshold / 2, 0.005)
+        while not self._stopped.wait(poll):
+            beat = self._beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            with self._lock:
+                if self._captured and self._captured[0] == beat:
+                    continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            with self._lock:
+                self._captured = (beat, stack)
+
+    def _record(self, site: str, seconds: float, stack: List[traceback.FrameSummary]) -> Optional[str]:
+        """Count a stall against ``site``; returns its stack the first time the site is seen"""
+        stats = self.sites.get(site)
+        if stats is not None:
+            first = None
+        else:
+            if len(self.sites) >= self.max_sites:
+                site = 'other'
+            stats = self.sites.get(site)
+            if stats is None:
+                stats = self.sites[site] = _Site()
+            stats.stack = stats.stack or ''.join(traceback.format_list(stack[-8:]))
+            first = stats.stack
+        stats.count += 1
+        stats.total += seconds
+        stats.max = max(stats.max, seconds)
+        return first
+
+    def _stall(self, lag: float, stack: Optional[List[traceback.FrameSummary]]):
+        self.stalls += 1
+        # No stack: too short to catch in the act, or many short callbacks in a row
+        site = call_site(stack) if stack else 'unknown'
+        formatted = self._record(site, lag, stack or [])
+        if formatted:
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms at {site}:\n{formatted.rstrip()}")
+        else:
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms at {site}")
+
+    def _blocking_call(self, event: str, args: tuple):
+        # Skip this method and the audit hook
+        caller = sys._getframe(2)
+        if caller.f_code.co_filename.startswith('<frozen importlib'):
+            # First imports are left to the lag measurement: libraries import lazily
+            return
+        frame = caller
+        while frame is not None and _is_library(frame.f_code.co_filename):
+            if frame.f_globals.get('__name__', '').startswith('asyncio.'):
+                # Done by asyncio itself, e.g. spawning a subprocess for create_subprocess_exec
+                return
+            frame = frame.f_back
+        _reporting.active = True
+        try:
+            stack = traceback.extract_stack(caller)
+            site = call_site(stack)
+            self.blocked_calls += 1
+            self._record(site, 0.0, stack)
+        finally:
+            _reporting.active = False
+        target = f" {args[0]!r}" if args else ""
+        raise BlockingCallError(f"{event}{target} blocks the event loop at {site}")
+
+    def snapshot(self) -> Dict:
+        worst = sorted(self.sites.items(), key=lambda item: -item[1].total)
+        return {
+            'lag_ms': round(self.lag * 1000, 1),
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'stalls': self.stalls,
+            'blocked_calls': self.blocked_calls,
+            'sites': {
+                site: {'count': stats.count, 'total_ms': round(stats.total * 1000),
+                       'max_ms': round(stats.max * 1000)}
+                for site, stats in worst[:10]
+            },
+        }
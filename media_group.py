@@ -0,0 +1,70 @@
+"""
+Aggregation of Telegram media groups (albums) into a single batch
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+GroupKey = Tuple[int, str]
+
+
+class MediaGroupCollector:
+    """Buffers the updates of a media group until no new item arrives for ``delay`` seconds
+
+    Telegram delivers every file of an album as a separate update sharing a
+    ``media_group_id``; once the group goes quiet the whole batch is handed
+    to ``on_complete`` in arrival order.
+    """
+
+    def __init__(self, delay: float, on_complete: Callable[[List, object], Awaitable[None]]):
+        self.delay = delay
+        self.on_complete = on_complete
+        self._groups: Dict[GroupKey, List] = {}
+        self._timers: Dict[GroupKey, asyncio.TimerHandle] = {}
+        self._contexts: Dict[GroupKey, object] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, update, context):
+        """Queue one update of a media group"""
+        key = (update.effective_chat.id, update.message.media_group_id)
+        self._groups.setdefault(key, []).append(update)
+        self._contexts[key] = context
+
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        loop = asyncio.get_running_loop()
+        self._timers[key] = loop.call_later(self.delay, self._flush, key, context)
+
+    @property
+    def pending(self) -> int:
+        """Number of groups still being collected"""
+        return len(self._groups)
+
+    def flush_all(self) -> Set[asyncio.Task]:
+        """Hand every group still being collected to ``on_complete`` right away"""
+        for key in list(self._timers):
+            self._timers[key].cancel()
+            self._flush(key, self._contexts.get(key))
+        return set(self._tasks)
+
+    def _flush(self, key: GroupKey, context):
+        self._timers.pop(key, None)
+        self._contexts.pop(key, None)
+        updates = self._groups.pop(key, [])
+        if not updates:
+            return
+
+        updates.sort(key=lambda u: u.message.message_id)
+        task = asyncio.create_task(self.on_complete(updates, context))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error processing media group: {task.exception()}")
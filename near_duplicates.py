@@ -0,0 +1,162 @@
+"""
+Perceptual audio hashes and an LSH index for collapsing near-duplicate uploads
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+
+from fingerprint import FingerprintEngine, pcm_to_samples
+
+HASH_BITS = 256
+TIME_BLOCKS = 16
+FREQ_BANDS = 17
+
+# Leading silence skipped before the hashed window, at most
+MAX_LEADING_SILENCE = 30.0
+
+
+class PerceptualHasher:
+    """256-bit perceptual hash of the start of a clip
+
+    The first ``seconds`` of audio are split into 16 time blocks and 17
+    log-spaced bands between 300 Hz and 3 kHz; each bit is the sign of an
+    energy difference across neighbouring bands and blocks. Re-encoding
+    barely moves those signs, so two transcodes of one recording end up a
+    small Hamming distance apart.
+
+    Silence has no band energy to compare and hashes to the same bits for
+    every clip, so the window starts after any leading silence (10 ms
+    steps quieter than ``silence_db`` dBFS), and a window that is still
+    quieter than that overall is not hashed.
+    """
+
+    def __init__(self, engine: FingerprintEngine, seconds: float = 6.0, silence_db: float = -50.0):
+        self.engine = engine
+        self.seconds = seconds
+        self.silence_db = silence_db
+
+        bins = engine.n_fft // 2 + 1
+        hz_per_bin = engine.sample_rate / engine.n_fft
+        edges = np.geomspace(300, 3000, FREQ_BANDS + 1) / hz_per_bin
+        self.band_edges = np.unique(np.clip(edges.astype(int), 1, bins - 1))[:FREQ_BANDS]
+
+    def hash_pcm(self, pcm: bytes, source_rate: int = 16000) -> Optional[np.ndarray]:
+        """Return the hash as 256 packed bits (32 uint8), or None for clips too short or quiet"""
+        window = int(self.seconds * source_rate)
+        samples = pcm_to_samples(pcm[:int(MAX_LEADING_SILENCE * source_rate + window) * 2])
+        floor = 10 ** (self.silence_db / 20)
+
+        step = max(source_rate // 100, 1)
+        steps = len(samples) // step
+        rms = np.sqrt(np.mean(samples[:steps * step].reshape(steps, step) ** 2, axis=1))
+        loud = np.flatnonzero(rms > floor)
+        if len(loud) == 0:
+            return None
+        samples = samples[loud[0] * step:][:window]
+        if np.sqrt(np.mean(samples ** 2)) < floor:
+            return None
+
+        samples = self.engine.resample(samples, source_rate)
+        frames = self.engine.frames(samples)
+        if len(frames) < TIME_BLOCKS * 2 or len(self.band_edges) < FREQ_BANDS:
+            return None
+
+        power = np.abs(np.fft.rfft(frames * self.engine.window, axis=1)) ** 2
+        bands = np.add.reduceat(power, self.band_edges, axis=1)[:, :FREQ_BANDS]
+
+        block_edges = np.linspace(0, len(bands), TIME_BLOCKS + 2).astype(int)[:-1]
+        blocks = np.log1p(np.add.reduceat(bands, block_edges, axis=0))
+
+        # Haitsma-Kalker style bits: band slope change between consecutive blocks
+        slopes = np.diff(blocks, axis=1)
+        bits = np.diff(slopes, axis=0) > 0
+        return np.packbits(bits.ravel()[:HASH_BITS])
+
+
+class NearDuplicate:
+    """A remembered clip and the recognition result it produced"""
+
+    __slots__ = ('bits', 'track', 'seen_at')
+
+    def __init__(self, bits: np.ndarray, track: Optional[Dict], seen_at: float):
+        self.bits = bits
+        self.track = track
+        self.seen_at = seen_at
+
+
+class NearDuplicateIndex:
+    """Bit-sampling LSH over perceptual hashes with a sliding time window
+
+    Hash bits are shuffled once and cut into bands of ``band_bits`` bits;
+    clips sharing any band are candidates and are confirmed by exact Hamming
+    distance.
+    """
+
+    def __init__(self, window_seconds: float, max_distance: int = 48, band_bits: int = 10,
+                 max_entries: int = 100_000, seed: int = 0):
+        self.window_seconds = window_seconds
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.permutation = np.random.default_rng(seed).permutation(HASH_BITS)
+        self.band_bits = band_bits
+        bands = HASH_BITS // band_bits
+        self._tables: List[Dict[bytes, List[NearDuplicate]]] = [{} for _ in range(bands)]
+        self._entries: Deque[NearDuplicate] = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, bits: np.ndarray) -> List[bytes]:
+        shuffled = np.unpackbits(bits)[self.permutation]
+        return [
+            np.packbits(shuffled[band * self.band_bits:(band + 1) * self.band_bits]).tobytes()
+            for band in range(len(self._tables))
+        ]
+
+    def _expire(self, now: float):
+        while self._entries and (
+            now - self._entries[0].seen_at > self.window_seconds
+            or len(self._entries) > self.max_entries
+        ):
+            entry = self._entries.popleft()
+            for table, key in zip(self._tables, self._band_keys(entry.bits)):
+                bucket = table.get(key)
+                if bucket is not None:
+                    bucket.remove(entry)
+                    if not bucket:
+                        del table[key]
+
+    def find(self, bits: np.ndarray) -> Optional[NearDuplicate]:
+        """Return the closest remembered clip within ``max_distance`` bits, if any"""
+        with self._lock:
+            self._expire(time.monotonic())
+
+            candidates = {
+                id(entry): entry
+                for table, key in zip(self._tables, self._band_keys(bits))
+                for entry in table.get(key, ())
+            }
+            if not candidates:
+                return None
+
+            entries = list(candidates.values())
+            stacked = np.stack([entry.bits for entry in entries])
+            distances = np.unpackbits(stacked ^ bits, axis=1).sum(axis=1)
+
+            best = int(np.argmin(distances))
+            return entries[best] if distances[best] <= self.max_distance else None
+
+    def add(self, bits: np.ndarray, track: Optional[Dict]):
+        """Remember the recognition result of a clip"""
+        with self._lock:
+            now = time.monotonic()
+            entry = NearDuplicate(bits, track, now)
+            self._entries.append(entry)
+            for table, key in zip(self._tables, self._band_keys(bits)):
+                table.setdefault(key, []).append(entry)
+            self._expire(now)
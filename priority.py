@@ -0,0 +1,220 @@
+"""
+Priority lanes: weighted fair sharing of concurrency slots with admission control
+"""
+
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Mapping
+
+INLINE = 'inline'
+COMMAND = 'command'
+RECOGNITION = 'recognition'
+BACKGROUND = 'background'
+LANES = (INLINE, COMMAND, RECOGNITION, BACKGROUND)
+
+# Work that was not put in a lane (or with lanes disabled) runs in this one
+DEFAULT_LANE = COMMAND
+
+_current_lane: contextvars.ContextVar = contextvars.ContextVar('lane', default=DEFAULT_LANE)
+
+
+class Overloaded(Exception):
+    """Raised when a lane's queue is full or a waiter outlived its max_wait"""
+
+
+class LaneConfig:
+    """Scheduling parameters of one lane"""
+
+    __slots__ = ('weight', 'max_queue', 'max_wait', 'max_share')
+
+    def __init__(self, weight: float = 1, max_queue: int = 0, max_wait: float = 0,
+                 max_share: float = 1.0):
+        if weight <= 0:
+            raise ValueError("lane weight must be positive")
+        self.weight = weight
+        # 0 disables the queue length and wait limits
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_share = max_share
+
+    def __repr__(self):
+        return (f"LaneConfig(weight={self.weight}, max_queue={self.max_queue}, "
+                f"max_wait={self.max_wait}, max_share={self.max_share})")
+
+
+def parse_lanes(spec: Mapping[str, Mapping], shares: bool = True) -> Dict[str, LaneConfig]:
+    """LaneConfigs from the PRIORITY_LANES setting; ``shares`` False drops the caps"""
+    lanes = {}
+    for name, options in spec.items():
+        options = dict(options)
+        if not shares:
+            options.pop('max_share', None)
+        lanes[name] = LaneConfig(**options)
+    if DEFAULT_LANE not in lanes:
+        lanes[DEFAULT_LANE] = LaneConfig()
+    return lanes
+
+
+def current_lane() -> str:
+    """Lane of the work running in the current task"""
+    return _current_lane.get()
+
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+    """Run the block (and tasks it creates) in lane ``name``"""
+    token = _current_lane.set(name)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+class _Lane:
+    __slots__ = ('config', 'waiters', 'running', 'pass_', 'admitted', 'rejected', 'expired')
+
+    def __init__(self, config: LaneConfig):
+        self.config = config
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.running = 0
+        # Virtual time of the lane: advances by 1/weight per slot granted
+        self.pass_ = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+
+class LaneScheduler:
+    """Hands out ``limit`` slots to the waiters of several lanes by weighted fair share
+
+    While lanes compete, each gets slots in proportion to its weight (stride
+    scheduling: the waiting lane that is furthest behind goes next). A lane
+    that was idle joins at the current virtual time, so it cannot bank credit
+    and then starve the others. ``max_share`` caps the fraction of the slots
+    one lane may hold at once, which keeps room for the other lanes when its
+    work is long-running.
+
+    Admission control: a lane with ``max_queue`` waiters rejects the next one
+    at once, and a waiter still queued after ``max_wait`` seconds is dropped;
+    both raise Overloaded. An unknown lane name falls back to DEFAULT_LANE.
+    """
+
+    def __init__(self, limit: int, lanes: Mapping[str, LaneConfig]):
+        self.limit = limit
+        self._lanes = {name: _Lane(config) for name, config in lanes.items()}
+        if DEFAULT_LANE not in self._lanes:
+            self._lanes[DEFAULT_LANE] = _Lane(LaneConfig())
+        self._in_flight = 0
+        self._queued = 0
+        self._virtual_time = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _lane(self, name: str) -> _Lane:
+        return self._lanes.get(name) or self._lanes[DEFAULT_LANE]
+
+    def _cap(self, entry: _Lane) -> int:
+        return max(1, int(entry.config.max_share * self.limit))
+
+    def _grant(self, entry: _Lane):
+        self._in_flight += 1
+        entry.running += 1
+        entry.admitted += 1
+        self._virtual_time = entry.pass_
+        entry.pass_ += 1 / entry.config.weight
+
+    async def acquire(self, name: str):
+        entry = self._lane(name)
+        if not self._queued and self._in_flight < self.limit and entry.running < self._cap(entry):
+            self._grant(entry)
+            return
+
+        config = entry.config
+        if config.max_queue and len(entry.waiters) >= config.max_queue:
+            entry.rejected += 1
+            raise Overloaded(f"{name} lane queue is full ({config.max_queue} waiting)")
+
+        if not entry.waiters:
+            entry.pass_ = max(entry.pass_, self._virtual_time)
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        entry.waiters.append(waiter)
+        self._queued += 1
+        timer = loop.call_later(config.max_wait, self._expire, entry, waiter) if config.max_wait else None
+        self.dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancellation
+                self.release(name)
+            else:
+                self._forget(entry, waiter)
+            raise
+        except Overloaded:
+            raise Overloaded(f"{name} lane waited more than {config.max_wait}s") from None
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def _forget(self, entry: _Lane, waiter: asyncio.Future):
+        try:
+            entry.waiters.remove(waiter)
+        except ValueError:
+            return
+        self._queued -= 1
+
+    def _expire(self, entry: _Lane, waiter: asyncio.Future):
+        if waiter.done():
+            return
+        self._forget(entry, waiter)
+        entry.expired += 1
+        waiter.set_exception(Overloaded())
+
+    def release(self, name: str):
+        entry = self._lane(name)
+        self._in_flight -= 1
+        entry.running -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        """Grant free slots to waiters, the lane furthest behind first"""
+        while self._queued and self._in_flight < self.limit:
+            eligible = [
+                entry for entry in self._lanes.values()
+                if entry.waiters and entry.running < self._cap(entry)
+            ]
+            if not eligible:
+                return
+            entry = min(eligible, key=lambda candidate: candidate.pass_)
+            waiter = entry.waiters.popleft()
+            self._queued -= 1
+            if waiter.done():
+                continue
+            self._grant(entry)
+            waiter.set_result(None)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {
+                'running': entry.running,
+                'queued': len(entry.waiters),
+                'admitted': entry.admitted,
+                'rejected': entry.rejected,
+                'expired': entry.expired,
+            }
+            for name, entry in self._lanes.items()
+        }
+
+
+def single_lane(limit: int) -> LaneScheduler:
+    """A scheduler with only the default lane: a plain FIFO semaphore"""
+    return LaneScheduler(limit, {DEFAULT_LANE: LaneConfig()})
@@ -0,0 +1,363 @@
+"""
+In-memory fuzzy search over tracks seen in charts, recognitions and searches
+"""
+
+import asyncio
+import json
+import logging
+import math
+import zlib
+from array import array
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from artists import fold_text
+
+logger = logging.getLogger(__name__)
+
+# Track fields kept for answering inline queries (what Serialize.track reads)
+KEPT_FIELDS = ('key', 'title', 'subtitle', 'images', 'hub', 'artists', 'url')
+
+_GRAM_MASK = 0xFFFFFFFF
+
+# Postings handled per step of a merge, between which other threads may run
+_MERGE_CHUNK = 1 << 18
+
+
+def trigrams(text: str, prefix: bool = False) -> List[int]:
+    """Hashed trigrams of the words of folded ``text``, each word padded like pg_trgm
+
+    With ``prefix`` the last word is taken as unfinished: its closing
+    trigram is left out, so "blin" matches "blinding".
+    """
+    words = text.split()
+    grams = set()
+    last = len(words) - 1
+    for i, word in enumerate(words):
+        padded = f"  {word} "
+        end = len(padded) - (3 if prefix and i == last else 2)
+        grams.update([hash(padded[j:j + 3]) & _GRAM_MASK for j in range(end)])
+    return sorted(grams)
+
+
+class TrackSearchIndex:
+    """Trigram index of track titles and artists, bounded to ``max_tracks`` tracks
+
+    Titles and artists are folded (case, accents, Arabic/Persian letter
+    variants) and cut into padded word trigrams, so a typo costs only a few
+    trigrams and a word's first trigrams match its prefix; the last query
+    word is matched as a prefix, for typeahead. A track matches when it
+    contains at least ``min_score`` of the query's trigrams, and is scored
+    by the overlap of the two trigram sets (Jaccard), so a one-word query
+    found inside a long title scores low and the full title scores near 1.
+
+    Compacted postings are sorted numpy arrays (unique trigrams, their start
+    offsets, and track entries) searched with ``np.searchsorted``. New tracks
+    go to a pending dict first and are merged in once it grows past a
+    quarter of the index (or ``compact_threshold``). On an event loop the
+    merge runs in the default executor, lookups reading the pending
+    postings handed to it meanwhile, and the merged arrays are swapped in
+    when it is done; without a running loop ``compact`` merges right away.
+
+    Tracks live in a ring of ``max_tracks`` slots, the oldest dropped first;
+    a track seen again after half a ring is moved to the front. Postings
+    of dropped tracks are skipped at lookup and discarded at compaction.
+    Trigram hashes use Python's per-process string hash: the index is never
+    persisted.
+    """
+
+    def __init__(self, max_tracks: int, min_score: float = 0.8, compact_threshold: int = 100_000):
+        self.max_tracks = max_tracks
+        self.min_score = min_score
+        self.compact_threshold = compact_threshold
+        self._generation = 0
+        self._reset()
+
+    def _reset(self):
+        # Entry number of the track in each slot (entry % max_tracks); -1 when empty
+        self._slot_entries = np.full(self.max_tracks, -1, dtype=np.int64)
+        self._keys: List[Optional[str]] = [None] * self.max_tracks
+        self._payloads: List[Optional[bytes]] = [None] * self.max_tracks
+        self._popularity = np.zeros(self.max_tracks, dtype=np.uint32)
+        self._gram_counts = np.zeros(self.max_tracks, dtype=np.uint16)
+        self._entries: Dict[str, int] = {}
+        self._next_entry = 0
+
+        self._grams = np.empty(0, dtype=np.uint32)
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._postings = np.empty(0, dtype=np.uint32)
+        self._pending: Dict[int, array] = {}
+        self._pending_size = 0
+        # Pending postings handed to a merge still running in the executor
+        self._merging: Dict[int, array] = {}
+        self._merge: Optional[asyncio.Future] = None
+        # Bumped by clear() and compact() so that a running merge is discarded
+        self._generation += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def nbytes(self) -> int:
+        """Bytes used by postings, slot tables and stored tracks"""
+        pending = sum(part.itemsize * len(part)
+                      for parts in (self._pending, self._merging) for part in parts.values())
+        return (self._grams.nbytes + self._starts.nbytes + self._postings.nbytes + pending
+                + self._slot_entries.nbytes + self._popularity.nbytes + self._gram_counts.nbytes
+                + sum(len(payload) for payload in self._payloads if payload))
+
+    def add(self, track: Dict):
+        """Index a track payload, or refresh it when it is already indexed"""
+        key = str(track.get('key') or '')
+        title = track.get('title')
+        if not key or not title:
+            return
+
+        payload = zlib.compress(json.dumps(
+            {field: track[field] for field in KEPT_FIELDS if field in track},
+            ensure_ascii=False, separators=(',', ':'),
+        ).encode('utf-8'), 1)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            slot = entry % self.max_tracks
+            if self._next_entry - entry < self.max_tracks // 2:
+                self._payloads[slot] = payload
+                self._popularity[slot] += 1
+                return
+            # About to fall off the ring: move it to the front
+            popularity = int(self._popularity[slot]) + 1
+            self._forget_slot(slot)
+        else:
+            popularity = 1
+
+        if self._next_entry > _GRAM_MASK:
+            # Entries are stored as 32-bit numbers; start over rather than wrap
+            self.clear()
+
+        entry = self._next_entry
+        self._next_entry += 1
+        slot = entry % self.max_tracks
+        if self._slot_entries[slot] >= 0:
+            self._forget_slot(slot)
+
+        grams = trigrams(fold_text(f"{title} {track.get('subtitle') or ''}"))
+        self._slot_entries[slot] = entry
+        self._keys[slot] = key
+        self._payloads[slot] = payload
+        self._popularity[slot] = popularity
+        self._gram_counts[slot] = min(len(grams), 0xFFFF)
+        self._entries[key] = entry
+
+        for gram in grams:
+            postings = self._pending.get(gram)
+            if postings is None:
+                postings = self._pending[gram] = array('I')
+            postings.append(entry)
+        self._pending_size += len(grams)
+        if self._pending_size >= max(self.compact_threshold, len(self._postings) // 4):
+            self._schedule_compact()
+
+    def _forget_slot(self, slot: int):
+        del self._entries[self._keys[slot]]
+        self._slot_entries[slot] = -1
+        self._keys[slot] = None
+        self._payloads[slot] = None
+
+    def _live(self, entries: np.ndarray) -> np.ndarray:
+        return self._slot_entries[entries % self.max_tracks] == entries
+
+    def _schedule_compact(self):
+        """Start merging the pending postings in the executor (at once without a loop)"""
+        if self._merge is not None:
+            # One merge at a time; the next one starts when it is done
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact()
+            return
+
+        self._merging, self._pending = self._pending, {}
+        self._pending_size = 0
+        self._merge = loop.run_in_executor(
+            None, self._merged, self._grams, self._starts, self._postings, self._merging
+        )
+        self._merge.add_done_callback(partial(self._merge_done, self._generation))
+
+    def _merge_done(self, generation: int, future: asyncio.Future):
+        if generation != self._generation:
+            return
+        self._merge = None
+        if future.cancelled() or future.exception() is not None:
+            if not future.cancelled():
+                logger.error(f"Track search index compaction failed: {future.exception()}")
+            # Hand the postings back, ahead of those added since
+            for gram, part in self._pending.items():
+                self._merging.setdefault(gram, array('I')).extend(part)
+            self._pending, self._merging = self._merging, {}
+            self._pending_size = sum(len(part) for part in self._pending.values())
+            return
+
+        self._grams, self._starts, self._postings = future.result()
+        self._merging = {}
+        logger.debug(f"Track search index compacted: {len(self)} tracks, "
+                     f"{len(self._postings)} postings")
+        if self._pending_size >= max(self.compact_threshold, len(self._postings) // 4):
+            self._schedule_compact()
+
+    def compact(self):
+        """Merge pending postings into the sorted arrays now, dropping those of removed tracks"""
+        # Copies: a merge may still be reading the arrays in the executor
+        pending = {gram: array('I', part) for gram, part in self._merging.items()}
+        for gram, part in self._pending.items():
+            pending.setdefault(gram, array('I')).extend(part)
+        if not pending:
+            return
+        self._grams, self._starts, self._postings = self._merged(
+            self._grams, self._starts, self._postings, pending
+        )
+        # A merge still running in the executor is superseded by this one
+        self._generation += 1
+        self._merge = None
+        self._merging = {}
+        self._pending = {}
+        self._pending_size = 0
+        logger.debug(f"Track search index compacted: {len(self)} tracks, "
+                     f"{len(self._postings)} postings")
+
+    def _merged(self, grams: np.ndarray, starts: np.ndarray, postings: np.ndarray,
+                pending: Dict[int, array]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """New sorted arrays holding ``postings`` and ``pending``, without removed tracks
+
+        Runs in the executor while the loop keeps serving lookups, so every
+        step that holds the GIL is done in slices of ``_MERGE_CHUNK``
+        postings; only the sort, which releases it, sees the whole array.
+        Entries are unique numbers, so tracks dropped during a merge only
+        leave postings that lookups skip anyway.
+        """
+        total = len(postings) + sum(len(part) for part in pending.values())
+        # Packed (trigram, entry) keys: one sort orders both at once
+        keys = np.empty(total, dtype=np.uint64)
+        size = 0
+
+        def put(part_grams: np.ndarray, part_entries: np.ndarray):
+            nonlocal size
+            live = self._live(part_entries.astype(np.int64))
+            part_grams, part_entries = part_grams[live], part_entries[live]
+            keys[size:size + len(part_grams)] = (
+                (part_grams.astype(np.uint64) << np.uint64(32)) | part_entries
+            )
+            size += len(part_grams)
+
+        # Compacted postings, a run of whole trigrams at a time
+        bounds = np.unique(np.searchsorted(
+            starts, np.arange(0, len(postings), _MERGE_CHUNK), side='right'
+        ) - 1)
+        bounds = np.append(bounds, len(grams))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            lo, hi = starts[a], starts[b]
+            put(np.repeat(grams[a:b], np.diff(starts[a:b + 1])), postings[lo:hi])
+
+        # Then the pending ones, gathered into slices of about the same size
+        batch_grams, batch_entries = array('I'), array('I')
+        for i, (gram, part) in enumerate(pending.items()):
+            batch_grams.extend(array('I', [gram]) * len(part))
+            batch_entries.extend(part)
+            if len(batch_entries) >= _MERGE_CHUNK or i == len(pending) - 1:
+                put(np.frombuffer(batch_grams, dtype=np.uint32).copy(),
+                    np.frombuffer(batch_entries, dtype=np.uint32).copy())
+                batch_grams, batch_entries = array('I'), array('I')
+
+        keys = keys[:size]
+        keys.sort()
+
+        entries = np.empty(size, dtype=np.uint32)
+        unique: List[np.ndarray] = []
+        firsts: List[np.ndarray] = []
+        previous = None
+        for a in range(0, size, _MERGE_CHUNK):
+            chunk = keys[a:a + _MERGE_CHUNK]
+            chunk_grams = (chunk >> np.uint64(32)).astype(np.uint32)
+            entries[a:a + len(chunk)] = chunk & np.uint64(_GRAM_MASK)
+            new = np.empty(len(chunk), dtype=bool)
+            new[0] = previous is None or chunk_grams[0] != previous
+            np.not_equal(chunk_grams[1:], chunk_grams[:-1], out=new[1:])
+            unique.append(chunk_grams[new])
+            firsts.append(np.flatnonzero(new) + a)
+            previous = chunk_grams[-1]
+
+        if not unique:
+            return np.empty(0, dtype=np.uint32), np.zeros(1, dtype=np.int64), entries
+        return (np.concatenate(unique),
+                np.append(np.concatenate(firsts), size).astype(np.int64), entries)
+
+    def _postings_of(self, grams: List[int]) -> List[List[np.ndarray]]:
+        """Sorted posting arrays (compacted, being merged, then pending) of each query trigram"""
+        positions = np.searchsorted(self._grams, np.asarray(grams, dtype=np.uint32))
+        postings = []
+        for gram, position in zip(grams, positions):
+            parts = []
+            if position < len(self._grams) and self._grams[position] == gram:
+                parts.append(self._postings[self._starts[position]:self._starts[position + 1]])
+            for pending in (self._merging.get(gram), self._pending.get(gram)):
+                if pending:
+                    # Entries only grow, so pending postings are sorted too
+                    parts.append(np.frombuffer(pending, dtype=np.uint32))
+            postings.append(parts)
+        return postings
+
+    def search(self, query: str, limit: int) -> List[Tuple[Dict, float]]:
+        """Best matches for ``query`` and their similarity to it (0-1), best first"""
+        text = fold_text(query)
+        # A trailing space means the last word is finished
+        grams = trigrams(text, prefix=not query[-1:].isspace())
+        if not grams or not self._entries:
+            return []
+
+        postings = self._postings_of(grams)
+        needed = math.ceil(self.min_score * len(grams))
+
+        # A match has at least ``needed`` of the trigrams, so it is in at least
+        # one of the len - needed + 1 rarest lists: only those give candidates
+        sizes = [sum(len(part) for part in parts) for parts in postings]
+        order = sorted(range(len(grams)), key=sizes.__getitem__)
+        seeds = len(grams) - needed + 1
+        parts = [part for i in order[:seeds] for part in postings[i]]
+        if not parts:
+            return []
+        candidates, counts = np.unique(np.concatenate(parts), return_counts=True)
+        candidates = candidates.astype(np.int64)
+
+        # Then the other lists, rarest first, dropping candidates as soon as
+        # they miss too many trigrams to reach ``needed``
+        remaining = len(grams) - seeds
+        for i in order[seeds:]:
+            keep = counts + remaining >= needed
+            candidates, counts = candidates[keep], counts[keep]
+            if len(candidates) == 0:
+                return []
+            for part in postings[i]:
+                positions = np.minimum(np.searchsorted(part, candidates), len(part) - 1)
+                counts += part[positions] == candidates
+            remaining -= 1
+        # Each track has a trigram at most once, so counts are its overlap
+        matched = (counts >= needed) & self._live(candidates)
+        candidates, counts = candidates[matched], counts[matched]
+        if len(candidates) == 0:
+            return []
+
+        # Closest to the whole query first, then more popular
+        slots = candidates % self.max_tracks
+        track_grams = self._gram_counts[slots].astype(np.int64)
+        scores = counts / np.maximum(len(grams) + track_grams - counts, 1)
+        order = np.lexsort((-self._popularity[slots].astype(np.int64), -scores))[:limit]
+        return [
+            (json.loads(zlib.decompress(self._payloads[slots[i]])), float(scores[i]))
+            for i in order
+        ]
+
+    def clear(self):
+        """Drop every track"""
+        self._reset()
@@ -0,0 +1,263 @@
+"""
+Compact columnar per-user sessions with idle eviction to SQLite
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Language column value for users who never picked a language
+NO_LANGUAGE = -1
+
+
+class SessionStore:
+    """Per-user language choice and rate-limit clock in typed array columns
+
+    Each user maps to a row number and every field is an ``array`` column,
+    so a session costs one dict entry plus 26 bytes instead of several
+    dicts, lists and datetime objects. Rate limiting uses GCRA, which needs
+    a single timestamp per user instead of a list of recent requests.
+
+    Sessions idle for ``idle_seconds`` are evicted by ``evict_idle``; changed
+    language choices are written to the SQLite ``database`` first and loaded
+    back by ``load`` the next time the user shows up. Without a database
+    only sessions of users who never chose a language are evicted, so no
+    choice is lost. NumPy, used for the sweeps over whole columns, is only
+    imported once one runs, so it stays out of startup.
+
+    Database calls run on one worker thread that owns the connection, never
+    on the event loop; being a single thread, it also makes a load wait for
+    the write of an eviction that came before it.
+    """
+
+    def __init__(self, languages: Sequence[str], rate_limit: int, rate_period: float = 60.0,
+                 idle_seconds: float = 3600, database: Optional[str] = None):
+        self.languages = list(languages)
+        self.idle_seconds = idle_seconds
+        self.set_rate_limit(rate_limit, rate_period)
+
+        self._rows: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._user_ids = array('q')
+        self._language = array('b')
+        self._dirty = array('b')
+        self._tat = array('d')
+        self._last_seen = array('d')
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if database:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sessions')
+            self._executor.submit(self._open, database).result()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._rows
+
+    def nbytes(self) -> int:
+        """Bytes held by the columns (the row map is not included)"""
+        return sum(column.itemsize * len(column) for column in (
+            self._user_ids, self._language, self._dirty, self._tat, self._last_seen
+        ))
+
+    def set_rate_limit(self, rate_limit: int, rate_period: float = 60.0):
+        # GCRA: one request per interval, with bursts of up to rate_limit requests
+        self.interval = rate_period / max(rate_limit, 1)
+        self.burst = rate_period - self.interval
+
+    def set_languages(self, languages: Sequence[str]):
+        """Switch to a new language list, remapping every stored choice
+
+        Choices of a language that is no longer offered fall back to
+        NO_LANGUAGE (the default language).
+        """
+        import numpy as np
+
+        languages = list(languages)
+        # The extra last entry maps NO_LANGUAGE (-1) to itself
+        remap = np.array([
+            languages.index(language) if language in languages else NO_LANGUAGE
+            for language in self.languages
+        ] + [NO_LANGUAGE], dtype=np.int8)
+        column = np.frombuffer(self._language, dtype=np.int8)
+        column[:] = remap[column]
+        del column
+        self.languages = languages
+
+    # Database calls, made on the worker thread only
+
+    def _open(self, database: str):
+        self._db = sqlite3.connect(database)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (user_id INTEGER PRIMARY KEY, language TEXT)"
+        )
+        self._db.commit()
+
+    def _select(self, user_id: int) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT language FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _store(self, records: List[Tuple[int, str]]):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO sessions (user_id, language) VALUES (?, ?)", records
+        )
+        self._db.commit()
+
+    def _close_db(self):
+        self._db.close()
+        self._db = None
+
+    async def load(self, user_id: int):
+        """Load the stored language of a user not in memory, off the event loop
+
+        Call it before anything else touches the user: the other methods
+        start an unknown user's session with no language.
+        """
+        if self._executor is None or user_id in self._rows:
+            return
+        loop = asyncio.get_running_loop()
+        stored = await loop.run_in_executor(self._executor, self._select, user_id)
+        language = self.languages.index(stored) if stored in self.languages else NO_LANGUAGE
+        row = self._rows.get(user_id)
+        if row is None:
+            self._row(user_id, language)
+        elif not self._dirty[row]:
+            # Started while the load was running, without a choice of its own
+            self._language[row] = language
+
+    def _row(self, user_id: int, language: int = NO_LANGUAGE) -> int:
+        """Row of a user, creating the session with ``language`` on first sight"""
+        now = time.monotonic()
+        row = self._rows.get(user_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._user_ids[row] = user_id
+                self._language[row] = language
+                self._dirty[row] = 0
+                self._tat[row] = 0.0
+            else:
+                row = len(self._user_ids)
+                self._user_ids.append(user_id)
+                self._language.append(language)
+                self._dirty.append(0)
+                self._tat.append(0.0)
+                self._last_seen.append(now)
+            self._rows[user_id] = row
+        self._last_seen[row] = now
+        return row
+
+    def language(self, user_id: int) -> int:
+        """The user's language index, or NO_LANGUAGE if they never chose one"""
+        return self._language[self._row(user_id)]
+
+    def set_language(self, user_id: int, language: int):
+        row = self._row(user_id)
+        self._language[row] = language
+        self._dirty[row] = 1
+
+    def allow(self, user_id: int) -> bool:
+        """Count a request against the user's rate limit; False if it is over"""
+        row = self._row(user_id)
+        now = self._last_seen[row]
+        tat = max(self._tat[row], now)
+        if tat - now > self.burst:
+            return False
+        self._tat[row] = tat + self.interval
+        return True
+
+    def _take_dirty(self, rows) -> List[Tuple[int, str]]:
+        """Records to persist for the dirty ``rows``, which are marked clean"""
+        records = [
+            (self._user_ids[row], self.languages[self._language[row]])
+            for row in rows
+            if self._dirty[row] and self._language[row] != NO_LANGUAGE
+        ]
+        for row in rows:
+            self._dirty[row] = 0
+        return records
+
+    async def _write(self, rows) -> int:
+        """Persist the language of dirty ``rows``; returns how many were written"""
+        records = self._take_dirty(rows)
+        if self._executor is None or not records:
+            return len(records)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._store, records)
+        except BaseException:
+            # Not persisted: sessions still in memory keep the change
+            for user_id, _ in records:
+                row = self._rows.get(user_id)
+                if row is not None:
+                    self._dirty[row] = 1
+            raise
+        return len(records)
+
+    async def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop sessions idle for longer than ``idle_seconds``; returns how many"""
+        import numpy as np
+
+        now = time.monotonic() if now is None else now
+        last_seen = np.frombuffer(self._last_seen, dtype=np.float64)
+        idle = np.flatnonzero(last_seen < now - self.idle_seconds)
+        # Release the buffer so the columns can grow again
+        del last_seen
+        if self._db is None:
+            # Nowhere to persist a language choice: keep the sessions that have one
+            language = np.frombuffer(self._language, dtype=np.int8)
+            idle = idle[language[idle] == NO_LANGUAGE]
+            del language
+
+        if len(idle) == 0:
+            return 0
+
+        rows = idle.tolist()
+        await self._write(rows)
+        # Users who came back while their choices were written stay
+        cutoff = now - self.idle_seconds
+        rows = [row for row in rows if self._last_seen[row] < cutoff]
+        for row in rows:
+            del self._rows[self._user_ids[row]]
+            # Free rows never look idle
+            self._last_seen[row] = float('inf')
+        self._free.extend(rows)
+
+        logger.debug(f"Evicted {len(rows)} idle sessions, {len(self._rows)} active")
+        return len(rows)
+
+    def _dirty_rows(self) -> List[int]:
+        import numpy as np
+
+        dirty = np.frombuffer(self._dirty, dtype=np.int8)
+        rows = np.flatnonzero(dirty).tolist()
+        del dirty
+        return rows
+
+    async def flush(self) -> int:
+        """Persist every changed language without evicting anything"""
+        return await self._write(self._dirty_rows())
+
+    def close(self):
+        """Persist what is left and close the database
+
+        Blocks until the worker is done, so on a running loop await
+        ``flush`` first and this only has the connection left to close.
+        """
+        records = self._take_dirty(self._dirty_rows())
+        if self._executor is None:
+            return
+        if records:
+            self._executor.submit(self._store, records).result()
+        self._executor.submit(self._close_db).result()
+        self._executor.shutdown()
+        self._executor = None
@@ -0,0 +1,129 @@
+"""
+Typed, reloadable view of the settings in config.py
+"""
+
+import runpy
+from typing import Any, Dict, List, Mapping, Set, get_args, get_origin, get_type_hints
+
+
+class SettingsError(Exception):
+    """Raised when config.py cannot be read or a setting has the wrong type"""
+
+
+def read_config(path: str) -> Dict[str, Any]:
+    """Execute a config file and return its upper-case settings"""
+    try:
+        namespace = runpy.run_path(path)
+    except Exception as e:
+        raise SettingsError(f"could not read {path}: {e}") from e
+    return {name: value for name, value in namespace.items() if name.isupper()}
+
+
+def _matches(value: Any, expected) -> bool:
+    origin = get_origin(expected) or expected
+    if expected is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    if not isinstance(value, origin):
+        return False
+    args = get_args(expected)
+    if origin is list and args:
+        return all(_matches(item, args[0]) for item in value)
+    if origin is dict and args:
+        return all(_matches(k, args[0]) and _matches(v, args[1]) for k, v in value.items())
+    return True
+
+
+class Settings:
+    """The settings that may change while the bot runs
+
+    Each attribute is the lower-case name of a config.py setting. Instances
+    are never modified: a reload builds a new one and the bot swaps it in,
+    so a handler always sees one consistent snapshot. Every other setting
+    in config.py is only read at startup (see ``restart_required``).
+    """
+
+    bot_username: str
+    default_language: str
+    language_names: Dict[str, str]
+
+    max_inline_results: int
+    inline_max_pages: int
+    inline_cursor_ttl: float
+    max_audio_file_size: int
+    max_video_file_size: int
+    supported_audio_formats: List[str]
+    recognition_window_seconds: float
+    enable_media_groups: bool
+
+    admin_user_ids: List[int]
+    log_level: str
+
+    enable_rate_limiting: bool
+    max_requests_per_minute: int
+
+    enable_audio_recognition: bool
+    enable_video_recognition: bool
+    enable_inline_mode: bool
+    enable_language_selection: bool
+    enable_track_info: bool
+    enable_artist_info: bool
+    enable_charts: bool
+
+    inline_description: Dict[str, str]
+    media_group_processing_message: Dict[str, str]
+    media_group_summary_message: Dict[str, str]
+    media_group_not_recognized: Dict[str, str]
+    media_group_item_failed: Dict[str, str]
+    bot_about_text: Dict[str, str]
+    start_message: Dict[str, str]
+    help_message: Dict[str, str]
+    error_messages: Dict[str, Dict[str, str]]
+
+    def __init__(self, values: Mapping[str, Any]):
+        problems = []
+        for name, expected in get_type_hints(type(self)).items():
+            key = name.upper()
+            if key not in values:
+                problems.append(f"{key} is missing")
+            elif not _matches(values[key], expected):
+                problems.append(f"{key} should be {getattr(expected, '__name__', expected)}, "
+                                f"got {type(values[key]).__name__}")
+            else:
+                object.__setattr__(self, name, values[key])
+        if problems:
+            raise SettingsError("Invalid settings:\n  " + "\n  ".join(problems))
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("Settings are read-only; reload them instead")
+
+    @classmethod
+    def names(cls) -> List[str]:
+        return list(get_type_hints(cls))
+
+    def changed(self, other: 'Settings') -> Set[str]:
+        """Names of the settings whose value differs in ``other``"""
+        return {name for name in self.names() if getattr(self, name) != getattr(other, name)}
+
+
+# What has to be rebuilt when these settings change
+CATALOG_SETTINGS = {
+    'bot_username', 'default_language', 'language_names', 'inline_description',
+    'media_group_processing_message', 'media_group_summary_message', 'media_group_not_recognized',
+    'media_group_item_failed', 'bot_about_text', 'start_message', 'help_message', 'error_messages',
+}
+INLINE_SETTINGS = {'max_inline_results', 'inline_max_pages', 'inline_cursor_ttl'}
+HANDLER_SETTINGS = {
+    'enable_audio_recognition', 'enable_video_recognition', 'enable_inline_mode',
+    'enable_language_selection', 'enable_track_info', 'enable_artist_info', 'enable_charts',
+}
+
+
+def restart_required(before: Mapping[str, Any], after: Mapping[str, Any]) -> List[str]:
+    """Changed config.py settings that only take effect after a restart"""
+    reloadable = {name.upper() for name in Settings.names()}
+    return sorted(
+        name for name in before.keys() | after.keys()
+        if name not in reloadable and before.get(name) != after.get(name)
+    )
@@ -0,0 +1,213 @@
+"""
+Multi-slice recognition: retry a missed clip on its most promising slices concurrently
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from fingerprint import pcm_to_samples
+
+logger = logging.getLogger(__name__)
+
+# Default order until production stats say otherwise
+STRATEGIES = ('loudest', 'onsets', 'head', 'tail')
+
+
+class Slice:
+    """A window of a decoded clip picked by one strategy"""
+
+    __slots__ = ('strategy', 'start', 'end')
+
+    def __init__(self, strategy: str, start: int, end: int):
+        self.strategy = strategy
+        self.start = start
+        self.end = end
+
+    def pcm(self, pcm: bytes) -> bytes:
+        """Cut this slice out of 16-bit PCM"""
+        return pcm[self.start * 2:self.end * 2]
+
+    def __repr__(self) -> str:
+        return f"Slice({self.strategy}, {self.start}:{self.end})"
+
+
+class StrategyStats:
+    """Success rate and latency per strategy, optionally persisted as JSON"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._stats = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load slice strategy stats: {e}")
+
+    def _entry(self, strategy: str) -> Dict[str, float]:
+        return self._stats.setdefault(
+            strategy, {'attempts': 0, 'matches': 0, 'cancelled': 0, 'latency': 0.0}
+        )
+
+    def record(self, strategy: str, matched: bool, latency: float):
+        with self._lock:
+            entry = self._entry(strategy)
+            entry['attempts'] += 1
+            entry['matches'] += int(matched)
+            entry['latency'] += latency
+
+    def record_cancelled(self, strategy: str):
+        with self._lock:
+            self._entry(strategy)['cancelled'] += 1
+
+    def success_rate(self, strategy: str) -> float:
+        """Laplace-smoothed match rate, so untried strategies still get a turn"""
+        entry = self._stats.get(strategy, {})
+        return (entry.get('matches', 0) + 1) / (entry.get('attempts', 0) + 2)
+
+    def mean_latency(self, strategy: str) -> float:
+        entry = self._stats.get(strategy, {})
+        attempts = entry.get('attempts', 0)
+        return entry.get('latency', 0.0) / attempts if attempts else 0.0
+
+    def rank(self, strategies) -> List[str]:
+        """Strategies ordered by success rate, keeping the given order on ties"""
+        with self._lock:
+            return sorted(strategies, key=self.success_rate, reverse=True)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: dict(entry, success_rate=self.success_rate(name),
+                           mean_latency=self.mean_latency(name))
+                for name, entry in self._stats.items()
+            }
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self._stats, indent=2)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class SlicePlanner:
+    """Picks candidate slices of a clip by loudness and onset density"""
+
+    def __init__(self, sample_rate: int = 16000, slice_seconds: float = 8.0, frame_size: int = 512):
+        self.sample_rate = sample_rate
+        self.slice_seconds = slice_seconds
+        self.frame_size = frame_size
+        self.window = np.hanning(frame_size).astype(np.float32)
+
+    def plan(self, pcm: bytes, strategies) -> List[Slice]:
+        """One slice per strategy, in the given order, skipping near-identical windows"""
+        samples = pcm_to_samples(pcm[:len(pcm) - len(pcm) % 2])
+        count = len(samples) // self.frame_size
+        width = int(self.slice_seconds * self.sample_rate / self.frame_size)
+        if count <= width:
+            # The clip is no longer than one slice; there is nothing else to try
+            return []
+
+        frames = samples[:count * self.frame_size].reshape(count, self.frame_size)
+        loudness = np.sqrt(np.mean(frames ** 2, axis=1))
+
+        # Onsets: frames whose positive spectral flux stands out
+        spectrum = np.abs(np.fft.rfft(frames * self.window, axis=1))
+        flux = np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)
+        onsets = np.concatenate([[0.0], (flux > flux.mean() + flux.std()).astype(np.float64)])
+
+        # Sum of each score over every slice-wide window, via cumulative sums
+        def window_sums(values: np.ndarray) -> np.ndarray:
+            cumulative = np.concatenate([[0.0], np.cumsum(values)])
+            return cumulative[width:] - cumulative[:-width]
+
+        starts = {
+            'head': 0,
+            'tail': count - width,
+            'loudest': int(np.argmax(window_sums(loudness))),
+            'onsets': int(np.argmax(window_sums(onsets))),
+        }
+
+        slices: List[Slice] = []
+        for strategy in strategies:
+            if strategy not in starts:
+                continue
+            start = starts[strategy]
+            if any(abs(start - chosen.start // self.frame_size) < width // 2 for chosen in slices):
+                continue
+            slices.append(Slice(strategy, start * self.frame_size, (start + width) * self.frame_size))
+        return slices
+
+
+class SliceRecognizer:
+    """Runs slice recognitions concurrently and stops at the first match
+
+    At most ``concurrency`` slices are in flight and at most ``max_attempts``
+    are tried per clip; everything left is cancelled once a slice matches
+    or ``timeout`` seconds have passed.
+    """
+
+    def __init__(self, recognize: Callable[[bytes], Awaitable[Optional[Dict]]],
+                 stats: StrategyStats, concurrency: int = 2, max_attempts: int = 3,
+                 timeout: float = 30):
+        self.recognize = recognize
+        self.stats = stats
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+    async def _attempt(self, pcm: bytes, candidate: Slice) -> Optional[Dict]:
+        start = time.monotonic()
+        result = await self.recognize(candidate.pcm(pcm))
+        matched = bool(result and result.get('track'))
+        self.stats.record(candidate.strategy, matched, time.monotonic() - start)
+        return result if matched else None
+
+    async def first_match(self, pcm: bytes,
+                          slices: List[Slice]) -> Tuple[Optional[Dict], Optional[Slice]]:
+        """Recognize slices of ``pcm``; return the first match and the slice that produced it"""
+        queue = list(slices[:self.max_attempts])
+        running: Dict[asyncio.Task, Slice] = {}
+        deadline = time.monotonic() + self.timeout
+
+        try:
+            while queue or running:
+                while queue and len(running) < self.concurrency:
+                    candidate = queue.pop(0)
+                    running[asyncio.create_task(self._attempt(pcm, candidate))] = candidate
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = await asyncio.wait(
+                    running, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Take every finished task out of ``running`` (and retrieve its
+                # outcome) before returning, so only pending ones are cancelled
+                match = None
+                for task in done:
+                    candidate = running.pop(task)
+                    if task.cancelled():
+                        self.stats.record_cancelled(candidate.strategy)
+                    elif task.exception() is not None:
+                        logger.warning(f"Slice recognition failed for {candidate}: {task.exception()}")
+                    elif task.result() and match is None:
+                        match = task.result(), candidate
+                if match is not None:
+                    return match
+            return None, None
+        finally:
+            for task, candidate in running.items():
+                task.cancel()
+                self.stats.record_cancelled(candidate.strategy)
@@ -0,0 +1,267 @@
+"""
+Record and replay of Shazam API calls for deterministic offline testing
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from adaptive_limit import AdaptiveLimiter
+from priority import current_lane
+
+logger = logging.getLogger(__name__)
+
+# Shazam client methods that are recorded and replayed
+METHODS = ('recognize', 'search_track', 'search_artist', 'artist_about', 'top_world_tracks')
+
+# Concurrency class of each method; every class gets its own adaptive limit
+CALL_CLASSES = {
+    'recognize': 'recognize',
+    'search_track': 'search',
+    'search_artist': 'artist',
+    'artist_about': 'artist',
+    'top_world_tracks': 'charts',
+}
+
+
+class ReplayError(Exception):
+    """Raised on replay of a call that failed while recording, or was never recorded"""
+
+
+def is_transport_error(error: BaseException) -> bool:
+    """Whether a failed call says the upstream is unreachable, slow or overloaded
+
+    Timeouts, connection errors and HTTP 429/5xx answers do; errors such as
+    bad input or an unexpected payload don't. shazamio doesn't raise on HTTP
+    errors but fails to decode the error page, so the cause chain is followed
+    to the response error.
+    """
+    # Loaded by whatever made the call; not worth importing at startup
+    import aiohttp
+
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status == 429 or error.status >= 500
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def call_key(method: str, args, kwargs) -> str:
+    """Stable key of a call; binary payloads (recognized audio) are hashed"""
+    def encode(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return 'blake2b:' + hashlib.blake2b(value, digest_size=16).hexdigest()
+        return str(value)
+
+    return json.dumps([method, list(args), kwargs], sort_keys=True, default=encode)
+
+
+class FixtureStore:
+    """Recorded calls in a gzip-compressed JSON-lines file
+
+    Each record holds the call key, the latency and either the response or
+    the error. New records are buffered and appended as an extra gzip member
+    on ``flush``, so a store can grow over several recording sessions.
+    ``write`` may run on executor threads; appends to the file never overlap.
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self._pending: List[Dict[str, Any]] = []
+        self._write_lock = threading.Lock()
+
+    def load(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Buffer a record; True once enough are buffered to be written"""
+        self._pending.append(record)
+        return len(self._pending) >= self.flush_every
+
+    def take(self) -> List[Dict[str, Any]]:
+        """The buffered records, which the caller is now responsible for writing"""
+        records, self._pending = self._pending, []
+        return records
+
+    def write(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        with self._write_lock, gzip.open(self.path, 'at', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self.write(self.take())
+
+
+class RecordingShazam:
+    """Pass-through to a Shazam client that records every call and its latency
+
+    Full batches of records are written in the default executor, so the
+    gzip append never runs on the event loop.
+    """
+
+    def __init__(self, client, store: FixtureStore):
+        self.client = client
+        self.store = store
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if name not in METHODS:
+            return attr
+
+        async def recorded(*args, **kwargs):
+            record = {'method': name, 'key': call_key(name, args, kwargs)}
+            started = time.perf_counter()
+            try:
+                response = await attr(*args, **kwargs)
+            except Exception as e:
+                record['error'] = f"{type(e).__name__}: {e}"
+                raise
+            else:
+                record['response'] = response
+                return response
+            finally:
+                record['latency'] = time.perf_counter() - started
+                if self.store.append(record):
+                    self._write_in_background()
+
+        return recorded
+
+    def _write_in_background(self):
+        records = self.store.take()
+        future = asyncio.get_running_loop().run_in_executor(None, self.store.write, records)
+
+        def written(future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.warning(f"Could not write {len(records)} recorded Shazam calls "
+                               f"to {self.store.path}: {future.exception()}")
+
+        future.add_done_callback(written)
+
+    def close(self):
+        self.store.flush()
+
+
+class ReplayShazam:
+    """Serves recorded Shazam responses with their recorded latency
+
+    A call is answered by the recording with the same key (round-robin when
+    it was recorded several times). Unknown calls raise ReplayError in
+    ``strict`` mode; otherwise they get the recordings of the same method in
+    turn, so synthetic audio or new queries still see realistic payloads.
+    Latencies are multiplied by ``latency_scale`` (0 replays instantly).
+    """
+
+    def __init__(self, store: FixtureStore, latency_scale: float = 1.0, strict: bool = False):
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self._by_key: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._by_method: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._turns: Dict[str, int] = defaultdict(int)
+
+        for record in store.load():
+            self._by_key[record['key']].append(record)
+            self._by_method[record['method']].append(record)
+        logger.info(f"Loaded {sum(map(len, self._by_key.values()))} recorded Shazam calls from {store.path}")
+
+    def _next(self, pool_key: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        turn = self._turns[pool_key]
+        self._turns[pool_key] = turn + 1
+        return records[turn % len(records)]
+
+    def __getattr__(self, name: str):
+        if name not in METHODS:
+            raise AttributeError(name)
+
+        async def replay(*args, **kwargs):
+            key = call_key(name, args, kwargs)
+            if key in self._by_key:
+                record = self._next(key, self._by_key[key])
+            elif not self.strict and self._by_method[name]:
+                record = self._next(name, self._by_method[name])
+            else:
+                raise ReplayError(f"no recording of {key}")
+
+            if self.latency_scale:
+                await asyncio.sleep(record['latency'] * self.latency_scale)
+            if 'error' in record:
+                raise ReplayError(record['error'])
+            return record['response']
+
+        return replay
+
+    def close(self):
+        pass
+
+
+class LimitedShazam:
+    """Runs each Shazam call under the adaptive limiter of its class
+
+    The call waits in the priority lane of the work that made it (see
+    priority.lane), so inline queries overtake queued bulk recognitions.
+    Only transport failures back the limit off; other errors say nothing
+    about the upstream's capacity and are released without a sample.
+    """
+
+    def __init__(self, client, limiters: Dict[str, AdaptiveLimiter]):
+        self.client = client
+        self.limiters = limiters
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        limiter = self.limiters.get(CALL_CLASSES.get(name))
+        if limiter is None:
+            return attr
+
+        async def limited(*args, **kwargs):
+            lane = current_lane()
+            await limiter.acquire(lane)
+            started = time.perf_counter()
+            try:
+                result = await attr(*args, **kwargs)
+            except asyncio.CancelledError:
+                # The caller gave up; says nothing about the upstream
+                limiter.release(lane, None)
+                raise
+            except Exception as e:
+                if is_transport_error(e):
+                    limiter.release(lane, time.perf_counter() - started, failed=True)
+                else:
+                    limiter.release(lane, None)
+                raise
+            limiter.release(lane, time.perf_counter() - started)
+            return result
+
+        return limited
+
+    def close(self):
+        close = getattr(self.client, 'close', None)
+        if close is not None:
+            close()
+
+
+def wrap_client(client_factory, record_file: Optional[str] = None, replay_file: Optional[str] = None,
+                latency_scale: float = 1.0):
+    """The Shazam client to use: replayed, recording, or the real one"""
+    if replay_file:
+        return ReplayShazam(FixtureStore(replay_file), latency_scale=latency_scale)
+    if record_file:
+        logger.info(f"Recording Shazam calls to {record_file}")
+        return RecordingShazam(client_factory(), FixtureStore(record_file))
+    return client_factory()